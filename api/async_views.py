@@ -0,0 +1,184 @@
+"""
+Async views for the read hot path, mounted when ``ASYNC_READ_VIEWS`` is on
+and the project is served by backend/asgi.py.
+
+GET and HEAD requests to the home feed, post detail, a post's comments and
+user detail are answered here through the async ORM; every other method is
+handed to the DRF viewset as before. Responses match the viewsets': same
+serializers (or, for the feed and comment lists, the row serializers of
+api/fastserializers.py), cursor pagination, comment previews, sparse
+fieldsets and normalized pages (api/fieldsets.py), representation cache and
+conditional GET (api/conditional.py), always rendered as JSON.
+
+Django's async ORM still runs each query on a thread, one per in-flight
+request, so the gain is that a request waiting on the database no longer
+occupies one of a fixed pool of workers. Token authentication, which only
+queries when its per-process caches expire, runs there too, followed by the
+throttles (api/throttling.py). Serializers run
+on the event loop, reading the representation cache synchronously: fine for
+the default in-memory cache, a stall for a network one.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import comments, conditional, fastjson, fastserializers, fieldsets
+from .authentication import StatelessJWTAuthentication
+from .models import Comment, Post, User
+from .pagination import CommentPagination, FeedPagination
+from .serializers import CommentSerializer, PostSerializer, UserSerializer
+from .views import CommentViewSet, PostViewSet, UserViewSet
+
+DETAIL_ACTIONS = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+
+
+def _authenticate(request):
+    result = StatelessJWTAuthentication().authenticate(request)
+    if result is None:
+        raise exceptions.NotAuthenticated()
+    return result[0]
+
+
+def _admit(request, view):
+    """Authenticate and throttle `request`, as APIView.initial() does."""
+    request.user = _authenticate(request)
+    waits = [
+        throttle.wait() for throttle in (cls() for cls in api_settings.DEFAULT_THROTTLE_CLASSES)
+        if not throttle.allow_request(request, view)
+    ]
+    if waits:
+        raise exceptions.Throttled(max((wait for wait in waits if wait is not None), default=None))
+
+
+def _render(data, status=200, headers=None):
+    return HttpResponse(
+        fastjson.dumps(data), status=status, content_type='application/json', headers=headers
+    )
+
+
+def read_view(viewset, actions, throttle_scope='read', **initkwargs):
+    """Serve GET and HEAD with the decorated coroutine and the other `actions` with `viewset`.
+
+    The coroutine returns the response; API errors it raises are rendered here.
+    GETs are throttled in `throttle_scope`, like the viewset's.
+    """
+    fallback = sync_to_async(viewset.as_view(actions, **initkwargs))
+
+    def decorator(read):
+        @csrf_exempt
+        @wraps(read)
+        async def view(request, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await fallback(request, **kwargs)
+            request = Request(request)
+            try:
+                await sync_to_async(_admit)(request, view)
+                return await read(request, **kwargs)
+            except exceptions.APIException as exc:
+                headers = None
+                if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    headers = {'WWW-Authenticate': StatelessJWTAuthentication().authenticate_header(request)}
+                elif isinstance(exc, exceptions.Throttled) and exc.wait is not None:
+                    headers = {'Retry-After': '%d' % exc.wait}
+                return _render({'detail': exc.detail}, exc.status_code, headers)
+
+        # Labels the metrics like the viewset's own action.
+        view.actions = {'get': actions['get']}
+        view.throttle_scope = throttle_scope
+        return view
+    return decorator
+
+
+async def _aget(queryset, pk):
+    try:
+        return await queryset.aget(pk=pk)
+    except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+        raise exceptions.NotFound(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def _previews(request, post_ids, rows=False):
+    size = comments.preview_size(request)
+    if not size:
+        return None
+    return await comments.apreviews(post_ids, size, rows)
+
+
+def _serialize_posts(posts, previews, fields=None):
+    data = PostSerializer(posts, many=True, fields=fields).data
+    if previews is None:
+        return data
+    return comments.with_previews(posts, data, previews)
+
+
+@read_view(PostViewSet, {'get': 'list', 'post': 'create'}, throttle_scope='feed', basename='post', detail=False)
+async def feed(request):
+    fields = fieldsets.requested_fields(request)
+    normalized = fieldsets.is_normalized(request)
+    rows = settings.FAST_READ_SERIALIZERS
+    paginator = FeedPagination()
+    queryset = Post.objects.select_related('user')
+    if rows:
+        queryset = fastserializers.post_rows(queryset, fields, paginator.ordering)
+    else:
+        queryset = fieldsets.narrow(queryset, fields, paginator.ordering)
+    page = await paginator.apaginate_queryset(queryset, request)
+    previews = await _previews(request, [post['id'] if rows else post.pk for post in page], rows)
+    etag = conditional.make_etag(
+        paginator.next_position,
+        conditional.post_validators(page, previews, authors=fieldsets.with_authors(fields)),
+    )
+
+    def render():
+        if rows:
+            results = fastserializers.render_posts(page, fields)
+            if previews is not None:
+                results = comments.with_preview_rows(results, previews)
+        else:
+            results = _serialize_posts(page, previews, fields)
+        data = {'next': paginator.get_next_link(), 'results': results}
+        if normalized:
+            data['results'], data['users'] = fieldsets.normalize(data['results'])
+        return _render(data)
+    return conditional.respond(request, etag, render)
+
+
+@read_view(PostViewSet, DETAIL_ACTIONS, basename='post', detail=True)
+async def post_detail(request, pk):
+    fields = fieldsets.requested_fields(request)
+    post = await _aget(fieldsets.narrow(Post.objects.select_related('user'), fields), pk)
+    previews = await _previews(request, [post.pk])
+    etag = conditional.make_etag(
+        conditional.post_validators([post], previews, authors=fieldsets.with_authors(fields))
+    )
+    return conditional.respond(request, etag, lambda: _render(_serialize_posts([post], previews, fields)[0]))
+
+
+@read_view(CommentViewSet, {'get': 'list', 'post': 'create'}, basename='comment', detail=False)
+async def comment_list(request, post_pk):
+    rows = settings.FAST_READ_SERIALIZERS
+    paginator = CommentPagination()
+    queryset = comments.thread_queryset(Comment.objects.filter(post_id=post_pk))
+    page = await paginator.apaginate_queryset(fastserializers.comment_rows(queryset) if rows else queryset, request)
+    etag = conditional.make_etag(paginator.next_position, conditional.comment_validators(page))
+
+    def render():
+        results = fastserializers.render_comments(page) if rows else CommentSerializer(page, many=True).data
+        return _render({'next': paginator.get_next_link(), 'results': results})
+    return conditional.respond(request, etag, render)
+
+
+@read_view(UserViewSet, DETAIL_ACTIONS, basename='user', detail=True)
+async def user_detail(request, pk):
+    user = await _aget(User.objects.all(), pk)
+    return conditional.respond(
+        request, conditional.make_etag(conditional.user_validators(user)),
+        lambda: _render(UserSerializer(user).data),
+        last_modified=user.updated_at, cache_control=conditional.PROFILE,
+    )
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .revocation import is_token_revoked
+
+
+class UserStateCache:
+    """
+    Per-process cache of whether a user id may still authenticate.
+
+    Entries live for ``JWT_USER_STATE_TTL`` seconds, so a deactivated or
+    deleted account is rejected by every worker within that window; the
+    worker that saves the change forgets its entry immediately.
+    """
+    max_entries = 100000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def is_active(self, user_id):
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        active = bool(
+            User.objects.filter(pk=user_id).values_list('is_active', flat=True).first()
+        )
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[user_id] = (active, now + settings.JWT_USER_STATE_TTL)
+        return active
+
+    def forget(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_state = UserStateCache()
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds ``request.user`` from the token claims.
+
+    The user is a real ``User`` instance with only its id loaded; the other
+    fields are fetched in one query the first time any of them is read, so
+    endpoints that only need ``request.user.id`` never query the users table.
+    Revoked tokens are rejected (see api/revocation.py).
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_token_revoked(validated_token):
+            raise InvalidToken(_('Token has been revoked'))
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        try:
+            user_id = User._meta.get_field(api_settings.USER_ID_FIELD).to_python(user_id)
+        except ValidationError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        if not user_state.is_active(user_id):
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        user = User.from_db(None, [api_settings.USER_ID_FIELD, 'is_active'], [user_id, True])
+        user._load_all_deferred = True
+        return user
@@ -0,0 +1,73 @@
+"""
+Cache backends that keep token buckets for api/throttling.py.
+
+A bucket holds up to `capacity` tokens and refills continuously at
+`per_second`; each request takes one. ``take_token()`` refills, takes and
+writes the bucket back in one call, under the backend's own lock: the
+in-process lock for locmem, an exclusive lock on the entry's file for the
+file cache, so worker processes sharing a cache directory share budgets
+too. Throttling therefore costs one cache operation per request, and two
+requests can never both spend the same token.
+
+An entry expires once its bucket would be full again, since a missing
+bucket is a full one.
+"""
+import math
+import os
+import pickle
+import time
+import zlib
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files import locks
+
+
+def refill(bucket, capacity, per_second, now):
+    """Take a token from `bucket` at `now`: (taken, new bucket, seconds to wait, timeout)."""
+    tokens, stamp = bucket if bucket is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(now - stamp, 0) * per_second)
+    if tokens >= 1:
+        tokens -= 1
+        wait = 0
+    else:
+        wait = (1 - tokens) / per_second
+    timeout = max(math.ceil((capacity - tokens) / per_second), 1)
+    return wait == 0, (tokens, now), wait, timeout
+
+
+class TokenBucketLocMemCache(LocMemCache):
+    def take_token(self, key, capacity, per_second, now, version=None):
+        """Take a token from the bucket at `key`; return (taken, seconds to wait)."""
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            bucket = None if self._has_expired(key) else pickle.loads(self._cache[key])
+            taken, bucket, wait, timeout = refill(bucket, capacity, per_second, now)
+            self._set(key, pickle.dumps(bucket, self.pickle_protocol), timeout)
+        return taken, wait
+
+
+class TokenBucketFileBasedCache(FileBasedCache):
+    def take_token(self, key, capacity, per_second, now, version=None):
+        """Take a token from the bucket at `key`; return (taken, seconds to wait)."""
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        with open(os.open(fname, os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as f:
+            locks.lock(f, locks.LOCK_EX)
+            try:
+                try:
+                    expiry = pickle.load(f)
+                except EOFError:
+                    # Just created: make room for it like set() does.
+                    bucket = None
+                    self._cull()
+                else:
+                    expired = expiry is not None and expiry < time.time()
+                    bucket = None if expired else pickle.loads(zlib.decompress(f.read()))
+                taken, bucket, wait, timeout = refill(bucket, capacity, per_second, now)
+                f.seek(0)
+                self._write_content(f, timeout, bucket)
+                f.truncate()
+            finally:
+                locks.unlock(f)
+        return taken, wait
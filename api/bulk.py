@@ -0,0 +1,119 @@
+"""
+Batch follow/unfollow and like/unlike.
+
+Each function applies one action to a list of target ids in a fixed number of
+queries, whatever the list length, and returns ``{target_id: outcome}``.
+Counters move with one UPDATE per direction. A concurrent duplicate of the
+same batch can still double count a follow or like that was inserted between
+the existence check and the insert; ``manage.py reconcile_counters`` repairs
+that.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import realtime, suggestions, timeline, trending
+from .counters import increment
+from .models import Follow, Like, Post, User
+
+
+def _existing(model, ids):
+    return set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+
+def follow_many(user, user_ids):
+    outcomes = {}
+    with transaction.atomic():
+        found = _existing(User, user_ids)
+        already = set(
+            Follow.objects.filter(follower=user, following_id__in=found)
+            .values_list('following_id', flat=True)
+        )
+        created = []
+        for user_id in user_ids:
+            if user_id == user.pk:
+                outcomes[user_id] = 'self'
+            elif user_id not in found:
+                outcomes[user_id] = 'not_found'
+            elif user_id in already:
+                outcomes[user_id] = 'already_following'
+            else:
+                outcomes[user_id] = 'followed'
+                created.append(user_id)
+        if created:
+            Follow.objects.bulk_create(
+                [Follow(follower=user, following_id=user_id) for user_id in created],
+                ignore_conflicts=True,
+            )
+            increment(User.objects.filter(pk__in=created), 'followers_count')
+            timeline.backfill_timelines.delay(owner_id=user.pk, author_ids=created)
+            suggestions.update_suggestions.delay(follower_id=user.pk, followed_ids=created)
+            realtime.following_changed(user.pk, followed=created)
+    return outcomes
+
+
+def unfollow_many(user, user_ids):
+    with transaction.atomic():
+        following = set(
+            Follow.objects.filter(follower=user, following_id__in=user_ids)
+            .values_list('following_id', flat=True)
+        )
+        if following:
+            Follow.objects.filter(follower=user, following_id__in=following).delete()
+            increment(User.objects.filter(pk__in=following), 'followers_count', -1)
+            suggestions.update_suggestions.delay(follower_id=user.pk, unfollowed_ids=sorted(following))
+            realtime.following_changed(user.pk, unfollowed=sorted(following))
+    backend = timeline.get_timeline_backend()
+    for user_id in following:
+        backend.remove_author(user.pk, user_id)
+    return {
+        user_id: 'unfollowed' if user_id in following else 'not_following'
+        for user_id in user_ids
+    }
+
+
+def like_many(user, post_ids):
+    outcomes = {}
+    with transaction.atomic():
+        authors = dict(Post.objects.filter(pk__in=post_ids).values_list('pk', 'user_id'))
+        already = set(
+            Like.objects.filter(user=user, post_id__in=authors).values_list('post_id', flat=True)
+        )
+        created = []
+        for post_id in post_ids:
+            if post_id not in authors:
+                outcomes[post_id] = 'not_found'
+            elif post_id in already:
+                outcomes[post_id] = 'already_liked'
+            else:
+                outcomes[post_id] = 'liked'
+                created.append(post_id)
+        if created:
+            now = timezone.now()
+            Like.objects.bulk_create(
+                [Like(user=user, post_id=post_id, created_at=now) for post_id in created],
+                ignore_conflicts=True,
+            )
+            increment(
+                Post.objects.filter(pk__in=created), 'likes_count',
+                **trending.record('like', now)
+            )
+            for post_id in created:
+                realtime.post_liked(authors[post_id], post_id, user.pk)
+    return outcomes
+
+
+def unlike_many(user, post_ids):
+    with transaction.atomic():
+        liked = dict(
+            Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', 'created_at')
+        )
+        if liked:
+            Like.objects.filter(user=user, post_id__in=liked).delete()
+            increment(
+                Post.objects.filter(pk__in=liked), 'likes_count', -1,
+                **trending.record_many('like', liked, removed=True)
+            )
+    return {
+        post_id: 'unliked' if post_id in liked else 'not_liked'
+        for post_id in post_ids
+    }
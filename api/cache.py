@@ -0,0 +1,122 @@
+"""
+Read-through cache of serialized representations.
+
+Rendered dicts are stored per object under ``repr:<model>:<pk>:<version>`` in
+the cache named by ``REPRESENTATION_CACHE_ALIAS``, where the version hashes
+the fields listed in the serializer's ``Meta.cache_version``: those that
+change whenever the representation does (``updated_at``, and the counters,
+which are updated without touching it). The cache's own ``VERSION`` is bumped
+whenever a serializer's output format changes. Nested serializers listed in a
+serializer's ``Meta.cached_relations`` are cached under their own key and
+spliced back in, so editing a profile only changes that profile's key rather
+than every post its author wrote.
+
+Nothing is invalidated: a changed row is looked up under a new key, and the
+old entry ages out. A reader that loaded a row before a write committed can
+only fill the key of that older version, which nobody asks for again.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+from rest_framework import serializers
+
+from .metrics import MeasuredSerializerMixin
+
+
+def get_cache():
+    return caches[settings.REPRESENTATION_CACHE_ALIAS]
+
+
+def cache_key(serializer, obj):
+    """The key of `obj` as rendered by `serializer`, for the version of the row that was loaded."""
+    meta = serializer.Meta
+    version = tuple(getattr(obj, name) for name in meta.cache_version)
+    digest = hashlib.blake2b(repr(version).encode(), digest_size=8).hexdigest()
+    return f'repr:{meta.model._meta.label_lower}:{obj.pk}:{digest}'
+
+
+def render_many(serializer, instances):
+    """Render `instances` with `serializer`, using one cache read for the whole batch."""
+    model = serializer.Meta.model
+    relations = {}
+    for name in getattr(serializer.Meta, 'cached_relations', ()):
+        field = serializer.fields[name]
+        relations[name] = (field, model._meta.get_field(field.source).attname)
+
+    def related_key(obj, field, attname):
+        if getattr(obj, attname) is None:
+            return None
+        return cache_key(field, getattr(obj, field.source))
+
+    wanted = []
+    for obj in instances:
+        wanted.append(cache_key(serializer, obj))
+        for field, attname in relations.values():
+            wanted.append(related_key(obj, field, attname))
+    cache = get_cache()
+    found = cache.get_many([key for key in set(wanted) if key is not None])
+
+    missing = {}
+    results = []
+    for obj in instances:
+        key = cache_key(serializer, obj)
+        data = found.get(key)
+        if data is None:
+            data = serializer.render(obj)
+            for name, (field, attname) in relations.items():
+                rkey = related_key(obj, field, attname)
+                if rkey is not None and rkey not in found:
+                    found[rkey] = missing[rkey] = data[name]
+                # Keep the slot so field order survives the round trip.
+                data[name] = None
+            found[key] = missing[key] = data
+
+        data = dict(data)
+        for name, (field, attname) in relations.items():
+            rkey = related_key(obj, field, attname)
+            if rkey is None:
+                continue
+            nested = found.get(rkey)
+            if nested is None:
+                nested = field.to_representation(getattr(obj, field.source))
+                found[rkey] = missing[rkey] = nested
+            data[name] = nested
+        results.append(data)
+
+    if missing:
+        cache.set_many(missing)
+    return results
+
+
+def _sparse(serializer):
+    # The cache holds whole representations; a few fields are cheap to render.
+    return getattr(serializer, 'sparse_fields', None) is not None
+
+
+class CachedListSerializer(MeasuredSerializerMixin, serializers.ListSerializer):
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        if _sparse(self.child):
+            return [self.child.render(item) for item in iterable]
+        return render_many(self.child, list(iterable))
+
+
+class CachedRepresentationMixin:
+    """
+    Serve a ModelSerializer's output from the representation cache.
+
+    Pair with ``Meta.list_serializer_class = CachedListSerializer`` so list
+    responses are fetched with a single ``get_many``.
+    """
+
+    def render(self, instance):
+        return super().to_representation(instance)
+
+    def to_representation(self, instance):
+        # When nested in another serializer, the parent caches us as one of
+        # its `cached_relations` (or not at all).
+        if isinstance(self.parent, serializers.Serializer) or _sparse(self):
+            return self.render(instance)
+        return render_many(self, [instance])[0]
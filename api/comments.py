@@ -0,0 +1,83 @@
+"""
+Comment threads and the comment previews embedded in posts.
+
+Threads read oldest first, ordered by ``(created_at, id)``, and are served by
+the ``comment_post_created_id_idx`` index on ``(post, created_at, id)``. The
+preview of a post is the start of its thread: ``previews()`` fetches it for a
+whole page of posts in one query, numbering each post's comments with
+ROW_NUMBER() and keeping the first few, as model instances or, for the list
+actions, as values() rows (see api/fastserializers.py).
+"""
+from operator import attrgetter, itemgetter
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from . import fastserializers
+from .models import Comment
+from .serializers import CommentSerializer
+
+# What CommentSerializer and the validators in api/conditional.py read; the
+# author's password, flags and other dates are left out of the join.
+FIELDS = (
+    'content', 'created_at', 'updated_at', 'post', 'user',
+    'user__username', 'user__email', 'user__bio', 'user__updated_at',
+)
+ORDERING = ('created_at', 'id')
+PREVIEW_MAX = 10
+
+
+def thread_queryset(queryset=None):
+    if queryset is None:
+        queryset = Comment.objects.all()
+    return queryset.select_related('user').only(*FIELDS)
+
+
+def preview_size(request):
+    """The N of ``?preview_comments=N``, capped at PREVIEW_MAX; 0 when absent."""
+    try:
+        size = int(request.GET['preview_comments'])
+    except (KeyError, ValueError):
+        return 0
+    return max(0, min(size, PREVIEW_MAX))
+
+
+def _preview_queryset(post_ids, size, rows=False):
+    queryset = thread_queryset(Comment.objects.filter(post_id__in=post_ids)).annotate(
+        rank=Window(RowNumber(), partition_by=F('post_id'), order_by=[F(name).asc() for name in ORDERING]),
+    ).filter(rank__lte=size).order_by('post_id', *ORDERING)
+    return fastserializers.comment_rows(queryset) if rows else queryset
+
+
+def _group(comments, rows):
+    post_id = itemgetter('post_id') if rows else attrgetter('post_id')
+    grouped = {}
+    for comment in comments:
+        grouped.setdefault(post_id(comment), []).append(comment)
+    return grouped
+
+
+def previews(post_ids, size, rows=False):
+    """The first `size` comments of each post, as ``{post_id: [comment, ...]}``."""
+    return _group(_preview_queryset(post_ids, size, rows), rows)
+
+
+async def apreviews(post_ids, size, rows=False):
+    return _group([comment async for comment in _preview_queryset(post_ids, size, rows)], rows)
+
+
+def with_previews(posts, data, grouped):
+    """Serialized `posts` with their previews added as ``top_comments``."""
+    # Posts are cached without their comments, which change far more often.
+    return [
+        {**item, 'top_comments': CommentSerializer(grouped.get(post.pk, []), many=True).data}
+        for post, item in zip(posts, data)
+    ]
+
+
+def with_preview_rows(data, grouped):
+    """with_previews() for posts and previews rendered from rows."""
+    return [
+        {**item, 'top_comments': fastserializers.render_comments(grouped.get(item['id'], []))}
+        for item in data
+    ]
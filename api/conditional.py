@@ -0,0 +1,89 @@
+"""
+Conditional GET for posts, comments and profiles.
+
+Read responses carry an ETag, and a 304 answers a matching ``If-None-Match``
+before anything is serialized. The ETag hashes the validators of the rows the
+body is built from, which the view has loaded by then (the page, the object,
+and with ``?preview_comments`` the previews), so the check costs no query of
+its own:
+
+* a post: its ``updated_at``, which moves on edits, and its two counters,
+  which do not touch it, plus its author's ``updated_at``;
+* a comment: its ``updated_at`` and its author's;
+* a profile: the user's ``updated_at``;
+* a page: the validators of its rows in order, and where the next one starts,
+  so rows that come, go or change all give the page a new tag.
+
+Profiles and single comments also send ``Last-Modified`` and honour
+``If-Modified-Since`` (to the second, as HTTP dates go). Posts do not: a like
+changes the body without changing ``updated_at``. Nor do pages, whose newest
+row says nothing about one that was deleted.
+
+Every response is per user, so the Cache-Control policies are ``private``.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+# Reused only once the server confirms it is current.
+REVALIDATE = 'private, no-cache'
+# Profiles rarely change: reused for a minute, then revalidated.
+PROFILE = 'private, max-age=60'
+
+
+# Read from model instances or from values() rows (see api/fastserializers.py).
+POST_VALIDATORS = ('id', 'updated_at', 'likes_count', 'comments_count')
+AUTHOR_VALIDATOR = 'user__updated_at'
+COMMENT_VALIDATORS = ('id', 'updated_at', AUTHOR_VALIDATOR)
+
+
+def _value(obj, path):
+    if isinstance(obj, dict):
+        return obj[path]
+    for name in path.split('__'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def user_validators(user):
+    return (user.pk, user.updated_at)
+
+
+def comment_validators(comments):
+    return [tuple(_value(comment, name) for name in COMMENT_VALIDATORS) for comment in comments]
+
+
+def post_validators(posts, previews=None, authors=True):
+    """Validators of `posts`, with their previews (``{post_id: [comment, ...]}``) when embedded.
+
+    `authors` is False when the response leaves them out (see api/fieldsets.py).
+    """
+    return [
+        (
+            *(_value(post, name) for name in POST_VALIDATORS),
+            _value(post, AUTHOR_VALIDATOR) if authors else None,
+            None if previews is None else comment_validators(previews.get(_value(post, 'id'), [])),
+        )
+        for post in posts
+    ]
+
+
+def make_etag(*validators):
+    # Weak: the tag follows the data, not the bytes of one rendering of it.
+    return 'W/"%s"' % hashlib.blake2b(repr(validators).encode(), digest_size=16).hexdigest()
+
+
+def respond(request, etag, render, last_modified=None, cache_control=REVALIDATE):
+    """A 304 if the request's validators match, otherwise ``render()``; either with the headers."""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=None if last_modified is None else int(last_modified.timestamp())
+    )
+    if response is None:
+        response = render()
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['Cache-Control'] = cache_control
+    patch_vary_headers(response, ['Authorization'])
+    return response
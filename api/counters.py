@@ -0,0 +1,13 @@
+from django.db.models import F
+
+
+def increment(queryset, field, amount=1, **updates):
+    """Atomically add `amount` to a counter column on every row of `queryset`.
+
+    Decrements never take a counter below zero; rows that would underflow are
+    left alone for `manage.py reconcile_counters` to repair. Extra `updates`
+    are applied in the same statement.
+    """
+    if amount < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -amount})
+    return queryset.update(**{field: F(field) + amount}, **updates)
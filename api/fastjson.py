@@ -0,0 +1,68 @@
+"""
+JSON renderer and parser on orjson, when it is installed.
+
+orjson encodes straight to UTF-8 bytes in C: the ``ReturnDict`` and
+``ReturnList`` containers serializers return are walked as they are, without
+converting them, and datetimes, dates, times and UUIDs are written natively
+(UTC as ``Z``, like DRF). Anything else orjson does not know (Decimals, lazy
+strings, querysets) goes through DRF's own encoder, so output matches
+`rest_framework.renderers.JSONRenderer` with the default settings, except
+that NaN and infinite floats become ``null`` instead of an error.
+
+Without orjson, or when the client asks for indentation (the browsable API
+does) or non-compact output is configured, both classes are DRF's.
+"""
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+    _default = JSONEncoder().default
+
+
+def dumps(data):
+    """`data` as JSON bytes, the way FastJSONRenderer writes it."""
+    if orjson is None:
+        return renderers.JSONRenderer().render(data)
+    return _escape(orjson.dumps(data, default=_default, option=OPTIONS))
+
+
+def _escape(content):
+    # Like DRF, keep U+2028 and U+2029 escaped so the output is valid JavaScript.
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(parsers.JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        # orjson rejects NaN and Infinity, as strict parsing must.
+        if orjson is None or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            content = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                content = content.decode(encoding)
+            return orjson.loads(content)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,108 @@
+"""
+Read-only serialization of list pages straight from ``values()`` rows.
+
+The list actions (home and trending feeds, comment threads and previews, the
+user list) fetch the columns their page needs with ``values()`` and build
+each object's dict with plain lookups: no model instances, no serializer
+fields bound and dispatched per object. The output is PostSerializer's,
+CommentSerializer's and UserSerializer's, key for key (api/tests.py compares
+them); detail views and writes keep the ModelSerializers.
+
+Rows bypass the representation cache, since building a dict from a row is
+cheaper than fetching and copying a cached one. ``FAST_READ_SERIALIZERS=False``
+sends lists back through the serializers and the cache.
+"""
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .conditional import AUTHOR_VALIDATOR, POST_VALIDATORS
+from .metrics import measure_serialization
+from .serializers import PostSerializer, UserSerializer
+
+_datetime_field = serializers.DateTimeField()
+
+
+def format_datetime(value):
+    """`value` as DateTimeField renders it."""
+    if value is None or not settings.USE_TZ or api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+        return _datetime_field.to_representation(value)
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+USER_COLUMNS = UserSerializer.Meta.fields
+# The nested UserSerializer of posts and comments, read through the join.
+AUTHOR_COLUMNS = ('user_id', 'user__username', 'user__email', 'user__bio')
+
+
+def _author(row):
+    return {
+        'id': row['user_id'], 'username': row['user__username'],
+        'email': row['user__email'], 'bio': row['user__bio'],
+    }
+
+
+# Each PostSerializer field: the columns it reads and how it is built from a row.
+POST_FIELDS = {
+    'id': (('id',), itemgetter('id')),
+    'user': (AUTHOR_COLUMNS, _author),
+    'content': (('content',), itemgetter('content')),
+    'created_at': (('created_at',), lambda row: format_datetime(row['created_at'])),
+    'updated_at': (('updated_at',), lambda row: format_datetime(row['updated_at'])),
+    'likes_count': (('likes_count',), itemgetter('likes_count')),
+    'comments_count': (('comments_count',), itemgetter('comments_count')),
+}
+COMMENT_COLUMNS = ('id', *AUTHOR_COLUMNS, 'post_id', 'content', 'created_at', 'updated_at', AUTHOR_VALIDATOR)
+
+
+def _post_fields(fields):
+    return [name for name in PostSerializer.Meta.fields if fields is None or name in fields]
+
+
+def post_rows(queryset, fields=None, ordering=()):
+    """`queryset` as rows of what render_posts(), the paginator's `ordering` and the validators read."""
+    names = _post_fields(fields)
+    columns = {column for name in names for column in POST_FIELDS[name][0]}
+    columns.update(POST_VALIDATORS, (name.lstrip('-') for name in ordering))
+    if 'user' in names:
+        columns.add(AUTHOR_VALIDATOR)
+    return queryset.values(*columns)
+
+
+def render_posts(rows, fields=None):
+    getters = [(name, POST_FIELDS[name][1]) for name in _post_fields(fields)]
+    with measure_serialization():
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+
+def comment_rows(queryset):
+    return queryset.values(*COMMENT_COLUMNS)
+
+
+def render_comments(rows):
+    with measure_serialization():
+        return [
+            {
+                'id': row['id'], 'user': _author(row), 'post': row['post_id'],
+                'content': row['content'], 'created_at': format_datetime(row['created_at']),
+            }
+            for row in rows
+        ]
+
+
+def user_rows(queryset):
+    return queryset.values(*USER_COLUMNS)
+
+
+def render_users(rows):
+    with measure_serialization():
+        return [
+            {'id': row['id'], 'username': row['username'], 'email': row['email'], 'bio': row['bio']}
+            for row in rows
+        ]
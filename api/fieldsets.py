@@ -0,0 +1,77 @@
+"""
+Sparse fieldsets and the normalized shape of post pages.
+
+``?fields=content,likes_count`` renders only those PostSerializer fields
+(``id`` is always included) and loads only their columns: without ``user``
+the author join is dropped, without ``content`` the text stays in the table.
+Sparse posts skip the representation cache, which holds whole posts.
+
+``?mode=normalized`` on the feeds replaces the author embedded in each post,
+and in each of its ``top_comments``, with the author's id, and lists every
+author once in a top-level ``users`` table of ``{id, username, bio}``.
+"""
+from rest_framework.exceptions import ValidationError
+
+from .conditional import POST_VALIDATORS
+from .serializers import PostSerializer
+
+MODES = ('nested', 'normalized')
+AUTHOR_FIELDS = ('id', 'username', 'bio')
+# What the nested UserSerializer reads, and its validator.
+AUTHOR_COLUMNS = ('user__username', 'user__email', 'user__bio', 'user__updated_at')
+
+
+def requested_fields(request):
+    """The fields of ``?fields=a,b``, with ``id``; None when absent."""
+    raw = request.GET.get('fields')
+    if raw is None:
+        return None
+    fields = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = fields - set(PostSerializer.Meta.fields)
+    if unknown:
+        raise ValidationError({'fields': [
+            f'Unknown field(s) {", ".join(sorted(unknown))}; choose from {", ".join(PostSerializer.Meta.fields)}.'
+        ]})
+    return frozenset(fields | {'id'})
+
+
+def is_normalized(request):
+    mode = request.GET.get('mode', MODES[0])
+    if mode not in MODES:
+        raise ValidationError({'mode': [f'Choose from {", ".join(MODES)}.']})
+    return mode == 'normalized'
+
+
+def with_authors(fields):
+    return fields is None or 'user' in fields
+
+
+def narrow(queryset, fields, ordering=()):
+    """`queryset` loading only the columns of `fields` and of the paginator's `ordering`."""
+    if fields is None:
+        return queryset
+    columns = {*fields, *POST_VALIDATORS, *(name.lstrip('-') for name in ordering)}
+    if with_authors(fields):
+        return queryset.select_related('user').only(*columns, *AUTHOR_COLUMNS)
+    return queryset.select_related(None).only(*columns)
+
+
+def normalize(posts):
+    """`posts` with authors replaced by ids, and the deduplicated authors."""
+    users = {}
+
+    def author_id(item):
+        user = item['user']
+        if user['id'] not in users:
+            users[user['id']] = {name: user[name] for name in AUTHOR_FIELDS}
+        return user['id']
+
+    results = []
+    for post in posts:
+        post = dict(post)
+        if 'user' in post:
+            post['user'] = author_id(post)
+        if 'top_comments' in post:
+            post['top_comments'] = [{**comment, 'user': author_id(comment)} for comment in post['top_comments']]
+        results.append(post)
+    return results, list(users.values())
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import suggestions
+from api.models import Follow, FollowSuggestion
+
+
+class Command(BaseCommand):
+    help = 'Recompute every user\'s "who to follow" suggestions from the follow graph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engine', choices=['auto', 'numpy', 'sql'], default='auto',
+            help='numpy squares the adjacency matrix in memory; sql runs one query per user. '
+                 'auto uses numpy when it is installed.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of users computed and written per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        engine = options['engine']
+        if engine != 'sql':
+            try:
+                import numpy  # noqa: F401
+                engine = 'numpy'
+            except ImportError:
+                if engine == 'numpy':
+                    raise CommandError('The numpy engine needs NumPy: pip install numpy')
+                engine = 'sql'
+
+        limit = settings.SUGGESTIONS_TOP_K
+        chunk_size = options['chunk_size']
+        if engine == 'numpy':
+            computed = self.compute_numpy(limit, chunk_size)
+        else:
+            computed = self.compute_sql(limit, chunk_size)
+
+        # Users who follow nobody have no candidates left.
+        FollowSuggestion.objects.exclude(
+            user_id__in=Follow.objects.values('follower_id')
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f'Computed suggestions for {computed} user(s) with {engine}.'))
+
+    def compute_numpy(self, limit, chunk_size):
+        user_ids, indptr, indices = suggestions.load_graph()
+        computed = 0
+        for start in range(0, len(user_ids), chunk_size):
+            stop = min(start + chunk_size, len(user_ids))
+            rows, candidates, scores = suggestions.top_candidates_for_rows(
+                indptr, indices, start, stop, limit
+            )
+            by_user = {int(user_ids[row]): [] for row in range(start, stop) if indptr[row + 1] > indptr[row]}
+            for row, candidate, score in zip(rows.tolist(), candidates.tolist(), scores.tolist()):
+                by_user[int(user_ids[row])].append((int(user_ids[candidate]), score))
+            suggestions.replace_suggestions(by_user)
+            computed += len(by_user)
+        return computed
+
+    def compute_sql(self, limit, chunk_size):
+        followers = Follow.objects.order_by('follower_id').values_list('follower_id', flat=True).distinct()
+        computed = 0
+        last_id = 0
+        while True:
+            user_ids = list(followers.filter(follower_id__gt=last_id)[:chunk_size])
+            if not user_ids:
+                return computed
+            last_id = user_ids[-1]
+            suggestions.replace_suggestions(
+                {user_id: suggestions.top_candidates(user_id, limit) for user_id in user_ids}
+            )
+            computed += len(user_ids)
@@ -0,0 +1,84 @@
+import sys
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import metrics
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Command(BaseCommand):
+    help = (
+        'Print p50/p95/p99 per endpoint from /api/metrics/ exports. Several sources '
+        '(one per worker) are merged.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'sources', nargs='+',
+            help='URLs of /api/metrics/, files holding a saved export, or - for stdin.',
+        )
+        parser.add_argument(
+            '--token', help='Access token of a staff user, sent to URL sources.',
+        )
+        parser.add_argument(
+            '--sort', choices=list(metrics.METRICS), default='latency_seconds',
+            help='Order endpoints by the p95 of this metric, worst first.',
+        )
+
+    def handle(self, *args, **options):
+        merged = {}
+        for source in options['sources']:
+            for key, histogram in metrics.parse_prometheus(self.read(source, options['token'])).items():
+                if key in merged:
+                    merged[key].merge(histogram)
+                else:
+                    merged[key] = histogram
+        if not merged:
+            self.stdout.write('No requests recorded.')
+            return
+
+        endpoints = sorted({(view, action) for _, view, action in merged})
+        sort_metric = options['sort']
+        endpoints.sort(
+            key=lambda endpoint: merged[(sort_metric, *endpoint)].quantile(0.95) or 0,
+            reverse=True,
+        )
+        header = f"{'endpoint':<40} {'requests':>8}"
+        for metric in metrics.METRICS:
+            header += f' {metric + " p50/p95/p99":>32}'
+        self.stdout.write(header)
+        for view, action in endpoints:
+            histogram = merged.get(('latency_seconds', view, action))
+            line = f'{view + " " + action:<40} {histogram.count if histogram else 0:>8}'
+            for metric in metrics.METRICS:
+                histogram = merged.get((metric, view, action))
+                values = [histogram.quantile(q) if histogram else None for q in QUANTILES]
+                line += f' {"/".join(self.format(metric, value) for value in values):>32}'
+            self.stdout.write(line)
+
+    def read(self, source, token):
+        if source == '-':
+            return sys.stdin.read()
+        if source.startswith(('http://', 'https://')):
+            request = Request(source, headers={'Accept': 'text/plain'})
+            if token:
+                request.add_header('Authorization', f'Bearer {token}')
+            try:
+                with urlopen(request, timeout=10) as response:
+                    return response.read().decode()
+            except OSError as exc:
+                raise CommandError(f'Could not fetch {source}: {exc}')
+        try:
+            with open(source) as f:
+                return f.read()
+        except OSError as exc:
+            raise CommandError(f'Could not read {source}: {exc}')
+
+    def format(self, metric, value):
+        if value is None:
+            return '-'
+        if metric == 'queries':
+            return f'{value:.0f}'
+        return f'{value * 1000:.1f}ms'
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked-token entries whose tokens have expired anyway.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Number of rows deleted per statement.',
+        )
+
+    def handle(self, *args, **options):
+        expired = RevokedToken.objects.filter(expires_at__lte=timezone.now())
+        deleted = 0
+        while True:
+            # Bounded deletes keep each statement's locks short on a big table.
+            pks = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            RevokedToken.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired revoked token(s).'))
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.models import Follow, User
+from api.timeline import get_timeline_backend, mark_skipped
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized home timelines from the follow graph.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Only rebuild these users\' timelines (default: everyone).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of users loaded per round trip.',
+        )
+
+    def handle(self, *args, **options):
+        backend = get_timeline_backend()
+        owners = User.objects.order_by('pk')
+        if options['usernames']:
+            owners = owners.filter(username__in=options['usernames'])
+
+        rebuilt = 0
+        last_pk = 0
+        while True:
+            owner_ids = list(
+                owners.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not owner_ids:
+                break
+            last_pk = owner_ids[-1]
+            follows = Follow.objects.filter(
+                follower_id__in=owner_ids,
+                following__followers_count__lt=settings.TIMELINE_FANOUT_THRESHOLD,
+            ).values_list('follower_id', 'following_id')
+            for owner_id in owner_ids:
+                backend.clear(owner_id)
+            for owner_id, author_id in follows:
+                backend.backfill(owner_id, author_id, settings.TIMELINE_BACKFILL_SIZE)
+            rebuilt += len(owner_ids)
+        mark_skipped(User.objects.all())
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timeline(s).'))
@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api import trending
+from api.models import Comment, Like, Post
+
+
+class Command(BaseCommand):
+    help = 'Rebuild post trending scores from their likes and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of posts recomputed per transaction.',
+        )
+        parser.add_argument(
+            '--since-hours', type=float,
+            help='Only recompute posts created in the last N hours.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        posts = Post.objects.order_by('pk').values_list('pk', flat=True)
+        if options['since_hours'] is not None:
+            posts = posts.filter(created_at__gte=timezone.now() - timedelta(hours=options['since_hours']))
+
+        recomputed = 0
+        after = 0
+        while True:
+            # Each chunk is a primary-key range, so its likes and comments are
+            # fetched with two range scans.
+            chunk = list(posts.filter(pk__gt=after)[:batch_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                recomputed += trending.recompute(Post, Like, Comment, chunk[0] - 1, chunk[-1])
+            after = chunk[-1]
+        self.stdout.write(self.style.SUCCESS(f'Recomputed {recomputed} trending score(s).'))
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Comment, Follow, Like, Post, User
+
+# model -> {counter field: (related model, foreign key pointing back at model)}
+COUNTERS = {
+    Post: {
+        'likes_count': (Like, 'post'),
+        'comments_count': (Comment, 'post'),
+    },
+    User: {
+        'followers_count': (Follow, 'following'),
+    },
+}
+
+
+def _count_subquery(model, fk):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')})
+            .order_by()
+            .values(fk)
+            .annotate(n=Count('pk'))
+            .values('n')
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized like/comment/follower counters that have drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows checked and updated per round trip.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drifted rows without writing.',
+        )
+
+    def handle(self, *args, **options):
+        verb = 'Found' if options['dry_run'] else 'Reconciled'
+        for model, counters in COUNTERS.items():
+            fixed = self.reconcile(model, counters, options['batch_size'], options['dry_run'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{verb} {fixed} drifted {model._meta.verbose_name} row(s).'
+            ))
+
+    def reconcile(self, model, counters, batch_size, dry_run):
+        actual = {f'actual_{field}': _count_subquery(*source) for field, source in counters.items()}
+        drift = Q()
+        for field in counters:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+        drifted = (
+            model.objects.annotate(**actual)
+            .filter(drift)
+            .only('pk', *counters)
+            .order_by('pk')
+        )
+
+        fixed = 0
+        last_pk = 0
+        while True:
+            # Walk the table by primary key so each batch is a bounded scan and
+            # rows we just rewrote are never revisited.
+            batch = list(drifted.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for row in batch:
+                for field in counters:
+                    setattr(row, field, getattr(row, f'actual_{field}'))
+            if not dry_run:
+                model.objects.bulk_update(batch, list(counters))
+            fixed += len(batch)
+        return fixed
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild full-text search entries in primary-key chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'indexes', nargs='*',
+            help=f'Indexes to rebuild: {", ".join(search.INDEXES)} (default: all of them).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows reindexed per transaction.',
+        )
+        parser.add_argument(
+            '--after-id', type=int, default=0,
+            help='Resume after this primary key.',
+        )
+
+    def handle(self, *args, **options):
+        names = options['indexes'] or list(search.INDEXES)
+        unknown = set(names) - set(search.INDEXES)
+        if unknown:
+            raise CommandError(f'Unknown index: {", ".join(sorted(unknown))}.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        for name in names:
+            reindexed = self.reindex(search.INDEXES[name], options['batch_size'], options['after_id'])
+            self.stdout.write(self.style.SUCCESS(f'Reindexed {reindexed} {name}.'))
+
+    def reindex(self, index, batch_size, after):
+        pks = index.model.objects.order_by('pk').values_list('pk', flat=True)
+        reindexed = 0
+        while True:
+            # Only the chunk's upper bound is read; the rows themselves are
+            # copied by the database.
+            boundary = list(pks.filter(pk__gt=after)[batch_size - 1:batch_size])
+            upto = boundary[0] if boundary else None
+            with transaction.atomic():
+                # The last chunk is open-ended, which also drops entries left
+                # behind by rows deleted past the final primary key.
+                search.reindex(index, after, upto)
+            if upto is None:
+                reindexed += pks.filter(pk__gt=after).count()
+                return reindexed
+            reindexed += batch_size
+            after = upto
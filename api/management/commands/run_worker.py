@@ -0,0 +1,82 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from api.tasks import claim_tasks, release_stale_tasks, run_task
+
+
+def _run(pk):
+    close_old_connections()
+    try:
+        run_task(pk)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (timeline fan-out, backfills) with a worker pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.TASK_WORKER_CONCURRENCY,
+            help='Number of worker threads or processes.',
+        )
+        parser.add_argument(
+            '--mode', choices=['thread', 'process'], default='thread',
+            help='Run tasks in a thread pool or a process pool.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Jobs claimed per poll (default: 4 x concurrency).',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to sleep when the queue is empty.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when the queue is drained instead of polling forever.',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        batch_size = options['batch_size'] or concurrency * 4
+        self.stopping = False
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        if options['mode'] == 'process':
+            # Children must not inherit this process's database connections.
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                concurrency,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        else:
+            executor = ThreadPoolExecutor(concurrency, thread_name_prefix='task-worker')
+
+        self.stdout.write(f'Worker started with {concurrency} {options["mode"]} worker(s).')
+        processed = 0
+        with executor:
+            while not self.stopping:
+                release_stale_tasks()
+                claimed = claim_tasks(batch_size)
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                wait([executor.submit(_run, pk) for pk in claimed])
+                processed += len(claimed)
+
+        self.stdout.write(self.style.SUCCESS(f'Worker stopped after {processed} task(s).'))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import seeding
+
+
+class Command(BaseCommand):
+    help = 'Load synthetic users, follows, posts, likes and comments in bulk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--follows-per-user', type=int, default=20,
+            help='Average number of accounts each user follows.',
+        )
+        parser.add_argument('--posts-per-user', type=int, default=5)
+        parser.add_argument('--likes-per-post', type=float, default=5, help='Average.')
+        parser.add_argument('--comments-per-post', type=float, default=2, help='Average.')
+        parser.add_argument(
+            '--degree', choices=seeding.DEGREES, default='zipf',
+            help='zipf: a few very popular accounts and skewed follow counts; uniform: neither.',
+        )
+        parser.add_argument('--days', type=int, default=30, help='Posts are spread over this many days.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data.')
+        parser.add_argument('--password', default='password', help='Password of every generated user.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Users generated and written per transaction.',
+        )
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Worker processes generating chunks in parallel.',
+        )
+        parser.add_argument(
+            '--timelines', action='store_true',
+            help='Also fill home timelines (database timeline backend only).',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['batch_size'] < 1 or options['processes'] < 1:
+            raise CommandError('--users, --batch-size and --processes must be positive.')
+        started = time.perf_counter()
+        step_started = started
+
+        def log(step, totals):
+            nonlocal step_started
+            now = time.perf_counter()
+            rows = ', '.join(f'{count} {kind}' for kind, count in totals.items()) or 'done'
+            self.stdout.write(f'{step}: {rows} in {now - step_started:.1f}s')
+            step_started = now
+
+        try:
+            plan = seeding.seed(
+                users=options['users'],
+                follows_per_user=options['follows_per_user'],
+                posts_per_user=options['posts_per_user'],
+                likes_per_post=options['likes_per_post'],
+                comments_per_post=options['comments_per_post'],
+                degree=options['degree'],
+                days=options['days'],
+                seed=options['seed'],
+                password=options['password'],
+                batch_size=options['batch_size'],
+                processes=options['processes'],
+                timelines=options['timelines'],
+                log=log,
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        first, last = plan.user_ids[0], plan.user_ids[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded users {seeding.username(first)} to {seeding.username(last)} '
+            f'in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,314 @@
+"""
+Per-endpoint request metrics.
+
+``MetricsMiddleware`` samples ``METRICS_SAMPLE_RATE`` of requests when
+``METRICS_ENABLED`` is on and records, per resolved view and action:
+
+* ``queries``: number of SQL queries, on any database alias;
+* ``db_seconds``: time spent executing them;
+* ``serialize_seconds``: time spent in serializers' ``to_representation``
+  plus rendering the response body;
+* ``latency_seconds``: total time spent in the rest of the middleware stack.
+
+Observations go into fixed-bucket histograms held in process memory, so each
+worker reports only its own requests. ``/api/metrics/`` exposes them in the
+Prometheus text format to staff users, and ``manage.py metrics_report``
+merges one or more of those exports into a p50/p95/p99 table.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 15, 20, 30, 50, 100, 200, 500, 1000)
+SECONDS_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+METRICS = {
+    'queries': COUNT_BUCKETS,
+    'db_seconds': SECONDS_BUCKETS,
+    'serialize_seconds': SECONDS_BUCKETS,
+    'latency_seconds': SECONDS_BUCKETS,
+}
+PREFIX = 'api_request_'
+
+_sample = ContextVar('metrics_sample', default=None)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        # One slot per bound plus the +Inf bucket; not cumulative.
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        for slot, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            slot = len(self.bounds)
+        self.counts[slot] += 1
+        self.total += value
+
+    def merge(self, other):
+        for slot, count in enumerate(other.counts):
+            self.counts[slot] += count
+        self.total += other.total
+
+    def quantile(self, q):
+        """Estimate the `q` quantile by interpolating within its bucket, like Prometheus' histogram_quantile()."""
+        count = self.count
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for slot, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if slot == len(self.bounds):
+                    # Nothing is known above the highest bound.
+                    return self.bounds[-1]
+                lower = self.bounds[slot - 1] if slot else 0
+                return lower + (self.bounds[slot] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def observe(self, view, action, values):
+        with self.lock:
+            for metric, value in values.items():
+                key = (metric, view, action)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(METRICS[metric])
+                histogram.observe(value)
+
+    def export(self):
+        with self.lock:
+            return render_prometheus(self.histograms)
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(number):
+    return repr(float(number)) if not isinstance(number, int) else str(number)
+
+
+def render_prometheus(histograms):
+    lines = []
+    for metric in METRICS:
+        name = PREFIX + metric
+        series = sorted((key, h) for key, h in histograms.items() if key[0] == metric)
+        if not series:
+            continue
+        lines.append(f'# TYPE {name} histogram')
+        for (_, view, action), histogram in series:
+            labels = f'view="{_escape(view)}",action="{_escape(action)}"'
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{_format(bound)}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{labels}}} {_format(histogram.total)}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _parse_labels(text):
+    labels = {}
+    for part in text.split('",'):
+        key, _, value = part.partition('="')
+        labels[key.strip()] = value.rstrip('"').replace('\\"', '"').replace('\\n', '\n').replace('\\\\', '\\')
+    return labels
+
+
+def parse_prometheus(text):
+    """Read histograms written by `render_prometheus()` back into ``{(metric, view, action): Histogram}``."""
+    cumulative, totals = {}, {}
+    for line in text.splitlines():
+        if not line.startswith(PREFIX):
+            continue
+        series, _, value = line.rpartition(' ')
+        name, _, labels = series.partition('{')
+        labels = _parse_labels(labels.rstrip('}'))
+        metric, _, kind = name[len(PREFIX):].rpartition('_')
+        if metric not in METRICS:
+            continue
+        key = (metric, labels['view'], labels['action'])
+        if kind == 'bucket':
+            cumulative.setdefault(key, {})[float(labels['le'])] = int(float(value))
+        elif kind == 'sum':
+            totals[key] = float(value)
+
+    histograms = {}
+    for key, counts in cumulative.items():
+        histogram = Histogram(METRICS[key[0]])
+        previous = 0
+        for slot, bound in enumerate((*histogram.bounds, float('inf'))):
+            current = counts.get(float(bound), previous)
+            histogram.counts[slot] = current - previous
+            previous = current
+        histogram.total = totals.get(key, 0.0)
+        histograms[key] = histogram
+    return histograms
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, str):
+            # Error responses carry a dict.
+            data = '\n'.join(f'# {key}: {value}' for key, value in data.items()) + '\n'
+        return data.encode(self.charset)
+
+
+class Sample:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.serializing = False
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection (see api/signals.py).
+
+    The sample travels in a context variable rather than on the connection,
+    so queries of async views, which run on another thread's connection, are
+    counted too.
+    """
+    sample = _sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.db_seconds += time.perf_counter() - start
+
+
+def install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def measure_serialization():
+    """Add the time spent in the block to the current sample, once for nested blocks."""
+    sample = _sample.get()
+    if sample is None or sample.serializing:
+        yield
+        return
+    sample.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample.serialize_seconds += time.perf_counter() - start
+        sample.serializing = False
+
+
+class MeasuredSerializerMixin:
+    def to_representation(self, instance):
+        with measure_serialization():
+            return super().to_representation(instance)
+
+
+def _endpoint(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Unmatched URLs are lumped together to keep the label set bounded.
+        return 'unmatched', request.method.lower()
+    actions = getattr(match.func, 'actions', None) or {}
+    return match.view_name, actions.get(request.method.lower(), request.method.lower())
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        sample, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _sample.reset(token)
+        self.observe(request, sample, start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        sample, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _sample.reset(token)
+        self.observe(request, sample, start)
+        return response
+
+    def sampled(self):
+        return settings.METRICS_ENABLED and random.random() < settings.METRICS_SAMPLE_RATE
+
+    def start(self):
+        sample = Sample()
+        return sample, _sample.set(sample), time.perf_counter()
+
+    def observe(self, request, sample, start):
+        latency = time.perf_counter() - start
+        view, action = _endpoint(request)
+        registry.observe(view, action, {
+            'queries': sample.queries,
+            'db_seconds': sample.db_seconds,
+            'serialize_seconds': sample.serialize_seconds,
+            'latency_seconds': latency,
+        })
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook returns.
+        sample = _sample.get()
+        if sample is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                sample.serialize_seconds += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.7 on 2026-10-18 06:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_followers_count(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    Follow = apps.get_model('api', 'Follow')
+    counts = (
+        Follow.objects.filter(following=OuterRef('pk'))
+        .order_by()
+        .values('following')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    User.objects.update(followers_count=Coalesce(Subquery(counts), 0))
+
+
+def seed_timelines(apps, schema_editor):
+    # Existing follows get the same backfill a new follow would, so feeds are
+    # not empty right after the switch to materialized timelines.
+    Follow = apps.get_model('api', 'Follow')
+    Post = apps.get_model('api', 'Post')
+    TimelineEntry = apps.get_model('api', 'TimelineEntry')
+    follows = Follow.objects.filter(
+        following__followers_count__lt=settings.TIMELINE_FANOUT_THRESHOLD
+    ).values_list('follower_id', 'following_id')
+    for owner_id, author_id in follows.iterator():
+        post_ids = (
+            Post.objects.filter(user_id=author_id)
+            .order_by('-created_at', '-id')
+            .values_list('id', flat=True)[:settings.TIMELINE_BACKFILL_SIZE]
+        )
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(owner_id=owner_id, post_id=post_id, author_id=author_id) for post_id in post_ids],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_post_feed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='api.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_followers_count, migrations.RunPython.noop),
+        migrations.RunPython(seed_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from api import search
+
+
+def install_search(apps, schema_editor):
+    search.install(schema_editor)
+    if schema_editor.connection.vendor in search.BACKENDS:
+        for index in search.INDEXES.values():
+            search.reindex(index, 0, None, using=schema_editor.connection.alias)
+
+
+def uninstall_search(apps, schema_editor):
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.7 on 2026-10-18 07:09
+
+from django.db import migrations, models
+
+from api import search, trending
+
+
+def backfill_trending_scores(apps, schema_editor):
+    Post = apps.get_model('api', 'Post')
+    Like = apps.get_model('api', 'Like')
+    Comment = apps.get_model('api', 'Comment')
+    post_ids = Post.objects.order_by('pk').values_list('pk', flat=True)
+    after = 0
+    while True:
+        boundary = list(post_ids.filter(pk__gt=after)[999:1000])
+        upto = boundary[0] if boundary else None
+        trending.recompute(Post, Like, Comment, after, upto)
+        if upto is None:
+            break
+        after = upto
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    # Adding the column rebuilt api_post on SQLite, dropping its triggers.
+    search.install(schema_editor, [search.INDEXES['posts']])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_follow_suggestions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='trending_score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-trending_score', '-id'], name='post_trending_idx'),
+        ),
+        migrations.RunPython(reinstall_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(backfill_trending_scores, migrations.RunPython.noop),
+    ]
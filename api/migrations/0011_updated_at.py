@@ -0,0 +1,41 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+from api import search
+
+
+def backfill_updated_at(apps, schema_editor):
+    apps.get_model('api', 'User').objects.update(updated_at=F('date_joined'))
+    apps.get_model('api', 'Comment').objects.update(updated_at=F('created_at'))
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    # Adding the column rebuilt api_user on SQLite, dropping its triggers.
+    search.install(schema_editor, [search.INDEXES['users']])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_comment_thread_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.RunPython(reinstall_search_triggers, migrations.RunPython.noop),
+    ]
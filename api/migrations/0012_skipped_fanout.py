@@ -0,0 +1,39 @@
+# Generated by Django 5.0.7 on 2026-10-18 10:02
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+from api import search
+
+
+def flag_skipped_authors(apps, schema_editor):
+    # Authors over the threshold have had their posts skipped so far.
+    User = apps.get_model('api', 'User')
+    Post = apps.get_model('api', 'Post')
+    User.objects.filter(
+        Exists(Post.objects.filter(user=OuterRef('pk'))),
+        followers_count__gte=settings.TIMELINE_FANOUT_THRESHOLD,
+    ).update(skipped_fanout=True)
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    # Adding the column rebuilt api_user on SQLite, dropping its triggers.
+    search.install(schema_editor, [search.INDEXES['users']])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='skipped_fanout',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(flag_skipped_authors, migrations.RunPython.noop),
+        migrations.RunPython(reinstall_search_triggers, migrations.RunPython.noop),
+    ]
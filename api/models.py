@@ -2,11 +2,21 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
+from . import trending
+
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     bio = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
     date_joined = models.DateTimeField(default=timezone.now)
+    # Validator for conditional GETs of the profile (see api/conditional.py).
+    updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized; decides whether the user's posts are fanned out on write.
+    followers_count = models.PositiveIntegerField(default=0)
+    # Set once one of the user's posts skipped fan-out on write: from then on
+    # followers' feeds pull the user's posts on read, whatever followers_count
+    # becomes, since those posts are in no timeline.
+    skipped_fanout = models.BooleanField(default=False)
 
     # Add related_name to avoid conflicts with auth.User
     groups = models.ManyToManyField(
@@ -27,11 +37,39 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # Users built from token claims (api.authentication) carry only their
+        # id; the first deferred field read loads the rest in one query
+        # instead of one query per field.
+        if fields is not None and getattr(self, '_load_all_deferred', False):
+            self._load_all_deferred = False
+            fields = list(self.get_deferred_fields() | set(fields))
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+
 class Post(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters, maintained by the views and repaired by
+    # `manage.py reconcile_counters`.
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    # Log of the time-decayed engagement sum (see api/trending.py).
+    trending_score = models.FloatField(default=0.0)
+
+    class Meta:
+        indexes = [
+            # Serves the keyset-paginated home feed: posts by a set of authors
+            # ordered by (created_at, id).
+            models.Index(fields=['user', 'created_at', 'id'], name='post_user_created_id_idx'),
+            models.Index(fields=['-trending_score', '-id'], name='post_trending_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.trending_score:
+            self.trending_score = trending.event_score('post', self.created_at)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Post by {self.user.username}"
@@ -41,6 +79,14 @@ class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Serves comment threads and previews: a post's comments ordered
+            # by (created_at, id).
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.user.username} on post {self.post.id}"
@@ -66,3 +112,78 @@ class Follow(models.Model):
 
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
+
+class TimelineEntry(models.Model):
+    """A post pushed into a follower's materialized home feed."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # Copied from post.user so an unfollow can prune without a join.
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    # Copied from post.created_at so feed pages are a range of this table.
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.owner_id}'s timeline"
+
+class Task(models.Model):
+    """A unit of background work queued for `manage.py run_worker`."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True, db_index=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class RevokedToken(models.Model):
+    """A JWT (by its ``jti`` claim) that must be rejected until it expires."""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class FollowSuggestion(models.Model):
+    """A precomputed "who to follow" entry (see api/suggestions.py)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_suggestions')
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    # Number of accounts `user` follows that follow `suggested`.
+    score = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('user', 'suggested')
+        indexes = [
+            models.Index(fields=['user', '-score', 'id'], name='suggestion_user_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.suggested_id} for {self.user_id} ({self.score})"
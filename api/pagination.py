@@ -0,0 +1,227 @@
+import base64
+import datetime
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import timeline
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+
+def encode_cursor(position):
+    """Pack a tuple of ordering values into an opaque, URL-safe token."""
+    payload = json.dumps(list(position), default=_encode_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    padded = token + '=' * (-len(token) % 4)
+    try:
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError):
+        raise NotFound(KeysetPagination.invalid_cursor_message)
+    if not isinstance(position, list):
+        raise NotFound(KeysetPagination.invalid_cursor_message)
+    return position
+
+
+def _is_comparable(value):
+    """Whether a cursor value can be compared with a column: a string or a finite 64-bit number."""
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return -2**63 <= value < 2**63
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return isinstance(value, str)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the full ordering tuple.
+
+    The cursor carries the ordering values of the last row on the page, and the
+    next page is fetched with a lexicographic `(a, b) < (x, y)` filter, so every
+    page is an index range scan no matter how deep the client has scrolled.
+    The last ordering field must be unique (normally the primary key).
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def decode_position(self, queryset, token):
+        fields = self._fields()
+        raw = decode_cursor(token)
+        if len(raw) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+        position = []
+        for (name, _), value in zip(fields, raw):
+            if not _is_comparable(value):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # Annotations (scores, ranks) travel as plain JSON numbers.
+                position.append(value)
+                continue
+            try:
+                value = field.to_python(value)
+                field.run_validators(value)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            position.append(value)
+        return position
+
+    def keyset_filter(self, position):
+        condition = Q()
+        fields = self._fields()
+        for index, (name, descending) in enumerate(fields):
+            lookup = 'lt' if descending else 'gt'
+            clause = Q(**{f'{name}__{lookup}': position[index]})
+            for (prior, _), value in zip(fields[:index], position):
+                clause &= Q(**{prior: value})
+            condition |= clause
+        return condition
+
+    def get_page_queryset(self, queryset, request):
+        """Return the ordered, filtered queryset for the requested page.
+
+        One row beyond the page size is included so the paginator can tell
+        whether another page exists without a COUNT.
+        """
+        queryset = queryset.order_by(*self.ordering)
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            position = self.decode_position(queryset, token)
+            queryset = queryset.filter(self.keyset_filter(position))
+        return queryset[:self.get_page_size(request) + 1]
+
+    def get_position(self, row):
+        if isinstance(row, dict):
+            return [row[name] for name, _ in self._fields()]
+        return [getattr(row, name) for name, _ in self._fields()]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        return self.cut_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset() for async views (see api/async_views.py)."""
+        self.request = request
+        return self.cut_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def cut_page(self, rows):
+        page_size = self.get_page_size(self.request)
+        page = rows[:page_size]
+        self.next_position = self.get_position(page[-1]) if len(rows) > page_size else None
+        return page
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque cursor taken from the previous page\'s `next` link.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results per page (max {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Pages of the home feed.
+
+    The page's post ids come from the reader's timeline and the authors merged
+    on read (see api/timeline.py), each read as an index range from the
+    cursor; the posts themselves are then loaded by primary key.
+    """
+
+    def page_ids(self, queryset, request):
+        token = request.query_params.get(self.cursor_query_param)
+        position = self.decode_position(queryset, token) if token else None
+        page = timeline.feed_page(request.user, position, self.get_page_size(request) + 1)
+        return [post_id for _, post_id in page]
+
+    def get_page_queryset(self, queryset, request):
+        return queryset.order_by().filter(pk__in=self.page_ids(queryset, request))
+
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        ids = await sync_to_async(self.page_ids)(queryset, request)
+        return self.cut_page([row async for row in queryset.order_by().filter(pk__in=ids)])
+
+    def cut_page(self, rows):
+        # Loaded by primary key, in no particular order.
+        return super().cut_page(sorted(rows, key=self.get_position, reverse=True))
+
+
+class SuggestionPagination(KeysetPagination):
+    ordering = ('-score', 'id')
+
+
+class TrendingPagination(KeysetPagination):
+    ordering = ('-trending_score', '-id')
+
+
+class CommentPagination(KeysetPagination):
+    # Threads read oldest first.
+    ordering = ('created_at', 'id')
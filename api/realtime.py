@@ -0,0 +1,297 @@
+"""
+Live events over a WebSocket at ``/ws/events/`` (ASGI only, see backend/asgi.py).
+
+Clients connect with an access token, as ``?token=<jwt>`` or an
+``Authorization: Bearer`` header, and receive JSON text frames:
+
+* ``{"type": "post", "post": {...}}`` when an account they follow posts;
+* ``{"type": "like", "post_id": ..., "user_id": ...}`` and
+  ``{"type": "comment", "post_id": ..., "comment": {...}}`` on their own posts.
+
+Events are encoded once and published after the transaction commits, to
+``author:<id>`` for posts and ``user:<id>`` for notifications. Every
+connection subscribes to its own ``user:`` topic and to the ``author:`` topic
+of each account it follows; follows and unfollows made while connected reach
+it on ``following:<id>``.
+
+The broker (``REALTIME_BROKER``) carries published messages to every worker,
+whose hub hands them to that worker's connections. `LocalBroker` delivers
+within the process: enough for one ASGI worker serving both the API and the
+sockets, and for tests. Several workers need a broker that crosses processes,
+such as Redis pub/sub, implementing `BaseBroker`.
+
+An idle connection is two suspended coroutines and a bounded buffer of
+``REALTIME_BUFFER_SIZE`` messages (the oldest are dropped when a slow
+client falls behind); it holds no thread and no database connection.
+``following:`` changes skip the buffer and are applied as they arrive.
+
+The socket is closed with `CLOSE_UNAUTHORIZED` when its access token
+expires, or once the token is found revoked, which is re-checked every
+``REALTIME_REVOCATION_CHECK_INTERVAL`` seconds.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .authentication import StatelessJWTAuthentication
+from .models import Follow
+from .revocation import is_token_revoked
+
+PATH = '/ws/events/'
+# Close codes: the 4000 range is left to applications.
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_NOT_FOUND = 4404
+
+
+class Subscription:
+    """One connection's buffer of ``(topic, message)`` pairs."""
+
+    def __init__(self, loop, buffer_size):
+        self.loop = loop
+        self.topics = set()
+        # Topics whose messages are handed to a callback instead of buffered.
+        self.controls = {}
+        self.messages = deque(maxlen=buffer_size)
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def push(self, topic, message):
+        control = self.controls.get(topic)
+        if control is not None:
+            control(message)
+            return
+        self.messages.append((topic, message))
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.wake()
+
+    def wake(self):
+        self.ready.set()
+
+    async def get(self):
+        """The next ``(topic, message)``, or None once closed or woken by `wake()`."""
+        if not self.messages and not self.closed:
+            self.ready.clear()
+            await self.ready.wait()
+        if self.closed or not self.messages:
+            return None
+        return self.messages.popleft()
+
+
+class Hub:
+    """This process's connections by topic."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = defaultdict(set)
+
+    def subscribe(self, subscription, topics):
+        with self._lock:
+            for topic in topics:
+                self._topics[topic].add(subscription)
+                subscription.topics.add(topic)
+
+    def unsubscribe(self, subscription, topics=None):
+        with self._lock:
+            for topic in list(subscription.topics if topics is None else topics):
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+                subscription.topics.discard(topic)
+
+    def deliver(self, topic, message):
+        """Queue `message` for the topic's subscribers; callable from any thread."""
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        # One wake-up per event loop, however many connections it serves.
+        for loop, batch in by_loop.items():
+            loop.call_soon_threadsafe(_push_all, batch, topic, message)
+
+    def count(self, topic):
+        return len(self._topics.get(topic, ()))
+
+
+def _push_all(subscriptions, topic, message):
+    for subscription in subscriptions:
+        subscription.push(topic, message)
+
+
+hub = Hub()
+
+
+class BaseBroker:
+    def start(self, deliver):
+        """Pass every message published by any worker to ``deliver(topic, message)``."""
+        raise NotImplementedError
+
+    def publish(self, topic, message):
+        """Send `message`, a string, to the subscribers of `topic` on every worker."""
+        raise NotImplementedError
+
+
+class LocalBroker(BaseBroker):
+    """Delivers to this process only."""
+
+    def __init__(self):
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, topic, message):
+        if self._deliver is not None:
+            self._deliver(topic, message)
+
+
+_brokers = {}
+
+
+def get_broker():
+    path = settings.REALTIME_BROKER
+    if path not in _brokers:
+        broker = import_string(path)()
+        broker.start(hub.deliver)
+        _brokers[path] = broker
+    return _brokers[path]
+
+
+def publish(topic, event):
+    message = json.dumps(event, cls=JSONEncoder, separators=(',', ':'))
+    transaction.on_commit(lambda: get_broker().publish(topic, message))
+
+
+def post_created(post, data):
+    publish(f'author:{post.user_id}', {'type': 'post', 'post': data})
+
+
+def post_liked(author_id, post_id, user_id):
+    if author_id != user_id:
+        publish(f'user:{author_id}', {'type': 'like', 'post_id': post_id, 'user_id': user_id})
+
+
+def comment_created(author_id, comment, data):
+    if author_id != comment.user_id:
+        publish(f'user:{author_id}', {'type': 'comment', 'post_id': comment.post_id, 'comment': data})
+
+
+def following_changed(follower_id, followed=(), unfollowed=()):
+    publish(f'following:{follower_id}', {'followed': list(followed), 'unfollowed': list(unfollowed)})
+
+
+def _raw_token(scope):
+    tokens = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token')
+    if tokens:
+        return tokens[0]
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization':
+            kind, _, token = value.decode('latin-1').partition(' ')
+            if kind.lower() == 'bearer' and token:
+                return token
+    return None
+
+
+@sync_to_async
+def _open(raw_token):
+    """The validated `raw_token`, its user id and the ids it follows, or ``(None, None, ())``."""
+    close_old_connections()
+    try:
+        authentication = StatelessJWTAuthentication()
+        try:
+            token = authentication.get_validated_token(raw_token)
+            user = authentication.get_user(token)
+        except (AuthenticationFailed, InvalidToken):
+            return None, None, ()
+        following = list(Follow.objects.filter(follower_id=user.pk).values_list('following_id', flat=True))
+        return token, user.pk, following
+    finally:
+        close_old_connections()
+
+
+@sync_to_async
+def _revoked(token):
+    close_old_connections()
+    try:
+        return is_token_revoked(token)
+    finally:
+        close_old_connections()
+
+
+async def websocket_application(scope, receive, send):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    if scope['path'] != PATH:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    raw_token = _raw_token(scope)
+    token, user_id, following = await _open(raw_token) if raw_token else (None, None, ())
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+
+    get_broker()
+    subscription = Subscription(asyncio.get_running_loop(), settings.REALTIME_BUFFER_SIZE)
+    control = f'following:{user_id}'
+
+    def following_changed(message):
+        change = json.loads(message)
+        hub.subscribe(subscription, [f'author:{pk}' for pk in change['followed']])
+        hub.unsubscribe(subscription, [f'author:{pk}' for pk in change['unfollowed']])
+
+    subscription.controls[control] = following_changed
+    hub.subscribe(subscription, [f'user:{user_id}', control, *(f'author:{pk}' for pk in following)])
+
+    async def watch():
+        # Anything the client sends is ignored; a disconnect ends the loop below.
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+        subscription.close()
+
+    watcher = asyncio.ensure_future(watch())
+    expires_at = token['exp']
+    check_at = time.time() + settings.REALTIME_REVOCATION_CHECK_INTERVAL
+    # One timer per connection wakes it for the next check. It is re-armed
+    # when that moves or once it has gone off (possibly a little early),
+    # not on every message.
+    deadline = timer = None
+    try:
+        await send({'type': 'websocket.accept'})
+        while not subscription.closed:
+            now = time.time()
+            unauthorized = now >= expires_at
+            if not unauthorized and now >= check_at:
+                unauthorized = await _revoked(token)
+                check_at = now + settings.REALTIME_REVOCATION_CHECK_INTERVAL
+            if unauthorized:
+                await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+                break
+            loop = subscription.loop
+            if timer is None or timer.when() <= loop.time() or deadline != min(expires_at, check_at):
+                deadline = min(expires_at, check_at)
+                if timer is not None:
+                    timer.cancel()
+                timer = loop.call_later(deadline - now, subscription.wake)
+            item = await subscription.get()
+            if item is not None:
+                await send({'type': 'websocket.send', 'text': item[1]})
+    finally:
+        if timer is not None:
+            timer.cancel()
+        hub.unsubscribe(subscription)
+        watcher.cancel()
@@ -0,0 +1,135 @@
+"""
+Read-replica routing.
+
+``ReplicaMiddleware`` decides, per request, where ORM reads go: requests with a
+safe method read from one of ``READ_REPLICAS``, everything else (and any code
+running outside a request, such as workers and management commands) uses the
+primary. Writes always go to the primary.
+
+After a successful write, the writer's reads stay on the primary for
+``REPLICA_PIN_SECONDS`` so they see their own changes despite replication lag.
+The pin is recorded twice: in a cookie, which follows the client between
+workers, and in the cache under the user id, for clients that drop cookies.
+"""
+import base64
+import binascii
+import json
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings
+
+PIN_COOKIE = 'pin_primary'
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+
+def _pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def _token_user_id(request):
+    # Routing only needs a hint, so the token is decoded without verifying it;
+    # a forged token can at worst send its bearer's reads to the primary.
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    try:
+        payload = header.split(' ', 1)[1].split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return claims.get(api_settings.USER_ID_CLAIM)
+    except (IndexError, ValueError, binascii.Error, AttributeError):
+        return None
+
+
+def _pinned(request):
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    user_id = _token_user_id(request)
+    return user_id is not None and cache.get(_pin_key(user_id)) is not None
+
+
+async def _apinned(request):
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    user_id = _token_user_id(request)
+    return user_id is not None and await cache.aget(_pin_key(user_id)) is not None
+
+
+class ReplicaMiddleware:
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        alias = None
+        if self.may_use_replica(request) and not _pinned(request):
+            alias = random.choice(settings.READ_REPLICAS)
+        token = _read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+
+        if self.should_pin(request, response):
+            key = self.pin(request, response)
+            if key is not None:
+                cache.set(key, 1, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        alias = None
+        if self.may_use_replica(request) and not await _apinned(request):
+            alias = random.choice(settings.READ_REPLICAS)
+        token = _read_alias.set(alias)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+
+        if self.should_pin(request, response):
+            key = self.pin(request, response)
+            if key is not None:
+                await cache.aset(key, 1, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def may_use_replica(self, request):
+        return settings.READ_REPLICAS and request.method in self.safe_methods
+
+    def should_pin(self, request, response):
+        return (
+            settings.READ_REPLICAS
+            and request.method not in self.safe_methods
+            and response.status_code < 400
+        )
+
+    def pin(self, request, response):
+        """Set the pin cookie; return the cache key pinning the user, if known."""
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+        )
+        # DRF copies the authenticated user onto the underlying request.
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return _pin_key(user.pk)
+        return None
@@ -0,0 +1,121 @@
+"""
+Revoked JWTs.
+
+Revocations are stored in ``RevokedToken`` and mirrored in every worker as a
+bloom filter of all unexpired revoked ids plus an exact set of the ones
+revoked since the filter was built. A token that misses both is accepted
+without a query; only a bloom hit (a revoked token, or a rare false positive)
+is confirmed against the database.
+
+Other workers' revocations are picked up every ``REVOCATION_SYNC_INTERVAL``
+seconds and the filter is rebuilt every ``REVOCATION_REBUILD_INTERVAL``
+seconds, which also drops expired ids from it.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+# Revocations are looked up by ``revoked_at``, which is stamped before the row
+# commits; re-reading this much history on every sync keeps a slow commit from
+# being missed.
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from two halves of one digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationRegistry:
+    """Per-process view of ``RevokedToken``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._recent = set()
+            self._rebuilt_at = self._synced_at = 0.0
+            self._watermark = None
+
+    def is_revoked(self, jti):
+        self._refresh()
+        if jti in self._recent:
+            return True
+        if jti not in self._bloom:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        RevokedToken.objects.get_or_create(jti=jti, defaults={'expires_at': expires_at})
+        self._recent.add(jti)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._bloom is not None and now - self._synced_at < settings.REVOCATION_SYNC_INTERVAL:
+            return
+        with self._lock:
+            if self._bloom is None or now - self._rebuilt_at >= settings.REVOCATION_REBUILD_INTERVAL:
+                self._rebuild(now)
+            elif now - self._synced_at >= settings.REVOCATION_SYNC_INTERVAL:
+                self._sync(now)
+
+    def _rebuild(self, now):
+        watermark = timezone.now()
+        live = RevokedToken.objects.filter(expires_at__gt=watermark).values_list('jti', flat=True)
+        jtis = list(live)
+        bloom = BloomFilter(max(len(jtis), settings.REVOCATION_BLOOM_CAPACITY), settings.REVOCATION_BLOOM_ERROR_RATE)
+        for jti in jtis:
+            bloom.add(jti)
+        self._bloom, self._recent = bloom, set()
+        self._watermark = watermark
+        self._rebuilt_at = self._synced_at = now
+
+    def _sync(self, now):
+        watermark = timezone.now()
+        self._recent.update(
+            RevokedToken.objects.filter(revoked_at__gte=self._watermark - SYNC_OVERLAP)
+            .values_list('jti', flat=True)
+        )
+        self._watermark = watermark
+        self._synced_at = now
+
+
+registry = RevocationRegistry()
+
+
+def revoke_token(token):
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    registry.revoke(token[api_settings.JTI_CLAIM], expires_at)
+
+
+def is_token_revoked(token):
+    jti = token.get(api_settings.JTI_CLAIM)
+    return jti is not None and registry.is_revoked(jti)
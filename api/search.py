@@ -0,0 +1,248 @@
+"""
+Full-text search over posts and users.
+
+Each searchable model has an inverted index kept in step with its table by
+the database itself:
+
+* SQLite: an FTS5 table per model (``api_post_fts``), filled by triggers.
+* PostgreSQL: a ``search_vector`` tsvector column with a GIN index, filled by
+  a ``tsvector_update_trigger``.
+
+Both backends rank matches best first as an ascending ``rank`` (negated
+ts_rank_cd on PostgreSQL) so that results can be paged with a ``(rank, id)``
+keyset, and highlight the matched terms of the returned page only.
+
+Schema changes that make Django rebuild a table on SQLite (most AddField and
+AlterField operations) drop its triggers; such migrations must call
+``install()`` again afterwards.
+"""
+import html
+import re
+
+from django.db import NotSupportedError, connections, router
+
+from .models import Post, User
+
+# Control characters delimit matches in highlights so that the text can be
+# HTML-escaped before they are turned into <mark> tags.
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+
+class SearchIndex:
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+
+INDEXES = {
+    'posts': SearchIndex(Post, ('content',)),
+    'users': SearchIndex(User, ('username', 'bio')),
+}
+
+
+class SQLiteSearchBackend:
+    def fts_table(self, index):
+        return f'{index.table}_fts'
+
+    def install(self, cursor, index):
+        fts, table = self.fts_table(index), index.table
+        columns = ', '.join(index.fields)
+        new_values = ', '.join(f'new.{field}' for field in index.fields)
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, tokenize='porter unicode61')"
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN '
+            f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN '
+            f'DELETE FROM {fts} WHERE rowid = old.id; END'
+        )
+        # Only a change to an indexed column touches the index, so counter
+        # updates stay cheap.
+        assignments = ', '.join(f'{field} = new.{field}' for field in index.fields)
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {columns} ON {table} BEGIN '
+            f'UPDATE {fts} SET {assignments} WHERE rowid = old.id; END'
+        )
+
+    def uninstall(self, cursor, index):
+        fts = self.fts_table(index)
+        for trigger in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{trigger}')
+        cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+    def reindex(self, cursor, index, after, upto):
+        fts, columns = self.fts_table(index), ', '.join(index.fields)
+        bounds, params = _range_condition('rowid', after, upto)
+        cursor.execute(f'DELETE FROM {fts} WHERE {bounds}', params)
+        bounds, params = _range_condition('id', after, upto)
+        cursor.execute(
+            f'INSERT INTO {fts}(rowid, {columns}) SELECT id, {columns} FROM {index.table} WHERE {bounds}',
+            params,
+        )
+
+    def match_expression(self, query):
+        # Every word must match; quoting keeps FTS5 operators in user input
+        # (AND, NEAR, *, ...) literal.
+        words = re.findall(r'\w+', query)
+        return ' '.join(f'"{word}"' for word in words)
+
+    def search(self, cursor, index, query, after, limit):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        keyset, params = _keyset_condition(after)
+        cursor.execute(
+            f'SELECT id, rank FROM ('
+            f'SELECT rowid AS id, rank FROM {self.fts_table(index)} WHERE {self.fts_table(index)} MATCH %s'
+            f') WHERE {keyset} ORDER BY rank, id LIMIT %s',
+            [expression, *params, limit],
+        )
+        return cursor.fetchall()
+
+    def highlights(self, cursor, index, query, ids):
+        fts = self.fts_table(index)
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(
+            f"SELECT rowid, snippet({fts}, -1, char(2), char(3), '…', 16) FROM {fts} "
+            f'WHERE {fts} MATCH %s AND rowid IN ({placeholders})',
+            [self.match_expression(query), *ids],
+        )
+        return dict(cursor.fetchall())
+
+
+class PostgresSearchBackend:
+    config = 'pg_catalog.english'
+
+    def document(self, index):
+        return " || ' ' || ".join(f"coalesce({field}, '')" for field in index.fields)
+
+    def install(self, cursor, index):
+        table, columns = index.table, ', '.join(index.fields)
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector')
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} USING GIN (search_vector)'
+        )
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_search_update ON {table}')
+        cursor.execute(
+            f'CREATE TRIGGER {table}_search_update BEFORE INSERT OR UPDATE OF {columns} ON {table} '
+            f"FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, '{self.config}', {columns})"
+        )
+
+    def uninstall(self, cursor, index):
+        table = index.table
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_search_update ON {table}')
+        cursor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+
+    def reindex(self, cursor, index, after, upto):
+        bounds, params = _range_condition('id', after, upto)
+        cursor.execute(
+            f"UPDATE {index.table} SET search_vector = to_tsvector('{self.config}', {self.document(index)}) "
+            f'WHERE {bounds}',
+            params,
+        )
+
+    def search(self, cursor, index, query, after, limit):
+        keyset, params = _keyset_condition(after)
+        cursor.execute(
+            f'SELECT id, rank FROM ('
+            f'SELECT id, -ts_rank_cd(search_vector, query)::float8 AS rank '
+            f"FROM {index.table}, websearch_to_tsquery('{self.config}', %s) query "
+            f'WHERE search_vector @@ query'
+            f') hits WHERE {keyset} ORDER BY rank, id LIMIT %s',
+            [query, *params, limit],
+        )
+        return cursor.fetchall()
+
+    def highlights(self, cursor, index, query, ids):
+        options = "'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxFragments=1, MaxWords=24, MinWords=8'"
+        cursor.execute(
+            f"SELECT id, ts_headline('{self.config}', {self.document(index)}, "
+            f"websearch_to_tsquery('{self.config}', %s), {options}) "
+            f'FROM {index.table} WHERE id = ANY(%s)',
+            [query, list(ids)],
+        )
+        return dict(cursor.fetchall())
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(connection):
+    try:
+        return BACKENDS[connection.vendor]()
+    except KeyError:
+        raise NotSupportedError(f'Full-text search is not available on {connection.vendor}.')
+
+
+def _range_condition(column, after, upto):
+    condition, params = f'{column} > %s', [after]
+    if upto is not None:
+        condition += f' AND {column} <= %s'
+        params.append(upto)
+    return condition, params
+
+
+def _keyset_condition(after):
+    if after is None:
+        return '1 = 1', []
+    rank, pk = after
+    return 'rank > %s OR (rank = %s AND id > %s)', [rank, rank, pk]
+
+
+def install(schema_editor, indexes=None):
+    """Create (or re-create) the search structures; a no-op on other databases."""
+    connection = schema_editor.connection
+    if connection.vendor not in BACKENDS:
+        return
+    backend = get_search_backend(connection)
+    with connection.cursor() as cursor:
+        for index in indexes or INDEXES.values():
+            backend.install(cursor, index)
+
+
+def uninstall(schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in BACKENDS:
+        return
+    backend = get_search_backend(connection)
+    with connection.cursor() as cursor:
+        for index in INDEXES.values():
+            backend.uninstall(cursor, index)
+
+
+def reindex(index, after, upto, using='default'):
+    """Rebuild the index entries for primary keys in ``(after, upto]``."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        get_search_backend(connection).reindex(cursor, index, after, upto)
+
+
+def highlight(text):
+    escaped = html.escape(text or '')
+    return escaped.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def search(index, query, after=None, limit=20):
+    """
+    Return ``[(pk, rank, highlight), ...]`` for the best matches of `query`
+    ranked after the ``(rank, pk)`` position `after`.
+    """
+    connection = connections[router.db_for_read(index.model)]
+    backend = get_search_backend(connection)
+    with connection.cursor() as cursor:
+        hits = backend.search(cursor, index, query, after, limit)
+        if not hits:
+            return []
+        snippets = backend.highlights(cursor, index, query, [pk for pk, _ in hits])
+    return [(pk, rank, highlight(snippets.get(pk))) for pk, rank in hits]
@@ -0,0 +1,335 @@
+"""
+Bulk synthetic data for staging and benchmark databases.
+
+``seed()`` generates users, follows, posts, likes and comments for chunks of
+``batch_size`` users at a time, each chunk written in its own transaction, so memory use does not grow with the size of the run. Chunks
+can be spread over several processes.
+
+* Rows are built as tuples and written with one executemany() per table
+  and chunk; see `_insert()`.
+* Every user shares one password hash, computed once.
+* Users and posts get explicit primary keys following the existing ones, so a
+  chunk can refer to rows written by another chunk without reading them back.
+* Counters and trending scores are computed while generating; follower counts,
+  which span chunks, are filled in by a later pass.
+* Model signals are muted while loading.
+
+Each chunk draws from its own ``Random('<seed>:<kind>:<first user>')``, so a
+seed and batch size always produce the same graph, whatever the number of
+processes.
+Timestamps are relative to the start of the run.
+"""
+import heapq
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+from . import trending
+from .models import Comment, Follow, Like, Post, TimelineEntry, User
+from .timeline import DatabaseTimelineBackend, get_timeline_backend, mark_skipped
+
+DEGREES = ('zipf', 'uniform')
+WORDS = (
+    'coffee morning deploy django python weekend hiking music release bug fix '
+    'conference talk community photo sunset dinner launch team remote learning '
+    'database query cache latency feed trending follow like comment'
+).split()
+# Odd prime used to scatter popularity ranks over the users; any n that is not
+# a multiple of it gets a permutation.
+SCATTER = 2654435761
+MODEL_SIGNALS = (pre_save, post_save, pre_delete, post_delete, m2m_changed)
+
+
+def username(pk):
+    return f'seed{pk}'
+
+
+class SeedPlan:
+    def __init__(
+        self, users, follows_per_user, posts_per_user, likes_per_post, comments_per_post,
+        degree, days, seed, password,
+    ):
+        if degree not in DEGREES:
+            raise ValueError(f'degree must be one of {", ".join(DEGREES)}')
+        self.users = users
+        self.follows_per_user = follows_per_user
+        self.posts_per_user = posts_per_user
+        self.likes_per_post = likes_per_post
+        self.comments_per_post = comments_per_post
+        self.degree = degree
+        self.days = days
+        self.seed = seed
+        self.password = password
+        self.now = timezone.now()
+        self.user_base = User.objects.aggregate(last=Max('pk'))['last'] or 0
+        self.post_base = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    @property
+    def user_ids(self):
+        return range(self.user_base + 1, self.user_base + self.users + 1)
+
+    @property
+    def post_ids(self):
+        return range(self.post_base + 1, self.post_base + self.users * self.posts_per_user + 1)
+
+    def user_pk(self, index):
+        return self.user_base + index + 1
+
+    def rng(self, kind, start):
+        return random.Random(f'{self.seed}:{kind}:{start}')
+
+    def pick_user(self, rng):
+        """Index of a user to follow, like or comment as; popular users first under "zipf"."""
+        if self.degree == 'uniform':
+            return rng.randrange(self.users)
+        # P(rank = k) ~ 1/k, by inverting the continuous CDF log(k) / log(n).
+        rank = int(self.users ** rng.random()) - 1
+        return rank * SCATTER % self.users
+
+
+def _geometric(rng, mean):
+    """A count with the given mean, small values most likely."""
+    if mean <= 0:
+        return 0
+    return int(math.log(1 - rng.random()) / math.log(mean / (mean + 1)))
+
+
+def _text(rng, low=5, high=30):
+    return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+@contextmanager
+def signals_muted():
+    saved = [(signal, signal.receivers) for signal in MODEL_SIGNALS]
+    for signal, _ in saved:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+
+def _insert(model, fields, rows):
+    """
+    INSERT `rows`, tuples of database values for `fields`, in one executemany().
+
+    This is the statement bulk_create() sends, minus building a model instance
+    and compiling each of its values, which cost several times the insert.
+    """
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})', rows
+        )
+
+
+def seed_users(plan, start, stop):
+    rng = plan.rng('users', start)
+    joined = connection.ops.adapt_datetimefield_value(plan.now - timedelta(days=plan.days))
+    users = [
+        (
+            plan.user_pk(index), username(plan.user_pk(index)), f'{username(plan.user_pk(index))}@example.com',
+            plan.password, _text(rng, 0, 12), joined, joined, False, False, True, '', '', 0, False,
+        )
+        for index in range(start, stop)
+    ]
+    fields = (
+        'id', 'username', 'email', 'password', 'bio', 'date_joined', 'updated_at',
+        'is_superuser', 'is_staff', 'is_active', 'first_name', 'last_name', 'followers_count',
+        'skipped_fanout',
+    )
+    with transaction.atomic():
+        _insert(User, fields, users)
+    return {'users': len(users)}
+
+
+def seed_follows(plan, start, stop):
+    rng = plan.rng('follows', start)
+    now = connection.ops.adapt_datetimefield_value(plan.now)
+    follows = []
+    for index in range(start, stop):
+        if plan.degree == 'zipf':
+            # Pareto with shape 2 has mean 2 * scale.
+            wanted = int(rng.paretovariate(2) * plan.follows_per_user / 2)
+        else:
+            wanted = plan.follows_per_user
+        wanted = min(wanted, plan.users - 1)
+        targets = set()
+        # Popular users come up again and again; give up on the tail rather
+        # than loop on a small graph.
+        for _ in range(wanted * 4):
+            if len(targets) >= wanted:
+                break
+            target = plan.pick_user(rng)
+            if target != index:
+                targets.add(target)
+        follows.extend(
+            (plan.user_pk(index), plan.user_pk(target), now) for target in sorted(targets)
+        )
+    with transaction.atomic():
+        _insert(Follow, ('follower_id', 'following_id', 'created_at'), follows)
+    return {'follows': len(follows)}
+
+
+def seed_posts(plan, start, stop):
+    """Posts of users ``start:stop`` with their likes and comments."""
+    rng = plan.rng('posts', start)
+    span = plan.days * 86400
+    as_db = connection.ops.adapt_datetimefield_value
+    now = as_db(plan.now)
+    posts, likes, comments, events = [], [], [], []
+    for index in range(start, stop):
+        for n in range(plan.posts_per_user):
+            pk = plan.post_base + index * plan.posts_per_user + n + 1
+            created_at = plan.now - timedelta(seconds=rng.uniform(0, span))
+            age = (plan.now - created_at).total_seconds()
+            likers = rng.sample(range(plan.users), min(_geometric(rng, plan.likes_per_post), plan.users))
+            for liker in likers:
+                at = created_at + timedelta(seconds=rng.uniform(0, age))
+                likes.append((plan.user_pk(liker), pk, as_db(at)))
+                events.append((pk, 'like', at))
+            comment_count = _geometric(rng, plan.comments_per_post)
+            for _ in range(comment_count):
+                at = created_at + timedelta(seconds=rng.uniform(0, age))
+                comments.append((plan.user_pk(plan.pick_user(rng)), pk, _text(rng, 1, 12), as_db(at), as_db(at)))
+                events.append((pk, 'comment', at))
+            events.append((pk, 'post', created_at))
+            posts.append([
+                pk, plan.user_pk(index), _text(rng), as_db(created_at), now, len(likers), comment_count,
+            ])
+
+    scores = trending.compute_scores(events)
+    for post in posts:
+        post.append(scores[post[0]])
+    with transaction.atomic():
+        _insert(Post, (
+            'id', 'user_id', 'content', 'created_at', 'updated_at', 'likes_count', 'comments_count',
+            'trending_score',
+        ), posts)
+        _insert(Like, ('user_id', 'post_id', 'created_at'), likes)
+        _insert(Comment, ('user_id', 'post_id', 'content', 'created_at', 'updated_at'), comments)
+    return {'posts': len(posts), 'likes': len(likes), 'comments': len(comments)}
+
+
+def count_followers(plan, start, stop):
+    followers = Follow.objects.filter(following_id=OuterRef('pk')).order_by().values('following_id')
+    User.objects.filter(pk__gte=plan.user_pk(start), pk__lte=plan.user_pk(stop - 1)).update(
+        followers_count=Coalesce(Subquery(followers.annotate(n=Count('pk')).values('n')), 0)
+    )
+    return {}
+
+
+def fill_timelines(plan, start, stop):
+    """What ``rebuild_timelines`` writes for users ``start:stop``, in bulk."""
+    follows = Follow.objects.filter(
+        follower_id__gte=plan.user_pk(start),
+        follower_id__lte=plan.user_pk(stop - 1),
+        following__followers_count__lt=settings.TIMELINE_FANOUT_THRESHOLD,
+    )
+    recent = {}
+    posts = (
+        Post.objects.filter(user_id__in=follows.values('following_id'))
+        .order_by('user_id', '-created_at', '-id')
+        .values_list('user_id', 'created_at', 'id')
+    )
+    for author_id, created_at, post_id in posts.iterator(chunk_size=10000):
+        by_author = recent.setdefault(author_id, [])
+        if len(by_author) < settings.TIMELINE_BACKFILL_SIZE:
+            by_author.append((created_at, post_id))
+    timelines = defaultdict(list)
+    for owner_id, author_id in follows.values_list('follower_id', 'following_id'):
+        timelines[owner_id].extend((*post, author_id) for post in recent.get(author_id, ()))
+    as_db = connection.ops.adapt_datetimefield_value
+    entries = [
+        (owner_id, post_id, author_id, as_db(created_at))
+        for owner_id, timeline in timelines.items()
+        for created_at, post_id, author_id in heapq.nlargest(settings.TIMELINE_SIZE, timeline)
+    ]
+    with transaction.atomic():
+        _insert(TimelineEntry, ('owner_id', 'post_id', 'author_id', 'created_at'), entries)
+        mark_skipped(User.objects.filter(pk__gte=plan.user_pk(start), pk__lte=plan.user_pk(stop - 1)))
+    return {'timeline entries': len(entries)}
+
+
+def _run_chunk(task, plan, start, stop):
+    # Rows are generated outside the transaction, so that on SQLite a chunk
+    # only holds the write lock while it writes.
+    with signals_muted():
+        return task(plan, start, stop)
+
+
+def _setup_worker():
+    import django
+    django.setup()
+
+
+def seed(
+    users=1000, follows_per_user=20, posts_per_user=5, likes_per_post=5, comments_per_post=2,
+    degree='zipf', days=30, seed=0, password='password', batch_size=1000, processes=1,
+    timelines=False, log=None,
+):
+    """
+    Load a synthetic graph and return its `SeedPlan`.
+
+    With `timelines`, home timelines are filled too (database timeline backend
+    only). `log` is called with ``(step, {kind: rows})`` after each step.
+    """
+    if timelines and not isinstance(get_timeline_backend(), DatabaseTimelineBackend):
+        raise ValueError('Timelines can only be seeded into the database timeline backend.')
+    plan = SeedPlan(
+        users, follows_per_user, posts_per_user, likes_per_post, comments_per_post,
+        degree, days, seed, make_password(password),
+    )
+    steps = [
+        ('users', [seed_users]),
+        ('follows and posts', [seed_follows, seed_posts]),
+        ('counters', [count_followers]),
+    ]
+    if timelines:
+        steps.append(('timelines', [fill_timelines]))
+    chunks = [(start, min(start + batch_size, users)) for start in range(0, users, batch_size)]
+
+    executor = None
+    if processes > 1:
+        # Workers must not inherit open connections.
+        connections.close_all()
+        executor = ProcessPoolExecutor(processes, initializer=_setup_worker)
+    try:
+        for step, tasks in steps:
+            jobs = [(task, plan, start, stop) for task in tasks for start, stop in chunks]
+            if executor:
+                results = list(executor.map(_run_chunk, *zip(*jobs)))
+            else:
+                results = [_run_chunk(*job) for job in jobs]
+            totals = {}
+            for result in results:
+                for kind, rows in result.items():
+                    totals[kind] = totals.get(kind, 0) + rows
+            if log:
+                log(step, totals)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    # Explicit primary keys leave PostgreSQL's sequences behind.
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [User, Post]):
+            cursor.execute(sql)
+    return plan
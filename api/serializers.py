@@ -1,32 +1,48 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import models
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from .cache import CachedListSerializer, CachedRepresentationMixin
+from .metrics import MeasuredSerializerMixin
 from .models import Post, Comment, Like, Follow
+from .revocation import is_token_revoked
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(MeasuredSerializerMixin, CachedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'bio')
         read_only_fields = ('id',)
+        list_serializer_class = CachedListSerializer
+        cache_version = ('updated_at',)
 
-class PostSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Takes ``fields=`` to render only some of Meta.fields; ``id`` is always kept."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse_fields = None if fields is None else frozenset(('id', *fields))
+        if self.sparse_fields is not None:
+            for name in list(self.fields):
+                if name not in self.sparse_fields:
+                    self.fields.pop(name)
+
+class PostSerializer(MeasuredSerializerMixin, SparseFieldsMixin, CachedRepresentationMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    likes_count = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
         fields = ('id', 'user', 'content', 'created_at', 'updated_at', 'likes_count', 'comments_count')
-        read_only_fields = ('id', 'user', 'created_at', 'updated_at')
-
-    def get_likes_count(self, obj):
-        return obj.likes.count()
+        read_only_fields = ('id', 'user', 'created_at', 'updated_at', 'likes_count', 'comments_count')
+        list_serializer_class = CachedListSerializer
+        cached_relations = ('user',)
+        # Likes and comments update the counters without touching updated_at.
+        cache_version = ('updated_at', 'likes_count', 'comments_count')
 
-    def get_comments_count(self, obj):
-        return obj.comments.count()
-
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
@@ -34,14 +50,28 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'post', 'content', 'created_at')
         read_only_fields = ('id', 'user', 'post', 'created_at')
 
-class LikeSerializer(serializers.ModelSerializer):
+class LikeSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Like
         fields = ('id', 'user', 'post', 'created_at')
         read_only_fields = ('id', 'user', 'created_at')
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Follow
         fields = ('id', 'follower', 'following', 'created_at')
-        read_only_fields = ('id', 'follower', 'created_at') 
\ No newline at end of file
+        read_only_fields = ('id', 'follower', 'created_at') 
+
+class RevocationAwareTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        if is_token_revoked(self.token_class(attrs['refresh'])):
+            raise InvalidToken('Token has been revoked')
+        return super().validate(attrs)
+
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        # Primary keys are BigAutoFields; larger ids cannot even be queried.
+        child=serializers.IntegerField(min_value=1, max_value=models.BigIntegerField.MAX_BIGINT),
+        allow_empty=False,
+        max_length=settings.BULK_ACTION_MAX_IDS,
+    )
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .authentication import user_state
+from .models import Post, User
+from .timeline import get_timeline_backend
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    metrics.install(connection)
+
+
+@receiver(post_delete, sender=Post)
+def prune_post_from_timelines(sender, instance, **kwargs):
+    get_timeline_backend().remove_post(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def drop_user_timeline(sender, instance, **kwargs):
+    get_timeline_backend().remove_owner(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user_state(sender, instance, **kwargs):
+    transaction.on_commit(lambda: user_state.forget(instance.pk))
+
+
+# Cached representations need no receivers: their keys carry the version of
+# the row they were rendered from, so a like, comment or edit makes readers
+# look up a new key (see api/cache.py).
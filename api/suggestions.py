@@ -0,0 +1,148 @@
+"""
+"Who to follow" suggestions.
+
+A user's candidates are the accounts followed by the accounts they follow,
+scored by how many of those paths lead to each candidate (friend-of-friend
+count). The top ``SUGGESTIONS_TOP_K`` per user are stored in
+``FollowSuggestion``:
+
+* ``manage.py compute_suggestions`` recomputes everyone, by default by loading
+  the follow graph into NumPy CSR arrays and squaring the adjacency matrix a
+  chunk of rows at a time;
+* ``update_suggestions`` patches the stored rows after follows change.
+
+Incremental updates may leave more than K rows for a user, or a candidate that
+would since have dropped out of the top K; the next batch run trims both.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Follow, FollowSuggestion
+from .tasks import task
+
+
+def top_candidates(user_id, limit):
+    """Return ``[(candidate_id, score), ...]`` for one user, computed in SQL."""
+    followed = Follow.objects.filter(follower_id=user_id).values('following_id')
+    return list(
+        Follow.objects.filter(follower_id__in=followed)
+        .exclude(following_id=user_id)
+        .exclude(following_id__in=followed)
+        .values('following_id')
+        .annotate(score=Count('pk'))
+        .order_by('-score', 'following_id')
+        .values_list('following_id', 'score')[:limit]
+    )
+
+
+def replace_suggestions(suggestions_by_user):
+    """Store ``{user_id: [(candidate_id, score), ...]}``, best first."""
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=list(suggestions_by_user)).delete()
+        FollowSuggestion.objects.bulk_create(
+            [
+                FollowSuggestion(user_id=user_id, suggested_id=candidate_id, score=score)
+                for user_id, candidates in suggestions_by_user.items()
+                for candidate_id, score in candidates
+            ],
+            batch_size=1000,
+        )
+
+
+def refresh_user(user_id):
+    replace_suggestions({user_id: top_candidates(user_id, settings.SUGGESTIONS_TOP_K)})
+
+
+@task
+def update_suggestions(follower_id, followed_ids=(), unfollowed_ids=()):
+    """Apply follows made or undone by `follower_id` to stored suggestions."""
+    refresh_user(follower_id)
+
+    # Everyone who follows `follower_id` gains (or loses) one path to each
+    # account it followed (or unfollowed).
+    audience = Follow.objects.filter(following_id=follower_id).values('follower_id')
+    for followed_id in followed_ids:
+        with transaction.atomic():
+            existing = FollowSuggestion.objects.filter(user_id__in=audience, suggested_id=followed_id)
+            existing.update(score=F('score') + 1)
+            new_user_ids = (
+                Follow.objects.filter(following_id=follower_id)
+                .exclude(follower_id=followed_id)
+                .exclude(follower_id__in=Follow.objects.filter(following_id=followed_id).values('follower_id'))
+                .exclude(follower_id__in=existing.values('user_id'))
+                .values_list('follower_id', flat=True)
+            )
+            FollowSuggestion.objects.bulk_create(
+                [
+                    FollowSuggestion(user_id=user_id, suggested_id=followed_id, score=1)
+                    for user_id in new_user_ids
+                ],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+    for unfollowed_id in unfollowed_ids:
+        with transaction.atomic():
+            existing = FollowSuggestion.objects.filter(user_id__in=audience, suggested_id=unfollowed_id)
+            existing.filter(score__lte=1).delete()
+            existing.update(score=F('score') - 1)
+
+
+def load_graph():
+    """
+    Load the follow graph as CSR arrays.
+
+    Returns ``(user_ids, indptr, indices)``: users are renumbered densely by
+    position in the sorted ``user_ids``, and the accounts followed by user
+    ``i`` are ``indices[indptr[i]:indptr[i + 1]]``, sorted.
+    """
+    import numpy as np
+
+    edges = Follow.objects.order_by().values_list('follower_id', 'following_id')
+    flat = np.fromiter(
+        (user_id for edge in edges.iterator(chunk_size=10000) for user_id in edge),
+        dtype=np.int64,
+    )
+    user_ids, dense = np.unique(flat, return_inverse=True)
+    sources, targets = dense[0::2], dense[1::2]
+    order = np.lexsort((targets, sources))
+    indices = targets[order]
+    indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(user_ids)), out=indptr[1:])
+    return user_ids, indptr, indices
+
+
+def top_candidates_for_rows(indptr, indices, start, stop, limit):
+    """
+    Square the adjacency matrix for rows ``start:stop``.
+
+    Returns parallel ``(rows, candidates, scores)`` arrays holding each row's
+    best `limit` candidates, best first, excluding the row itself and accounts
+    it already follows.
+    """
+    import numpy as np
+
+    size = len(indptr) - 1
+    degrees = np.diff(indptr)
+    first_edge, last_edge = indptr[start], indptr[stop]
+    edge_rows = np.repeat(np.arange(start, stop), degrees[start:stop])
+    middles = indices[first_edge:last_edge]
+
+    # Expand every (row -> middle) edge into middle's own adjacency list.
+    lengths = degrees[middles]
+    total = int(lengths.sum())
+    rows = np.repeat(edge_rows, lengths)
+    offsets = np.repeat(indptr[middles] - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+    candidates = indices[offsets]
+
+    keys = rows * size + candidates
+    followed = edge_rows * size + middles
+    keep = (candidates != rows) & ~np.isin(keys, followed)
+    keys, scores = np.unique(keys[keep], return_counts=True)
+    rows, candidates = np.divmod(keys, size)
+
+    order = np.lexsort((candidates, -scores, rows))
+    rows, candidates, scores = rows[order], candidates[order], scores[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    best = rank < limit
+    return rows[best], candidates[best], scores[best]
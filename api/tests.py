@@ -1,3 +1,1316 @@
-from django.test import TestCase
+import ast
+import base64
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import AsyncRequestFactory, override_settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import async_views, buckets, fastjson, fastserializers, metrics, realtime, seeding, tasks
+from .authentication import user_state
+from .revocation import BloomFilter, registry
+from .throttling import ScopedRateThrottle, SlidingWindowRateThrottle, TokenBucketRateThrottle
+from .cache import get_cache
+from .models import (
+    Comment, Follow, FollowSuggestion, Like, Post, RevokedToken, Task, TimelineEntry,
+)
+from .serializers import CommentSerializer, PostSerializer, UserSerializer
+
+User = get_user_model()
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SocialAPITestCase(APITestCase):
+    def make_user(self, username):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com', password='pass12345'
+        )
+
+    def follow(self, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/users/{user.pk}/follow/')
+
+    def setUp(self):
+        cache.clear()
+        get_cache().clear()
+        caches[settings.THROTTLE_CACHE_ALIAS].clear()
+        user_state.clear()
+        registry.reset()
+        self.alice = self.make_user('alice')
+        self.bob = self.make_user('bob')
+        self.client.force_authenticate(self.alice)
+
+
+class CounterTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(user=self.bob, content='hello')
+
+    def test_like_and_unlike_maintain_counter(self):
+        response = self.client.post(f'/api/posts/{self.post.pk}/like/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.post(f'/api/posts/{self.post.pk}/like/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        response = self.client.post(f'/api/posts/{self.post.pk}/unlike/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(f'/api/posts/{self.post.pk}/unlike/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_comment_create_and_delete_maintain_counter(self):
+        url = f'/api/posts/{self.post.pk}/comments/'
+        response = self.client.post(url, {'content': 'nice'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+        self.client.delete(f"{url}{response.data['id']}/")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_reconcile_counters_repairs_drift(self):
+        Like.objects.create(user=self.alice, post=self.post)
+        Comment.objects.create(user=self.alice, post=self.post, content='a')
+        Comment.objects.create(user=self.bob, post=self.post, content='b')
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 2))
+
+    def test_feed_query_count_is_constant(self):
+        self.follow(self.bob)
+
+        def feed_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get('/api/posts/')
+            return len(ctx)
+
+        baseline = feed_queries()
+        for i in range(10):
+            post = Post.objects.create(user=self.make_user(f'user{i}'), content='x')
+            self.follow(post.user)
+        self.assertEqual(feed_queries(), baseline)
+
+
+class FeedPaginationTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        created_at = timezone.now()
+        # Identical timestamps force the cursor to break ties on id.
+        self.posts = [
+            Post.objects.create(user=self.bob, content=str(i), created_at=created_at)
+            for i in range(5)
+        ]
+        self.follow(self.bob)
+
+    def test_walks_every_post_once_in_order(self):
+        seen = []
+        url = '/api/posts/?page_size=2'
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(any('OFFSET' in q['sql'] for q in ctx.captured_queries))
+            seen.extend(post['id'] for post in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, sorted((p.pk for p in self.posts), reverse=True))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/posts/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_malformed_cursor_values_are_rejected(self):
+        post = self.posts[0].pk
+        # Nulls, containers, booleans, non-finite and out-of-range numbers.
+        malformed = ['[[1],3]', '[Infinity,3]', '[NaN,3]', '[null,3]', '[true,3]', '[{"a":1},3]', '[1,null]',
+                     '[1,9223372036854775808]']
+        dated = ['[1.5,3]', '["2024-01-01T00:00:00+00:00",[3]]']
+        for url, payloads in (
+            ('/api/posts/', malformed + dated),
+            ('/api/posts/trending/', malformed),  # ordered by an annotated score first
+            (f'/api/posts/{post}/comments/', malformed + dated),
+        ):
+            for payload in payloads:
+                with self.subTest(url=url, payload=payload):
+                    token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+                    response = self.client.get(f'{url}?cursor={token}')
+                    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CommentThreadTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(user=self.bob, content='viral')
+        self.other = Post.objects.create(user=self.bob, content='quiet')
+        created_at = timezone.now()
+        self.comments = [
+            Comment.objects.create(
+                user=self.make_user(f'c{i}'), post=self.post, content=str(i), created_at=created_at
+            )
+            for i in range(5)
+        ]
+        Comment.objects.create(user=self.alice, post=self.other, content='first')
+
+    def test_walks_thread_oldest_first_with_constant_queries(self):
+        seen, counts = [], []
+        url = f'/api/posts/{self.post.pk}/comments/?page_size=2'
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            counts.append(len(ctx))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(comment['id'] for comment in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [c.pk for c in self.comments])
+        self.assertEqual(len(set(counts)), 1)
+        self.assertEqual(response.data['results'][0]['user']['username'], 'c4')
+
+    def test_feed_embeds_previews_in_one_query(self):
+        self.follow(self.bob)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/posts/')
+        baseline = len(ctx)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/posts/?preview_comments=2')
+        self.assertEqual(len(ctx), baseline + 1)
+        previews = {post['id']: post['top_comments'] for post in response.data['results']}
+        self.assertEqual([c['id'] for c in previews[self.post.pk]], [c.pk for c in self.comments[:2]])
+        self.assertEqual([c['content'] for c in previews[self.other.pk]], ['first'])
+
+        response = self.client.get(f'/api/posts/{self.post.pk}/?preview_comments=1')
+        self.assertEqual([c['id'] for c in response.data['top_comments']], [self.comments[0].pk])
+        self.assertNotIn('top_comments', self.client.get(f'/api/posts/{self.post.pk}/').data)
+
+
+class ConditionalGetTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(user=self.bob, content='hello')
+        self.comment = Comment.objects.create(user=self.bob, post=self.post, content='first')
+        self.follow(self.bob)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_responses_are_not_modified_before_serializing(self):
+        # The home feed reads its page of ids (merged authors, timeline) before the posts.
+        for url, queries in [
+            ('/api/posts/', 3), ('/api/posts/?preview_comments=1', 4), (f'/api/posts/{self.post.pk}/', 1),
+            (f'/api/posts/{self.post.pk}/comments/', 1), (f'/api/posts/{self.post.pk}/comments/{self.comment.pk}/', 1),
+            (f'/api/users/{self.bob.pk}/', 1), ('/api/posts/trending/', 1),
+        ]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertIn('private', response['Cache-Control'])
+                with CaptureQueriesContext(connection) as ctx, \
+                        mock.patch('api.serializers.PostSerializer.to_representation') as serialize:
+                    revalidated = self.revalidate(url, response['ETag'])
+                self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEqual(revalidated['ETag'], response['ETag'])
+                self.assertEqual(revalidated.content, b'')
+                self.assertFalse(serialize.called)
+                self.assertLessEqual(len(ctx), queries)
+
+    def test_changes_give_new_etags(self):
+        urls = ['/api/posts/?preview_comments=1', f'/api/posts/{self.post.pk}/comments/']
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+
+        def assert_changed(*changed):
+            for url in urls:
+                response = self.revalidate(url, etags[url])
+                expected = status.HTTP_200_OK if url in changed else status.HTTP_304_NOT_MODIFIED
+                self.assertEqual(response.status_code, expected, url)
+                etags[url] = response.get('ETag', etags[url])
+
+        self.client.post(f'/api/posts/{self.post.pk}/like/')
+        assert_changed(urls[0])
+        self.client.force_authenticate(self.bob)
+        self.client.patch(f'/api/posts/{self.post.pk}/comments/{self.comment.pk}/', {'content': 'edited'})
+        self.client.force_authenticate(self.alice)
+        assert_changed(*urls)
+        self.client.force_authenticate(self.bob)
+        self.client.patch(f'/api/users/{self.bob.pk}/', {'bio': 'new bio'})
+        self.client.force_authenticate(self.alice)
+        assert_changed(*urls)
+        self.client.delete(f'/api/posts/{self.post.pk}/comments/{self.comment.pk}/')
+        assert_changed(*urls)
+
+    def test_profiles_honour_if_modified_since(self):
+        url = f'/api/users/{self.bob.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=60')
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        User.objects.filter(pk=self.bob.pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            status.HTTP_200_OK,
+        )
+        self.assertNotIn('Last-Modified', self.client.get(f'/api/posts/{self.post.pk}/'))
+
+
+class FieldsetTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.carol = self.make_user('carol')
+        self.posts = [Post.objects.create(user=author, content='hi') for author in (self.bob, self.bob, self.carol)]
+        Comment.objects.create(user=self.alice, post=self.posts[0], content='first')
+        self.follow(self.bob)
+        self.follow(self.carol)
+
+    def test_sparse_fields_narrow_the_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/posts/?fields=likes_count,comments_count')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [set(post) for post in response.data['results']], [{'id', 'likes_count', 'comments_count'}] * 3
+        )
+        feed_query = [q['sql'] for q in ctx.captured_queries if '"api_post"."likes_count"' in q['sql']][0]
+        self.assertNotIn('"api_post"."content"', feed_query)
+        self.assertNotIn('"api_user"', feed_query.split(' WHERE ')[0])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/posts/{self.posts[0].pk}/?fields=user,content')
+        self.assertEqual(list(response.data), ['id', 'user', 'content'])
+        self.assertEqual(response.data['user']['username'], 'bob')
+        self.assertEqual(len(ctx), 1)
+
+        response = self.client.get('/api/posts/?fields=content,password')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', response.data['fields'][0])
+
+    def test_normalized_pages_list_each_author_once(self):
+        response = self.client.get('/api/posts/?mode=normalized&preview_comments=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([post['user'] for post in results], [self.carol.pk, self.bob.pk, self.bob.pk])
+        self.assertEqual(results[2]['top_comments'][0]['user'], self.alice.pk)
+        self.assertEqual(
+            response.data['users'],
+            [{'id': user.pk, 'username': user.username, 'bio': ''} for user in (self.carol, self.bob, self.alice)],
+        )
+        nested = self.client.get('/api/posts/?preview_comments=1').data['results']
+        self.assertEqual([post['content'] for post in results], [post['content'] for post in nested])
+        self.assertEqual(self.client.get('/api/posts/?mode=flat').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TimelineTests(SocialAPITestCase):
+    def feed_ids(self):
+        return [post['id'] for post in self.client.get('/api/posts/').data['results']]
+
+    def publish(self, user, content='hi'):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/', {'content': content})
+        self.client.force_authenticate(self.alice)
+        return response.data['id']
+
+    def test_follow_backfills_and_posts_fan_out(self):
+        old = Post.objects.create(user=self.bob, content='old').pk
+        self.follow(self.bob)
+        new = self.publish(self.bob)
+        self.assertEqual(self.feed_ids(), [new, old])
+
+    def test_unfollow_and_delete_prune_timeline(self):
+        self.follow(self.bob)
+        first = self.publish(self.bob)
+        second = self.publish(self.bob)
+        Post.objects.filter(pk=first).delete()
+        self.assertEqual(self.feed_ids(), [second])
+        self.client.post(f'/api/users/{self.bob.pk}/unfollow/')
+        self.assertEqual(self.feed_ids(), [])
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    def test_popular_authors_are_merged_on_read(self):
+        self.follow(self.bob)
+        post = self.publish(self.bob)
+        self.assertFalse(TimelineEntry.objects.filter(post_id=post).exists())
+        self.assertEqual(self.feed_ids(), [post])
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=2)
+    def test_posts_skipped_on_write_stay_merged_below_the_threshold(self):
+        carol = self.make_user('carol')
+        self.follow(self.bob)
+        self.client.force_authenticate(carol)
+        self.follow(self.bob)
+        post = self.publish(self.bob)
+        self.assertEqual(self.feed_ids(), [post])
+        self.client.force_authenticate(carol)
+        self.client.post(f'/api/users/{self.bob.pk}/unfollow/')
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.feed_ids(), [post])
+
+    @override_settings(TIMELINE_SIZE=2)
+    def test_timelines_keep_the_newest_entries(self):
+        self.follow(self.bob)
+        posts = [self.publish(self.bob) for _ in range(3)]
+        self.assertEqual(self.feed_ids(), posts[:0:-1])
+        self.client.post(f'/api/users/{self.bob.pk}/unfollow/')
+        self.follow(self.bob)
+        self.assertEqual(self.feed_ids(), posts[:0:-1])
+
+    def mixed_feed(self):
+        """Alice's feed of bob's fanned-out posts and carol's merged ones, newest first."""
+        carol = self.make_user('carol')
+        self.follow(self.bob)
+        self.follow(carol)
+        self.client.force_authenticate(self.bob)
+        self.follow(carol)
+        with self.settings(TIMELINE_FANOUT_THRESHOLD=2):
+            posts = [self.publish(author) for author in (self.bob, carol, carol, self.bob, carol)]
+        return posts[::-1]
+
+    def test_feed_pages_merge_timeline_and_pulled_authors(self):
+        posts = self.mixed_feed()
+        ids = []
+        url = '/api/posts/?page_size=2'
+        with self.settings(TIMELINE_FANOUT_THRESHOLD=2):
+            while url:
+                response = self.client.get(url)
+                ids += [post['id'] for post in response.data['results']]
+                url = response.data['next']
+        self.assertEqual(ids, posts)
+
+    def test_feed_pages_are_index_ranges(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is SQLite')
+        self.mixed_feed()
+        with self.settings(TIMELINE_FANOUT_THRESHOLD=2):
+            cursor = self.client.get('/api/posts/?page_size=2').data['next']
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(cursor)
+        with connection.cursor() as db:
+            for query in ctx.captured_queries:
+                db.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                plan = ' / '.join(row[3] for row in db.fetchall())
+                self.assertNotIn('TEMP B-TREE', plan, query['sql'])
+                self.assertNotIn('SCAN', plan, query['sql'])
+
+
+@override_settings(TIMELINE_BACKEND='api.timeline.LocMemTimelineBackend')
+class LocMemTimelineTests(TimelineTests):
+    pass
+
+
+
+@tasks.task
+def failing_task():
+    raise RuntimeError('boom')
+
+
+@override_settings(TASKS_EAGER=False, TASK_MAX_ATTEMPTS=2)
+class TaskQueueTests(SocialAPITestCase):
+    def drain(self):
+        for pk in tasks.claim_tasks(10):
+            tasks.run_task(pk)
+
+    def test_post_creation_only_enqueues_fan_out(self):
+        self.follow(self.bob)
+        self.assertEqual(Task.objects.count(), 2)  # the follow's backfill and suggestions update
+        self.drain()
+        self.client.force_authenticate(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/', {'content': 'queued'})
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.drain()
+        self.assertTrue(
+            TimelineEntry.objects.filter(owner=self.alice, post_id=response.data['id']).exists()
+        )
+        self.assertFalse(Task.objects.exists())
+
+    def test_failures_are_retried_with_backoff_then_marked_failed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            failing_task.delay()
+        job = Task.objects.get()
+        with self.assertLogs('api.tasks', 'WARNING'):
+            tasks.run_task(tasks.claim_tasks(10)[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.PENDING, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertEqual(tasks.claim_tasks(10), [])
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('api.tasks', 'ERROR'):
+            self.drain()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Task.FAILED, 2))
+
+    def test_every_task_is_registered_by_django_setup(self):
+        # Worker processes only run django.setup(), so the app must import every task module.
+        app_dir = os.path.dirname(__file__)
+        declared = set()
+        for filename in os.listdir(app_dir):
+            if not filename.endswith('.py') or filename == 'tests.py':
+                continue
+            with open(os.path.join(app_dir, filename)) as f:
+                tree = ast.parse(f.read())
+            declared.update(
+                f'api.{filename[:-3]}.{node.name}'
+                for node in tree.body
+                if isinstance(node, ast.FunctionDef)
+                and any(isinstance(d, ast.Name) and d.id == 'task' for d in node.decorator_list)
+            )
+        output = subprocess.run(
+            [sys.executable, '-c', 'import django, json; django.setup(); '
+             'from api import tasks; print(json.dumps(sorted(tasks._registry)))'],
+            cwd=os.path.dirname(app_dir), env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'backend.settings'},
+            capture_output=True, text=True, check=True,
+        ).stdout
+        self.assertIn('api.suggestions.update_suggestions', declared)
+        self.assertEqual(set(json.loads(output.splitlines()[-1])), declared)
+
+
+# Lists only go through the cache when they are rendered by the serializers.
+@override_settings(FAST_READ_SERIALIZERS=False)
+class RepresentationCacheTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(user=self.bob, content='cached')
+        self.follow(self.bob)
+
+    def feed(self):
+        return self.client.get('/api/posts/').data['results']
+
+    def test_feed_is_served_from_cache(self):
+        first = self.feed()
+        Post.objects.filter(pk=self.post.pk).update(content='changed behind our back')
+        self.assertEqual(self.feed(), first)
+        self.assertEqual(first[0]['user']['username'], 'bob')
+
+    def test_writes_invalidate_cached_representations(self):
+        self.feed()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/posts/{self.post.pk}/like/')
+        self.assertEqual(self.feed()[0]['likes_count'], 1)
+
+        self.client.force_authenticate(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/users/{self.bob.pk}/', {'bio': 'new bio'})
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.feed()[0]['user']['bio'], 'new bio')
+
+    def test_rows_read_before_a_write_do_not_refill_the_cache(self):
+        stale = Post.objects.select_related('user').get(pk=self.post.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/posts/{self.post.pk}/like/')
+        # A reader that loaded the post before the like renders it afterwards.
+        PostSerializer(stale).data
+        self.assertEqual(self.feed()[0]['likes_count'], 1)
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.pk}/').data['likes_count'], 1)
+
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            file_cache = {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }
+            buckets = {**file_cache, 'BACKEND': 'api.buckets.TokenBucketFileBasedCache'}
+            with self.settings(CACHES={'default': file_cache, 'representations': file_cache, 'throttles': buckets}):
+                first = self.feed()
+                Post.objects.filter(pk=self.post.pk).update(content='stale')
+                self.assertEqual(self.feed(), first)
+
+
+class ThrottleTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(user=self.bob, content='hello')
+        rates = {'read': '3/min', 'write': '2/min', 'feed': '1/min', 'auth': '2/min'}
+        for patcher in (
+            mock.patch.dict(ScopedRateThrottle.THROTTLE_RATES, rates),
+            # The clock only moves when a test moves it.
+            mock.patch.object(TokenBucketRateThrottle, 'timer', return_value=1000.0),
+        ):
+            self.clock = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self):
+        return self.client.post('/api/posts/', {'content': 'hello'})
+
+    def test_bucket_bursts_then_refills(self):
+        self.assertEqual(self.write().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.write().status_code, status.HTTP_201_CREATED)
+        response = self.write()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        self.clock.return_value = 1015.0
+        self.assertEqual(self.write()['Retry-After'], '15')
+        self.clock.return_value = 1030.0
+        self.assertEqual(self.write().status_code, status.HTTP_201_CREATED)
+
+    def test_scopes_and_users_have_separate_budgets(self):
+        self.assertEqual(self.client.get('/api/posts/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/posts/trending/').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.get(f'/api/posts/{self.post.pk}/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.write().status_code, status.HTTP_201_CREATED)
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.client.get('/api/posts/').status_code, status.HTTP_200_OK)
+
+    def test_anonymous_auth_requests_are_counted_per_ip(self):
+        self.client.force_authenticate(None)
+        for _ in range(2):
+            response = self.client.post('/api/token/refresh/', {'refresh': 'bogus'})
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post('/api/auth/register/', {})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        response = self.client.post('/api/auth/register/', {}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_buckets_never_hand_out_a_token_twice(self):
+        with tempfile.TemporaryDirectory() as location:
+            for backend in (
+                buckets.TokenBucketLocMemCache('buckets', {}),
+                buckets.TokenBucketFileBasedCache(location, {}),
+            ):
+                with self.subTest(backend=type(backend).__name__):
+                    taken = []
+
+                    def take():
+                        for _ in range(20):
+                            taken.append(backend.take_token('key', 50, 1e-6, 0.0)[0])
+
+                    threads = [threading.Thread(target=take) for _ in range(8)]
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    self.assertEqual(sum(taken), 50)
+                    backend.clear()
+
+
+class StatelessAuthenticationTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+        token = RefreshToken.for_user(self.alice).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_authentication_does_not_load_the_user(self):
+        self.client.get('/api/posts/0/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/posts/0/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(len(ctx), 1)
+
+    def test_lazy_user_loads_remaining_fields_in_one_query(self):
+        with self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/posts/', {'content': 'hello'})
+        self.assertEqual(response.data['user']['email'], 'alice@example.com')
+        user_reads = [
+            q for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT') and 'FROM "api_user"' in q['sql']
+        ]
+        self.assertEqual(len(user_reads), 2)  # active-state check + lazy load
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/users/').status_code, status.HTTP_200_OK)
+        self.alice.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.save()
+        self.assertEqual(self.client.get('/api/users/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class LoginTests(SocialAPITestCase):
+    def login(self, username='bob', password='pass12345', **extra):
+        return self.client.post(
+            '/api/auth/login/', {'username': username, 'password': password}, **extra
+        )
+
+    def test_repeat_login_is_served_from_token_cache(self):
+        first = self.login()
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        with mock.patch.object(User, 'check_password', side_effect=AssertionError):
+            second = self.login()
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(self.login(password='wrong').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # A fixed clock keeps all attempts in one rate window.
+    @mock.patch.object(SlidingWindowRateThrottle, 'timer', return_value=30.0)
+    def test_username_is_rate_limited(self, timer):
+        for i in range(10):
+            self.login(password='wrong', REMOTE_ADDR=f'10.0.0.{i}')
+        response = self.login(REMOTE_ADDR='10.0.1.1')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.login(username='alice').status_code, status.HTTP_200_OK)
+
+    @override_settings(
+        PASSWORD_HASHERS=[
+            'api.hashers.TunedPBKDF2PasswordHasher',
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+        ],
+        PBKDF2_ITERATIONS=1000,
+        LOGIN_TOKEN_CACHE_TTL=0,
+    )
+    def test_login_upgrades_hash_to_preferred_hasher(self):
+        self.login()
+        self.bob.refresh_from_db()
+        self.assertTrue(self.bob.password.startswith('pbkdf2_sha256$1000$'))
+        with self.settings(PBKDF2_ITERATIONS=2000):
+            self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.bob.refresh_from_db()
+        self.assertTrue(self.bob.password.startswith('pbkdf2_sha256$2000$'))
+
+
+class RevocationTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+        self.refresh = RefreshToken.for_user(self.alice)
+        self.access = self.refresh.access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def test_logout_revokes_refresh_and_access_tokens(self):
+        response = self.client.post('/api/auth/logout/', {'refresh_token': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        self.assertEqual(self.client.get('/api/users/').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials()
+        response = self.client.post('/api/token/refresh/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocations_from_other_workers_are_picked_up(self):
+        self.assertEqual(self.client.get('/api/users/').status_code, status.HTTP_200_OK)
+        RevokedToken.objects.create(
+            jti=self.access['jti'], expires_at=timezone.now() + timedelta(hours=1)
+        )
+        with self.settings(REVOCATION_SYNC_INTERVAL=0):
+            self.assertEqual(self.client.get('/api/users/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_does_not_reuse_revoked_cached_tokens(self):
+        self.client.credentials()
+        credentials = {'username': 'bob', 'password': 'pass12345'}
+        first = self.client.post('/api/auth/login/', credentials)
+        self.client.post('/api/auth/logout/', {'refresh_token': first.data['refresh_token']})
+        second = self.client.post('/api/auth/login/', credentials)
+        self.assertNotEqual(second.data['refresh_token'], first.data['refresh_token'])
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_prune_deletes_only_expired_entries(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti='old', expires_at=now - timedelta(minutes=1))
+        RevokedToken.objects.create(jti='live', expires_at=now + timedelta(minutes=1))
+        call_command('prune_revoked_tokens', batch_size=1, stdout=StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+
+class BulkActionTests(SocialAPITestCase):
+    def test_bulk_follow_reports_outcomes_and_backfills(self):
+        carol = self.make_user('carol')
+        post = Post.objects.create(user=carol, content='hi')
+        self.follow(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/users/bulk-follow/',
+                {'ids': [self.bob.pk, carol.pk, self.alice.pk, 9999, carol.pk]},
+                format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item['status'] for item in response.data['results']],
+            ['already_following', 'followed', 'self', 'not_found'],
+        )
+        carol.refresh_from_db()
+        self.assertEqual(carol.followers_count, 1)
+        self.assertEqual([p['id'] for p in self.client.get('/api/posts/').data['results']], [post.pk])
+
+        response = self.client.post(
+            '/api/users/bulk-unfollow/', {'ids': [carol.pk, 9999]}, format='json'
+        )
+        self.assertEqual(
+            [item['status'] for item in response.data['results']], ['unfollowed', 'not_following']
+        )
+        carol.refresh_from_db()
+        self.assertEqual(carol.followers_count, 0)
+        self.assertEqual(self.client.get('/api/posts/').data['results'], [])
+
+    def test_bulk_like_query_count_does_not_grow_with_ids(self):
+        posts = [Post.objects.create(user=self.bob, content=str(i)) for i in range(12)]
+
+        def like(batch):
+            with self.captureOnCommitCallbacks(execute=True), \
+                    CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(
+                    '/api/posts/bulk-like/', {'ids': [p.pk for p in batch]}, format='json'
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(ctx)
+
+        self.assertEqual(like(posts[:2]), like(posts[2:]))
+        self.assertEqual(Post.objects.filter(likes_count=1).count(), 12)
+
+        response = self.client.post(
+            '/api/posts/bulk-unlike/', {'ids': [posts[0].pk, posts[0].pk]}, format='json'
+        )
+        self.assertEqual(response.data['results'], [{'id': posts[0].pk, 'status': 'unliked'}])
+        posts[0].refresh_from_db()
+        self.assertEqual(posts[0].likes_count, 0)
+
+    def test_bulk_ids_are_validated(self):
+        response = self.client.post('/api/posts/bulk-like/', {'ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            '/api/posts/bulk-like/', {'ids': list(range(1, 102))}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for path in ('/api/posts/bulk-like/', '/api/posts/bulk-unlike/',
+                     '/api/users/bulk-follow/', '/api/users/bulk-unfollow/'):
+            response = self.client.post(path, {'ids': [1, 2**63]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, path)
+
+
+class FastJSONTests(SocialAPITestCase):
+    def render_both(self, data):
+        fast = fastjson.FastJSONRenderer().render(data)
+        with mock.patch('api.fastjson.orjson', None):
+            fallback = fastjson.FastJSONRenderer().render(data)
+        return fast, fallback, JSONRenderer().render(data)
+
+    def test_renders_like_drf(self):
+        post = Post.objects.create(user=self.bob, content='line\u2028separator \u00e9')
+        data = {
+            'posts': PostSerializer([post], many=True).data,
+            'at': timezone.now(), 'naive': timezone.now().replace(tzinfo=None),
+            'date': timezone.now().date(), 'amount': Decimal('1.50'), 'lazy': gettext_lazy('Not found.'),
+            1: None,
+        }
+        fast, fallback, drf = self.render_both(data)
+        self.assertEqual(fast, drf)
+        self.assertEqual(fallback, drf)
+        self.assertIn(b'\\u2028', fast)
+
+    def test_parses_json_requests(self):
+        parser = fastjson.FastJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO('{"content": "\u00e9"}'.encode())), {'content': '\u00e9'})
+        for body in (b'{"content": ', b'{"score": NaN}'):
+            with self.assertRaises(ParseError):
+                parser.parse(io.BytesIO(body))
+
+        response = self.client.post('/api/posts/', {'content': 'json'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.content)['content'], 'json')
+        response = self.client.post('/api/posts/', '{"content": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FastSerializerParityTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.bob.bio = 'Über \u2028 "quoted"'
+        self.bob.save()
+        created_at = timezone.now().replace(microsecond=0)
+        self.posts = [
+            Post.objects.create(user=self.bob, content='first', created_at=created_at),
+            Post.objects.create(user=self.alice, content='', likes_count=3, comments_count=2),
+        ]
+        for i in range(3):
+            Comment.objects.create(user=self.bob if i % 2 else self.alice, post=self.posts[0], content=str(i))
+        self.follow(self.bob)
+
+    def test_rows_render_like_the_serializers(self):
+        posts = Post.objects.select_related('user').order_by('id')
+        comments = Comment.objects.select_related('user').order_by('id')
+        for zone in ('UTC', 'Asia/Kolkata'):
+            with self.subTest(zone=zone), timezone.override(zone):
+                get_cache().clear()
+                for fields in (None, {'id', 'user', 'created_at'}, {'id', 'content'}):
+                    self.assertEqual(
+                        fastserializers.render_posts(fastserializers.post_rows(posts, fields), fields),
+                        PostSerializer(posts, many=True, fields=fields).data,
+                    )
+                self.assertEqual(
+                    fastserializers.render_comments(fastserializers.comment_rows(comments)),
+                    CommentSerializer(comments, many=True).data,
+                )
+                self.assertEqual(
+                    fastserializers.render_users(fastserializers.user_rows(User.objects.order_by('id'))),
+                    UserSerializer(User.objects.order_by('id'), many=True).data,
+                )
+
+    def test_list_responses_are_unchanged(self):
+        urls = [
+            '/api/posts/?preview_comments=2', '/api/posts/?fields=user,likes_count&mode=normalized',
+            '/api/posts/trending/?preview_comments=1', f'/api/posts/{self.posts[0].pk}/comments/?page_size=2',
+            '/api/users/',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                fast = self.client.get(url)
+                with override_settings(FAST_READ_SERIALIZERS=False):
+                    cache.clear()
+                    get_cache().clear()
+                    slow = self.client.get(url)
+                self.assertEqual(fast.status_code, status.HTTP_200_OK)
+                self.assertEqual(fast.content, slow.content)
+                if 'ETag' in slow:
+                    self.assertEqual(fast['ETag'], slow['ETag'])
+
+
+class DatabaseProfileTests(SocialAPITestCase):
+    def test_sqlite_connections_are_tuned(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class SearchTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.strong = Post.objects.create(user=self.bob, content='garden garden gardening tips')
+        self.weak = Post.objects.create(
+            user=self.bob, content='A long post that mentions a garden once among many other words'
+        )
+        Post.objects.create(user=self.bob, content='nothing relevant')
+
+    def search(self, path, **params):
+        response = self.client.get(f'/api/search/{path}/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_posts_are_ranked_highlighted_and_paged(self):
+        first = self.search('posts', q='gardens', page_size=1)
+        self.assertEqual([p['id'] for p in first['results']], [self.strong.pk])
+        self.assertIn('<mark>garden</mark>', first['results'][0]['highlight'])
+        second = self.client.get(first['next']).data
+        self.assertEqual([p['id'] for p in second['results']], [self.weak.pk])
+        self.assertIsNone(second['next'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.strong.content = 'tips for <b>roses</b>'
+        self.strong.save()
+        self.weak.delete()
+        self.assertEqual(self.search('posts', q='garden')['results'], [])
+        [hit] = self.search('posts', q='rose')['results']
+        self.assertEqual(hit['highlight'], 'tips for &lt;b&gt;<mark>roses</mark>&lt;/b&gt;')
+
+    def test_users_are_searchable_by_username_and_bio(self):
+        User.objects.filter(pk=self.bob.pk).update(bio='Keen NEAR gardener')
+        self.assertEqual([u['id'] for u in self.search('users', q='bob')['results']], [self.bob.pk])
+        self.assertEqual([u['id'] for u in self.search('users', q='near gardener')['results']], [self.bob.pk])
+        response = self.client.get('/api/search/users/', {'q': ' '})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reindex_repairs_drifted_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM api_post_fts')
+        self.assertEqual(self.search('posts', q='garden')['results'], [])
+        call_command('reindex_search', 'posts', batch_size=2, stdout=StringIO())
+        self.assertEqual(len(self.search('posts', q='garden')['results']), 2)
+
+
+class SuggestionTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.carol, self.dave, self.erin = (self.make_user(name) for name in ('carol', 'dave', 'erin'))
+
+    def suggestions(self, user=None):
+        self.client.force_authenticate(user or self.alice)
+        response = self.client.get('/api/users/suggestions/')
+        self.client.force_authenticate(self.alice)
+        return [(item['username'], item['mutual_count']) for item in response.data['results']]
+
+    def test_batch_ranks_by_mutual_follows(self):
+        for follower, following in [
+            (self.alice, self.bob), (self.alice, self.erin), (self.bob, self.carol),
+            (self.erin, self.carol), (self.erin, self.dave), (self.bob, self.alice),
+        ]:
+            Follow.objects.create(follower=follower, following=following)
+        engines = ['sql'] + (['numpy'] if importlib.util.find_spec('numpy') else [])
+        for engine in engines:
+            FollowSuggestion.objects.all().delete()
+            call_command('compute_suggestions', engine=engine, chunk_size=2, stdout=StringIO())
+            self.assertEqual(self.suggestions(), [('carol', 2), ('dave', 1)], engine)
+            self.assertEqual(self.suggestions(self.bob), [('erin', 1)], engine)
+
+    def test_follows_update_suggestions_incrementally(self):
+        Follow.objects.create(follower=self.bob, following=self.carol)
+        self.follow(self.bob)
+        self.assertEqual(self.suggestions(), [('carol', 1)])
+
+        self.client.force_authenticate(self.dave)
+        self.follow(self.alice)
+        self.assertEqual(self.suggestions(self.dave), [('bob', 1)])
+
+        self.client.force_authenticate(self.alice)
+        self.follow(self.erin)
+        self.assertEqual(self.suggestions(self.dave), [('bob', 1), ('erin', 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/users/{self.bob.pk}/unfollow/')
+        self.assertEqual(self.suggestions(), [])
+        self.assertEqual(self.suggestions(self.dave), [('erin', 1)])
+
+
+class TrendingTests(SocialAPITestCase):
+    def trending_ids(self, url='/api/posts/trending/'):
+        return [post['id'] for post in self.client.get(url).data['results']]
+
+    def test_engagement_updates_rank_incrementally(self):
+        quiet, liked, discussed = (Post.objects.create(user=self.bob, content=c) for c in 'abc')
+        carol = self.make_user('carol')
+        for user in (self.alice, self.bob, carol):
+            self.client.force_authenticate(user)
+            self.client.post(f'/api/posts/{liked.pk}/like/')
+        self.client.post(f'/api/posts/{discussed.pk}/comments/', {'content': 'hm'})
+        self.assertEqual(self.trending_ids(), [liked.pk, discussed.pk, quiet.pk])
+
+        self.client.post(f'/api/posts/{liked.pk}/unlike/')
+        self.client.post('/api/posts/bulk-unlike/', {'ids': [liked.pk]}, format='json')
+        self.assertEqual(self.trending_ids(), [discussed.pk, liked.pk, quiet.pk])
+
+        incremental = dict(Post.objects.values_list('pk', 'trending_score'))
+        call_command('recompute_trending', stdout=StringIO())
+        for pk, score in Post.objects.values_list('pk', 'trending_score'):
+            self.assertAlmostEqual(score, incremental[pk], places=6)
+
+    def test_old_engagement_decays_and_feed_is_paged(self):
+        two_days_ago = timezone.now() - timedelta(hours=48)
+        old = Post.objects.create(user=self.bob, content='old', created_at=two_days_ago)
+        for user in (self.alice, self.bob, self.make_user('carol')):
+            Like.objects.create(user=user, post=old, created_at=two_days_ago)
+        new = Post.objects.create(user=self.bob, content='new')
+        call_command('recompute_trending', batch_size=1, stdout=StringIO())
+
+        first = self.client.get('/api/posts/trending/?page_size=1').data
+        self.assertEqual([p['id'] for p in first['results']], [new.pk])
+        self.assertEqual(self.trending_ids(first['next']), [old.pk])
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_SAMPLE_RATE=1.0)
+class MetricsTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+        Post.objects.create(user=self.bob, content='hello')
+
+    def test_records_queries_and_latency_per_endpoint(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/posts/')
+        expected = len(queries)
+        self.client.get('/api/posts/')
+        histograms = metrics.registry.histograms
+        self.assertEqual(histograms[('latency_seconds', 'post-list', 'list')].count, 2)
+        self.assertEqual(histograms[('queries', 'post-list', 'list')].total, 2 * expected)
+        self.assertGreater(histograms[('serialize_seconds', 'post-list', 'list')].total, 0)
+
+        with override_settings(METRICS_SAMPLE_RATE=0.0):
+            self.client.get('/api/posts/')
+        self.assertEqual(histograms[('latency_seconds', 'post-list', 'list')].count, 2)
+
+    def test_endpoint_is_staff_only_and_report_reads_it(self):
+        self.client.get('/api/posts/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.alice.is_staff = True
+        self.alice.save()
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        text = response.content.decode()
+        self.assertIn('api_request_queries_bucket{view="post-list",action="list",le="+Inf"} 1', text)
+
+        key = ('queries', 'post-list', 'list')
+        self.assertEqual(metrics.parse_prometheus(text)[key].counts, metrics.registry.histograms[key].counts)
+        with tempfile.NamedTemporaryFile('w', suffix='.prom') as export:
+            export.write(text)
+            export.flush()
+            out = StringIO()
+            call_command('metrics_report', export.name, export.name, stdout=out)
+        self.assertRegex(out.getvalue(), r'post-list list\s+2 ')
+
+    def test_histogram_quantiles(self):
+        histogram = metrics.Histogram((1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.quantile(0.5), 1.75)
+        self.assertEqual(histogram.quantile(0.99), 4)
+
+
+class SeedTests(SocialAPITestCase):
+    def relative_graph(self, plan):
+        base = plan.user_base
+        follows = Follow.objects.filter(follower_id__in=plan.user_ids).order_by('follower_id', 'following_id')
+        posts = Post.objects.filter(pk__in=plan.post_ids).order_by('pk')
+        return (
+            [(a - base, b - base) for a, b in follows.values_list('follower_id', 'following_id')],
+            list(posts.values_list('content', 'likes_count', 'comments_count')),
+        )
+
+    def test_seed_loads_consistent_data(self):
+        out = StringIO()
+        call_command('seed', users=40, batch_size=15, timelines=True, password='seeded', stdout=out)
+        self.assertIn('Seeded users', out.getvalue())
+        self.assertEqual(User.objects.filter(username__startswith='seed').count(), 40)
+        self.assertTrue(TimelineEntry.objects.exists())
+
+        counters = StringIO()
+        call_command('reconcile_counters', dry_run=True, stdout=counters)
+        self.assertIn('Found 0 drifted post', counters.getvalue())
+        self.assertIn('Found 0 drifted user', counters.getvalue())
+
+        user = User.objects.filter(username__startswith='seed').first()
+        response = self.client.post('/api/auth/login/', {'username': user.username, 'password': 'seeded'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_same_seed_gives_same_graph(self):
+        first = seeding.seed(users=30, batch_size=10, seed=7)
+        second = seeding.seed(users=30, batch_size=10, seed=7)
+        self.assertEqual(self.relative_graph(first), self.relative_graph(second))
+        self.assertNotEqual(
+            self.relative_graph(first), self.relative_graph(seeding.seed(users=30, batch_size=10, seed=8))
+        )
+
+
+class AsyncReadViewTests(SocialAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.follow(self.bob)
+        self.posts = [Post.objects.create(user=self.bob, content=str(i)) for i in range(3)]
+        for i in range(3):
+            Comment.objects.create(user=self.alice, post=self.posts[0], content=str(i))
+        token = RefreshToken.for_user(self.alice).access_token
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.factory = AsyncRequestFactory()
+        self.headers = {'Authorization': f'Bearer {token}'}
+
+    async def test_responses_match_the_viewsets(self):
+        post = self.posts[0]
+        cases = [
+            (async_views.feed, '/api/posts/?page_size=2&preview_comments=2', {}),
+            (async_views.feed, '/api/posts/?fields=content,user&mode=normalized&preview_comments=1', {}),
+            (async_views.post_detail, f'/api/posts/{post.pk}/?fields=likes_count', {'pk': post.pk}),
+            (async_views.post_detail, f'/api/posts/{post.pk}/?preview_comments=1', {'pk': post.pk}),
+            (async_views.comment_list, f'/api/posts/{post.pk}/comments/?page_size=2', {'post_pk': post.pk}),
+            (async_views.user_detail, f'/api/users/{self.bob.pk}/', {'pk': self.bob.pk}),
+            (async_views.post_detail, '/api/posts/999/', {'pk': 999}),
+        ]
+        for view, url, kwargs in cases:
+            with self.subTest(url=url):
+                expected = await sync_to_async(self.client.get)(url)
+                response = await view(self.factory.get(url, headers=self.headers), **kwargs)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+    async def test_feed_is_throttled(self):
+        with mock.patch.dict(ScopedRateThrottle.THROTTLE_RATES, {'feed': '1/min'}):
+            request = self.factory.get('/api/posts/', headers=self.headers)
+            self.assertEqual((await async_views.feed(request)).status_code, status.HTTP_200_OK)
+            response = await async_views.feed(request)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    async def test_conditional_get(self):
+        url = f'/api/posts/{self.posts[0].pk}/comments/'
+        expected = await sync_to_async(self.client.get)(url)
+        response = await async_views.comment_list(
+            self.factory.get(url, headers={**self.headers, 'If-None-Match': expected['ETag']}),
+            post_pk=self.posts[0].pk,
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_authentication_and_other_methods(self):
+        response = await async_views.feed(self.factory.get('/api/posts/'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('WWW-Authenticate', response)
+
+        response = await async_views.feed(
+            self.factory.post(
+                '/api/posts/', {'content': 'via fallback'}, content_type='application/json', headers=self.headers
+            )
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+# close_old_connections() would close the test transaction's connection.
+@mock.patch('api.realtime.close_old_connections', lambda: None)
+class RealtimeTests(SocialAPITestCase):
+    def connect(self, user=None, path=realtime.PATH, token=None):
+        if user and token is None:
+            token = RefreshToken.for_user(user).access_token
+        query = f'token={token}' if token else ''
+        return ApplicationCommunicator(realtime.websocket_application, {
+            'type': 'websocket', 'path': path, 'query_string': query.encode(), 'headers': [],
+        })
+
+    def act(self, user, path, data=None):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(path, data or {})
+
+    async def receive_json(self, communicator):
+        return json.loads((await communicator.receive_output(1))['text'])
+
+    async def test_rejects_missing_and_unknown_paths(self):
+        for communicator, code in [
+            (self.connect(), realtime.CLOSE_UNAUTHORIZED),
+            (self.connect(self.alice, '/ws/other/'), realtime.CLOSE_NOT_FOUND),
+        ]:
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual(await communicator.receive_output(1), {'type': 'websocket.close', 'code': code})
+
+    async def test_pushes_posts_of_followed_users_and_notifications(self):
+        act = sync_to_async(self.act)
+        alice = self.connect(self.alice)
+        await alice.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await alice.receive_output(1))['type'], 'websocket.accept')
+
+        # Followed while connected.
+        await act(self.alice, f'/api/users/{self.bob.pk}/follow/')
+        await act(self.bob, '/api/posts/', {'content': 'live'})
+        event = await self.receive_json(alice)
+        self.assertEqual((event['type'], event['post']['content']), ('post', 'live'))
+
+        post = await Post.objects.acreate(user=self.alice, content='mine')
+        await act(self.bob, f'/api/posts/{post.pk}/like/')
+        await act(self.bob, f'/api/posts/{post.pk}/comments/', {'content': 'nice'})
+        await act(self.alice, f'/api/posts/{post.pk}/comments/', {'content': 'thanks'})
+        self.assertEqual(
+            await self.receive_json(alice), {'type': 'like', 'post_id': post.pk, 'user_id': self.bob.pk}
+        )
+        event = await self.receive_json(alice)
+        self.assertEqual((event['type'], event['comment']['content']), ('comment', 'nice'))
+        # Own comments are not echoed back.
+        self.assertTrue(await alice.receive_nothing())
+
+        await act(self.alice, f'/api/users/{self.bob.pk}/unfollow/')
+        await act(self.bob, '/api/posts/', {'content': 'unseen'})
+        self.assertTrue(await alice.receive_nothing())
+
+        await alice.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await alice.wait(1)
+        self.assertEqual(realtime.hub.count(f'user:{self.alice.pk}'), 0)
+
+    async def test_closes_when_the_token_expires(self):
+        token = RefreshToken.for_user(self.alice).access_token
+        # Expiry is in whole seconds: this one is 1-2 seconds away.
+        token.set_exp(lifetime=timedelta(seconds=2))
+        alice = self.connect(self.alice, token=token)
+        await alice.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await alice.receive_output(1))['type'], 'websocket.accept')
+        self.assertEqual(
+            await alice.receive_output(3), {'type': 'websocket.close', 'code': realtime.CLOSE_UNAUTHORIZED}
+        )
+        self.assertEqual(realtime.hub.count(f'user:{self.alice.pk}'), 0)
+
+    @override_settings(REALTIME_REVOCATION_CHECK_INTERVAL=0.1)
+    async def test_closes_once_the_token_is_revoked(self):
+        token = RefreshToken.for_user(self.alice).access_token
+        alice = self.connect(self.alice, token=token)
+        await alice.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await alice.receive_output(1))['type'], 'websocket.accept')
+        self.assertTrue(await alice.receive_nothing(0.2))
+        await sync_to_async(registry.revoke)(token['jti'], timezone.now() + timedelta(hours=1))
+        self.assertEqual(
+            await alice.receive_output(1), {'type': 'websocket.close', 'code': realtime.CLOSE_UNAUTHORIZED}
+        )
+
+    @override_settings(REALTIME_BUFFER_SIZE=1)
+    async def test_follows_are_not_dropped_with_a_full_buffer(self):
+        alice = self.connect(self.alice)
+        await alice.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await alice.receive_output(1))['type'], 'websocket.accept')
+        # The follow and two notifications land before the socket drains any.
+        realtime.hub.deliver(
+            f'following:{self.alice.pk}', json.dumps({'followed': [self.bob.pk], 'unfollowed': []})
+        )
+        for message in ('"one"', '"two"'):
+            realtime.hub.deliver(f'user:{self.alice.pk}', message)
+        self.assertEqual((await alice.receive_output(1))['text'], '"two"')
+        self.assertEqual(realtime.hub.count(f'author:{self.bob.pk}'), 1)
+
+
+@override_settings(READ_REPLICAS=['replica'])
+class ReplicaRoutingTests(SocialAPITestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite database, created and migrated like `default`, that
+        # never receives the primary's writes: a replica with unbounded lag.
+        # It only exists while this class runs (`connections.settings` is
+        # settings.DATABASES), so the runner neither checks nor creates it.
+        connections.settings['replica'] = {
+            **connections.settings['default'],
+            'TEST': {**connections.settings['default']['TEST']},
+        }
+        cls.addClassCleanup(cls.drop_replica)
+        connections['replica'].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def drop_replica(cls):
+        connections['replica'].creation.destroy_test_db(verbosity=0)
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+        token = RefreshToken.for_user(self.alice).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        User.objects.using('replica').create(pk=self.alice.pk, username='alice', email='a@replica.local')
+        User.objects.using('replica').create(pk=1000, username='carol', email='c@replica.local')
+
+    def usernames(self):
+        return [user['username'] for user in self.client.get('/api/users/').data]
+
+    def test_reads_use_replica_until_user_writes(self):
+        self.assertEqual(self.usernames(), ['carol'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/posts/', {'content': 'hello'})
+        self.assertIn('pin_primary', response.cookies)
+        self.assertEqual(self.usernames(), ['bob'])
+
+        # The cached pin covers clients that do not keep cookies.
+        self.client.cookies.clear()
+        self.assertEqual(self.usernames(), ['bob'])
+        cache.clear()
+        self.assertEqual(self.usernames(), ['carol'])
+
+    def test_failed_writes_do_not_pin(self):
+        response = self.client.post('/api/posts/', {})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('pin_primary', response.cookies)
+        self.assertEqual(self.usernames(), ['carol'])
@@ -0,0 +1,140 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """
+    Sliding-window counter throttle.
+
+    Keeps one counter per fixed window and estimates the rolling rate as the
+    current window's count plus the previous window's count weighted by how
+    much of it still overlaps. That is two small cache entries per key instead
+    of the timestamp list SimpleRateThrottle stores and rewrites per request.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window = int(now // self.duration)
+        elapsed = (now % self.duration) / self.duration
+        current_key = f'{self.key}:{window}'
+        previous_key = f'{self.key}:{window - 1}'
+        counts = self.cache.get_many([current_key, previous_key])
+        current = counts.get(current_key, 0)
+        previous = counts.get(previous_key, 0)
+
+        if previous * (1 - elapsed) + current >= self.num_requests:
+            self.wait_seconds = self._wait(previous, current, elapsed)
+            return False
+
+        if not self.cache.add(current_key, 1, self.duration * 2):
+            try:
+                self.cache.incr(current_key)
+            except ValueError:
+                # Expired between add() and incr().
+                self.cache.set(current_key, 1, self.duration * 2)
+        return True
+
+    def _wait(self, previous, current, elapsed):
+        if current < self.num_requests:
+            # Wait until enough of the previous window has slid out.
+            fraction = 1 - (self.num_requests - current) / previous - elapsed
+        else:
+            # Wait for the next window, then for this one to slide out.
+            fraction = (1 - elapsed) + (1 - self.num_requests / current)
+        return max(fraction * self.duration, 1)
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginIPRateThrottle(SlidingWindowRateThrottle):
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginUsernameRateThrottle(SlidingWindowRateThrottle):
+    scope = 'login_username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username')
+        if not isinstance(username, str) or not username:
+            return None
+        ident = hashlib.sha256(username.lower().encode()).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class TokenBucketRateThrottle(SimpleRateThrottle):
+    """
+    Token-bucket throttle.
+
+    Each key gets a bucket of `num_requests` tokens refilled at `num_requests`
+    per `duration`, so a client may burst up to the full rate and is then held
+    to its average. The bucket lives in the ``THROTTLE_CACHE_ALIAS`` cache,
+    whose backend takes a token in one atomic operation (see api/buckets.py).
+    """
+
+    @property
+    def cache(self):
+        return caches[settings.THROTTLE_CACHE_ALIAS]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        take_token = getattr(self.cache, 'take_token', None)
+        if take_token is None:
+            raise ImproperlyConfigured(
+                f'The {settings.THROTTLE_CACHE_ALIAS!r} cache needs a backend from api.buckets.'
+            )
+        allowed, self.wait_seconds = take_token(
+            self.key, self.num_requests, self.num_requests / self.duration, self.timer()
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ScopedRateThrottle(TokenBucketRateThrottle):
+    """
+    The ``read``, ``write``, ``feed`` and ``auth`` budgets.
+
+    A view picks its scope with ``throttle_scope``; otherwise safe methods are
+    ``read`` and the rest ``write``. Signed-in clients are counted per user,
+    anonymous ones per IP.
+    """
+
+    def __init__(self):
+        # The rate depends on the view, so it is looked up in allow_request().
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None) or (
+            'read' if request.method in SAFE_METHODS else 'write'
+        )
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
@@ -0,0 +1,303 @@
+"""
+Materialized home timelines.
+
+Posts are pushed into each follower's timeline when they are created
+(fan-out-on-write), so reading the feed is a lookup in the reader's own
+timeline rather than a scan over everyone they follow. Authors with at least
+``TIMELINE_FANOUT_THRESHOLD`` followers are skipped on write; their posts are
+merged into the feed at read time instead (fan-out-on-read). An author whose
+posts were ever skipped stays merged on read after dropping back under the
+threshold, so those posts do not vanish from feeds.
+
+Timelines carry each post's ``created_at`` and keep the newest
+``TIMELINE_SIZE`` entries. A feed page reads the owner's timeline and each
+merged author's posts as index ranges starting at the cursor, each limited to
+the page size, and merges them: the cost of a page does not grow with the
+owner's history or with how deep they have scrolled.
+
+The storage is pluggable through ``TIMELINE_BACKEND``. Fan-out and follow
+backfills run as background tasks (see api/tasks.py).
+"""
+import heapq
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils.module_loading import import_string
+
+from .models import Follow, Post, TimelineEntry, User
+from .tasks import task
+
+
+def before(position, created_at='created_at', pk='id'):
+    """Rows after `position`, a ``(created_at, pk)`` cursor, in newest-first order.
+
+    Spelled as a range on `created_at` so an index on it is seeked, not scanned.
+    """
+    date, last_pk = position
+    return Q(**{f'{created_at}__lte': date}) & (
+        Q(**{f'{created_at}__lt': date}) | Q(**{f'{pk}__lt': last_pk})
+    )
+
+
+class BaseTimelineBackend:
+    def push(self, post, follower_ids):
+        """Add `post` to the timelines of `follower_ids`, keeping each to TIMELINE_SIZE entries."""
+        raise NotImplementedError
+
+    def backfill(self, owner_id, author_id, limit):
+        """Seed `owner_id`'s timeline with `author_id`'s most recent posts."""
+        posts = (
+            Post.objects.filter(user_id=author_id)
+            .order_by('-created_at', '-id')
+            .only('id', 'user_id', 'created_at')[:limit]
+        )
+        for post in posts:
+            self.push(post, [owner_id])
+
+    def page(self, owner_id, position, limit):
+        """Up to `limit` ``(created_at, post_id)`` pairs of `owner_id`'s timeline after `position`, newest first."""
+        raise NotImplementedError
+
+    def remove_author(self, owner_id, author_id):
+        raise NotImplementedError
+
+    def remove_post(self, post_id):
+        raise NotImplementedError
+
+    def remove_owner(self, owner_id):
+        raise NotImplementedError
+
+    def clear(self, owner_id):
+        """Empty `owner_id`'s timeline, e.g. before rebuilding it."""
+        raise NotImplementedError
+
+
+class DatabaseTimelineBackend(BaseTimelineBackend):
+    def push(self, post, follower_ids):
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    owner_id=owner_id, post_id=post.pk, author_id=post.user_id, created_at=post.created_at
+                )
+                for owner_id in follower_ids
+            ],
+            ignore_conflicts=True,
+        )
+        self.trim(follower_ids)
+
+    def backfill(self, owner_id, author_id, limit):
+        posts = (
+            Post.objects.filter(user_id=author_id)
+            .order_by('-created_at', '-id')
+            .values_list('id', 'created_at')[:limit]
+        )
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(owner_id=owner_id, post_id=post_id, author_id=author_id, created_at=created_at)
+                for post_id, created_at in posts
+            ],
+            ignore_conflicts=True,
+        )
+        self.trim([owner_id])
+
+    def trim(self, owner_ids):
+        """Drop all but the newest TIMELINE_SIZE entries of each of `owner_ids`."""
+        # The first two entries past the cap, found by walking each owner's index.
+        overflow = TimelineEntry.objects.filter(owner_id=OuterRef('pk')).order_by('-created_at', '-post_id')
+        size = settings.TIMELINE_SIZE
+        cutoffs = User.objects.filter(pk__in=owner_ids).annotate(
+            cutoff=Subquery(overflow.values('pk')[size:size + 1]),
+            after=Subquery(overflow.values('pk')[size + 1:size + 2]),
+        ).filter(cutoff__isnull=False).values_list('cutoff', 'after')
+        # A push leaves one entry past the cap, deleted by id; longer tails
+        # (backfills, a lowered cap) go as the range from the cutoff down.
+        single, longer = [], []
+        for cutoff, after in cutoffs:
+            (single if after is None else longer).append(cutoff)
+        ranges = []
+        if longer:
+            for owner_id, created_at, post_id in TimelineEntry.objects.filter(pk__in=longer).values_list(
+                'owner_id', 'created_at', 'post_id',
+            ):
+                ranges.append(Q(owner_id=owner_id, created_at__lte=created_at) & (
+                    Q(created_at__lt=created_at) | Q(post_id__lte=post_id)
+                ))
+        if single or ranges:
+            TimelineEntry.objects.filter(Q(pk__in=single) | Q(*ranges, _connector=Q.OR)).delete()
+
+    def page(self, owner_id, position, limit):
+        entries = TimelineEntry.objects.filter(owner_id=owner_id)
+        if position is not None:
+            entries = entries.filter(before(position, pk='post_id'))
+        return list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:limit])
+
+    def remove_author(self, owner_id, author_id):
+        TimelineEntry.objects.filter(owner_id=owner_id, author_id=author_id).delete()
+
+    def clear(self, owner_id):
+        TimelineEntry.objects.filter(owner_id=owner_id).delete()
+
+    # Entries are removed by the database's ON DELETE CASCADE when the post
+    # or the owner goes away.
+    def remove_post(self, post_id):
+        pass
+
+    def remove_owner(self, owner_id):
+        pass
+
+
+class LocMemTimelineBackend(BaseTimelineBackend):
+    """Per-process timelines for tests and single-process development."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timelines = defaultdict(dict)   # owner_id -> {post_id: (author_id, created_at)}
+        self._holders = defaultdict(set)      # post_id -> {owner_id}
+
+    def push(self, post, follower_ids):
+        with self._lock:
+            for owner_id in follower_ids:
+                timeline = self._timelines[owner_id]
+                timeline[post.pk] = (post.user_id, post.created_at)
+                self._holders[post.pk].add(owner_id)
+                if len(timeline) > settings.TIMELINE_SIZE:
+                    for post_id in self._newest_first(timeline)[settings.TIMELINE_SIZE:]:
+                        del timeline[post_id]
+                        self._holders[post_id].discard(owner_id)
+
+    @staticmethod
+    def _newest_first(timeline):
+        return sorted(timeline, key=lambda post_id: (timeline[post_id][1], post_id), reverse=True)
+
+    def page(self, owner_id, position, limit):
+        with self._lock:
+            timeline = self._timelines.get(owner_id, {})
+            keys = sorted(((created_at, post_id) for post_id, (_, created_at) in timeline.items()), reverse=True)
+        if position is not None:
+            keys = [key for key in keys if key < tuple(position)]
+        return keys[:limit]
+
+    def remove_author(self, owner_id, author_id):
+        with self._lock:
+            timeline = self._timelines.get(owner_id, {})
+            for post_id in [p for p, (a, _) in timeline.items() if a == author_id]:
+                del timeline[post_id]
+                self._holders[post_id].discard(owner_id)
+
+    def remove_post(self, post_id):
+        with self._lock:
+            for owner_id in self._holders.pop(post_id, ()):
+                self._timelines[owner_id].pop(post_id, None)
+
+    def remove_owner(self, owner_id):
+        with self._lock:
+            for post_id in self._timelines.pop(owner_id, {}):
+                self._holders[post_id].discard(owner_id)
+
+    clear = remove_owner
+
+
+_backends = {}
+
+
+def get_timeline_backend():
+    path = settings.TIMELINE_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def fans_out(user):
+    return user.followers_count < settings.TIMELINE_FANOUT_THRESHOLD
+
+
+def mark_skipped(authors):
+    """Flag the high-fan-out `authors` whose posts a timeline rebuild left out."""
+    authors.filter(
+        Exists(Post.objects.filter(user=OuterRef('pk'))),
+        followers_count__gte=settings.TIMELINE_FANOUT_THRESHOLD,
+        skipped_fanout=False,
+    ).update(skipped_fanout=True)
+
+
+def fan_out(post):
+    """Push a freshly created post to its author's followers."""
+    followers_count = User.objects.filter(pk=post.user_id).values_list('followers_count', flat=True).first()
+    if followers_count is None:
+        return
+    if followers_count >= settings.TIMELINE_FANOUT_THRESHOLD:
+        User.objects.filter(pk=post.user_id, skipped_fanout=False).update(skipped_fanout=True)
+        return
+    backend = get_timeline_backend()
+    batch_size = settings.TIMELINE_FANOUT_BATCH_SIZE
+    follower_ids = (
+        Follow.objects.filter(following_id=post.user_id)
+        .order_by('pk')
+        .values_list('follower_id', flat=True)
+    )
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=batch_size):
+        batch.append(follower_id)
+        if len(batch) >= batch_size:
+            backend.push(post, batch)
+            batch = []
+    if batch:
+        backend.push(post, batch)
+
+
+@task
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).only('id', 'user_id', 'created_at').first()
+    if post is not None:
+        fan_out(post)
+
+
+@task
+def backfill_timeline(owner_id, author_id):
+    # The follow may have been undone while this job sat in the queue.
+    if Follow.objects.filter(follower_id=owner_id, following_id=author_id).exists():
+        get_timeline_backend().backfill(owner_id, author_id, settings.TIMELINE_BACKFILL_SIZE)
+
+
+@task
+def backfill_timelines(owner_id, author_ids):
+    """Backfill several newly followed authors at once (see api/bulk.py)."""
+    author_ids = Follow.objects.filter(
+        follower_id=owner_id,
+        following_id__in=author_ids,
+        following__followers_count__lt=settings.TIMELINE_FANOUT_THRESHOLD,
+    ).values_list('following_id', flat=True)
+    backend = get_timeline_backend()
+    for author_id in author_ids:
+        backend.backfill(owner_id, author_id, settings.TIMELINE_BACKFILL_SIZE)
+
+
+def pulled_authors(user):
+    """Ids of the authors `user` follows whose posts are merged into the feed on read."""
+    return Follow.objects.filter(
+        Q(following__followers_count__gte=settings.TIMELINE_FANOUT_THRESHOLD)
+        | Q(following__skipped_fanout=True),
+        follower=user,
+    ).values_list('following_id', flat=True)
+
+
+def feed_page(user, position, limit):
+    """The first `limit` posts of `user`'s home feed after `position`, as ``(created_at, id)``, newest first."""
+    sources = [get_timeline_backend().page(user.pk, position, limit)]
+    for author_id in pulled_authors(user):
+        posts = Post.objects.filter(user_id=author_id)
+        if position is not None:
+            posts = posts.filter(before(position))
+        sources.append(list(posts.order_by('-created_at', '-id').values_list('created_at', 'id')[:limit]))
+    page = []
+    seen = set()
+    # A post of an author merged on read may also be in the timeline.
+    for created_at, post_id in heapq.merge(*sources, reverse=True):
+        if post_id not in seen:
+            seen.add(post_id)
+            page.append((created_at, post_id))
+            if len(page) == limit:
+                break
+    return page
@@ -0,0 +1,129 @@
+"""
+Trending scores.
+
+A post's trending score is the sum of its engagement events (the post itself,
+likes and comments), each weighted by ``TRENDING_WEIGHTS`` and decaying with a
+half-life of ``TRENDING_HALF_LIFE_HOURS``. Decaying every score to "now" would
+rewrite the whole table as time passes, so instead each event counts
+``weight * e^(rate * (t - EPOCH))`` and scores are stored as the natural log of
+that sum. Every score would be scaled by the same ``e^(-rate * now)`` to get
+the decayed value, so the order (which is all the feed needs) never changes
+between events, and the log keeps the numbers finite.
+
+Events are folded in with one UPDATE using a log-add-exp expression; removals
+subtract the same term. ``manage.py recompute_trending`` rebuilds the scores
+from the events, which also repairs float drift.
+"""
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# Lower bound for the fraction of a score left after removing an event, so
+# rounding can never take the log of zero or less.
+MIN_REMAINDER = 1e-12
+
+
+def decay_rate():
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def event_score(kind, at):
+    """Log-space contribution of one `kind` event ('post', 'like' or 'comment') at `at`."""
+    return math.log(settings.TRENDING_WEIGHTS[kind]) + decay_rate() * (at - EPOCH).total_seconds()
+
+
+def _combine(term, removed):
+    score = F('trending_score')
+    if removed:
+        # log(e^score - e^term)
+        return score + Ln(Greatest(1 - Exp(term - score), Value(MIN_REMAINDER)))
+    # log(e^score + e^term), computed without overflowing.
+    return Greatest(score, term) + Ln(1 + Exp(-Abs(score - term)))
+
+
+def record(kind, at, removed=False):
+    """Update kwargs folding one event into ``trending_score``."""
+    term = Value(event_score(kind, at), output_field=FloatField())
+    return {'trending_score': _combine(term, removed)}
+
+
+def record_many(kind, times_by_post, removed=False):
+    """Like `record()` for one event per post, at per-post times."""
+    term = Case(
+        *[
+            When(pk=post_id, then=Value(event_score(kind, at)))
+            for post_id, at in times_by_post.items()
+        ],
+        output_field=FloatField(),
+    )
+    return {'trending_score': _combine(term, removed)}
+
+
+def compute_scores(events):
+    """
+    Fold ``[(post_id, kind, at), ...]`` into ``{post_id: score}``.
+
+    Uses NumPy when it is installed.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is None or not events:
+        scores = {}
+        for post_id, kind, at in events:
+            term = event_score(kind, at)
+            current = scores.get(post_id)
+            if current is None:
+                scores[post_id] = term
+            else:
+                high = max(current, term)
+                scores[post_id] = high + math.log1p(math.exp(-abs(current - term)))
+        return scores
+
+    rate, epoch = decay_rate(), EPOCH.timestamp()
+    log_weights = {kind: math.log(weight) for kind, weight in settings.TRENDING_WEIGHTS.items()}
+    post_ids = np.fromiter((event[0] for event in events), dtype=np.int64, count=len(events))
+    terms = np.fromiter(
+        (log_weights[kind] + rate * (at.timestamp() - epoch) for _, kind, at in events),
+        dtype=np.float64,
+        count=len(events),
+    )
+    # log-sum-exp per post: shift by each group's maximum before exponentiating.
+    unique_ids, groups = np.unique(post_ids, return_inverse=True)
+    peaks = np.full(len(unique_ids), -np.inf)
+    np.maximum.at(peaks, groups, terms)
+    totals = np.zeros(len(unique_ids))
+    np.add.at(totals, groups, np.exp(terms - peaks[groups]))
+    return dict(zip(unique_ids.tolist(), (peaks + np.log(totals)).tolist()))
+
+
+def post_events(post_model, like_model, comment_model, after, upto):
+    """Engagement events for posts with primary keys in ``(after, upto]``."""
+    posts = post_model.objects.filter(pk__gt=after)
+    likes = like_model.objects.filter(post_id__gt=after)
+    comments = comment_model.objects.filter(post_id__gt=after)
+    if upto is not None:
+        posts = posts.filter(pk__lte=upto)
+        likes = likes.filter(post_id__lte=upto)
+        comments = comments.filter(post_id__lte=upto)
+    events = [(pk, 'post', at) for pk, at in posts.values_list('pk', 'created_at')]
+    events += [(pk, 'like', at) for pk, at in likes.values_list('post_id', 'created_at')]
+    events += [(pk, 'comment', at) for pk, at in comments.values_list('post_id', 'created_at')]
+    return events
+
+
+def recompute(post_model, like_model, comment_model, after, upto):
+    """Rebuild the scores of posts with primary keys in ``(after, upto]`` from their events."""
+    scores = compute_scores(post_events(post_model, like_model, comment_model, after, upto))
+    post_model.objects.bulk_update(
+        [post_model(pk=pk, trending_score=score) for pk, score in scores.items()],
+        ['trending_score'],
+        batch_size=500,
+    )
+    return len(scores)
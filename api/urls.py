@@ -1,14 +1,17 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     AuthViewSet, UserViewSet, PostViewSet,
-    CommentViewSet
+    CommentViewSet, SearchViewSet, metrics
 )
 
 router = DefaultRouter()
 router.register(r'auth', AuthViewSet, basename='auth')
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'posts', PostViewSet, basename='post')
+router.register(r'search', SearchViewSet, basename='search')
 router.register(
     r'posts/(?P<post_pk>\d+)/comments',
     CommentViewSet,
@@ -16,5 +19,18 @@ router.register(
 )
 
 urlpatterns = [
+    path('metrics/', metrics, name='metrics'),
     path('', include(router.urls)),
-] 
\ No newline at end of file
+]
+
+# GET routes served by api/async_views.py when ASYNC_READ_VIEWS is on, ahead
+# of the router, which still serves every other route.
+async_urlpatterns = [
+    path('posts/', async_views.feed, name='post-list'),
+    path('posts/<int:pk>/', async_views.post_detail, name='post-detail'),
+    path('posts/<int:post_pk>/comments/', async_views.comment_list, name='comment-list'),
+    path('users/<int:pk>/', async_views.user_detail, name='user-detail'),
+]
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns[1:1] = async_urlpatterns
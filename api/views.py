@@ -1,22 +1,75 @@
 from django.shortcuts import render
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view, schema
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes, schema
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework_simplejwt import views as jwt_views
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Post, Comment, Like, Follow
+from django.core.cache import cache
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils.crypto import salted_hmac
+from .counters import increment
+from .metrics import PrometheusRenderer, registry as metrics_registry
+from .models import Post, Comment, Like, Follow, FollowSuggestion
+from .pagination import (
+    CommentPagination, FeedPagination, KeysetPagination, SuggestionPagination, TrendingPagination,
+    decode_cursor,
+)
+from .revocation import is_token_revoked, revoke_token
+from .throttling import LoginIPRateThrottle, LoginUsernameRateThrottle, ScopedRateThrottle
+from . import bulk, comments, conditional, fastserializers, fieldsets, realtime, search, suggestions, timeline, trending
 from .serializers import (
     UserSerializer, PostSerializer, CommentSerializer,
-    LikeSerializer, FollowSerializer
+    LikeSerializer, FollowSerializer, BulkIdsSerializer
 )
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 User = get_user_model()
 
+
+def _login_cache_key(user, password):
+    # The stored hash is part of the key, so changing the password (or an
+    # upgrade of its hash) invalidates cached tokens.
+    digest = salted_hmac(
+        'api.views.login', f'{user.pk}:{user.password}:{password}', algorithm='sha256'
+    ).hexdigest()
+    return f'login-tokens:{digest}'
+
+
+bulk_results_response = openapi.Response('Outcome for each id', openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        'results': openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'status': openapi.Schema(type=openapi.TYPE_STRING),
+                }
+            )
+        ),
+    }
+))
+
+
+def _bulk_action(request, apply):
+    serializer = BulkIdsSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    outcomes = apply(request.user, ids)
+    return Response({'results': [{'id': pk, 'status': outcomes[pk]} for pk in ids]})
+
+
 class AuthViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
+    throttle_scope = 'auth'
 
     @swagger_auto_schema(
         request_body=openapi.Schema(
@@ -68,22 +121,40 @@ class AuthViewSet(viewsets.ViewSet):
                 }
             )),
             401: 'Unauthorized',
-            404: 'User not found'
+            404: 'User not found',
+            429: 'Too many login attempts'
         }
     )
-    @action(detail=False, methods=['post'])
+    @action(
+        detail=False, methods=['post'],
+        throttle_classes=[ScopedRateThrottle, LoginIPRateThrottle, LoginUsernameRateThrottle]
+    )
     def login(self, request):
         username = request.data.get('username')
         password = request.data.get('password')
-        
+
         try:
             user = User.objects.get(username=username)
-            if user.check_password(password):
+            # A repeat login with the same password is answered from the cache
+            # without paying for the password hash again.
+            cache_key = _login_cache_key(user, password)
+            tokens = None
+            cached = cache.get(cache_key)
+            if cached is not None and not any(is_token_revoked(claims) for claims in cached['claims']):
+                tokens = cached['tokens']
+            if tokens is None and user.check_password(password):
                 refresh = RefreshToken.for_user(user)
-                return Response({
-                    'access_token': str(refresh.access_token),
+                access = refresh.access_token
+                tokens = {
+                    'access_token': str(access),
                     'refresh_token': str(refresh)
-                })
+                }
+                cached = {'tokens': tokens, 'claims': [access.payload, refresh.payload]}
+                # check_password() may have re-encoded the password with the
+                # preferred hasher, which changes the key.
+                cache.set(_login_cache_key(user, password), cached, settings.LOGIN_TOKEN_CACHE_TTL)
+            if tokens is not None:
+                return Response(tokens)
             return Response(
                 {'message': 'Invalid credentials'},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -112,7 +183,10 @@ class AuthViewSet(viewsets.ViewSet):
         try:
             refresh_token = request.data.get('refresh_token')
             token = RefreshToken(refresh_token)
-            token.blacklist()
+            revoke_token(token)
+            # Also revoke the access token this request was made with, if any.
+            if request.auth is not None:
+                revoke_token(request.auth)
             return Response({'message': 'Logged out successfully'})
         except Exception as e:
             return Response(
@@ -120,6 +194,15 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    throttle_scope = 'auth'
+
+
+class TokenRefreshView(jwt_views.TokenRefreshView):
+    throttle_scope = 'auth'
+
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -130,6 +213,23 @@ class UserViewSet(viewsets.ModelViewSet):
             return User.objects.exclude(id=self.request.user.id)
         return User.objects.all()
 
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_READ_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        rows = fastserializers.user_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(fastserializers.render_users(page))
+        return Response(fastserializers.render_users(rows))
+
+    def retrieve(self, request, *args, **kwargs):
+        user = self.get_object()
+        return conditional.respond(
+            request, conditional.make_etag(conditional.user_validators(user)),
+            lambda: Response(self.get_serializer(user).data),
+            last_modified=user.updated_at, cache_control=conditional.PROFILE,
+        )
+
     @action(detail=True, methods=['post'])
     def follow(self, request, pk=None):
         user_to_follow = self.get_object()
@@ -138,13 +238,24 @@ class UserViewSet(viewsets.ModelViewSet):
                 {"message": "You cannot follow yourself"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        follow, created = Follow.objects.get_or_create(
-            follower=request.user,
-            following=user_to_follow
-        )
-        
+
+        with transaction.atomic():
+            follow, created = Follow.objects.get_or_create(
+                follower=request.user,
+                following=user_to_follow
+            )
+            if created:
+                increment(User.objects.filter(pk=user_to_follow.pk), 'followers_count')
+                suggestions.update_suggestions.delay(
+                    follower_id=request.user.pk, followed_ids=[user_to_follow.pk]
+                )
+                realtime.following_changed(request.user.pk, followed=[user_to_follow.pk])
+
         if created:
+            if timeline.fans_out(user_to_follow):
+                timeline.backfill_timeline.delay(
+                    owner_id=request.user.pk, author_id=user_to_follow.pk
+                )
             return Response(
                 {"message": f"You are now following {user_to_follow.username}"},
                 status=status.HTTP_201_CREATED
@@ -157,13 +268,20 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def unfollow(self, request, pk=None):
         user_to_unfollow = self.get_object()
-        follow = Follow.objects.filter(
-            follower=request.user,
-            following=user_to_unfollow
-        ).first()
-        
-        if follow:
-            follow.delete()
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(
+                follower=request.user,
+                following=user_to_unfollow
+            ).delete()
+            if deleted:
+                increment(User.objects.filter(pk=user_to_unfollow.pk), 'followers_count', -1)
+                suggestions.update_suggestions.delay(
+                    follower_id=request.user.pk, unfollowed_ids=[user_to_unfollow.pk]
+                )
+                realtime.following_changed(request.user.pk, unfollowed=[user_to_unfollow.pk])
+
+        if deleted:
+            timeline.get_timeline_backend().remove_author(request.user.pk, user_to_unfollow.pk)
             return Response(
                 {"message": f"You have unfollowed {user_to_unfollow.username}"}
             )
@@ -172,22 +290,145 @@ class UserViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @swagger_auto_schema(responses={200: openapi.Response(
+        'Suggested users, best first, each with a `mutual_count`', UserSerializer(many=True)
+    )})
+    @action(detail=False, methods=['get'], pagination_class=SuggestionPagination)
+    def suggestions(self, request):
+        """Accounts followed by the accounts you follow, ranked by how many of them."""
+        queryset = FollowSuggestion.objects.filter(user_id=request.user.pk).exclude(
+            suggested__in=Follow.objects.filter(follower_id=request.user.pk).values('following_id')
+        ).select_related('suggested')
+        page = self.paginate_queryset(queryset)
+        users = UserSerializer([suggestion.suggested for suggestion in page], many=True).data
+        return self.get_paginated_response([
+            {**user, 'mutual_count': suggestion.score}
+            for user, suggestion in zip(users, page)
+        ])
+
+    @swagger_auto_schema(
+        request_body=BulkIdsSerializer,
+        responses={200: bulk_results_response, 400: 'Bad Request'}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-follow')
+    def bulk_follow(self, request):
+        """Follow several users; each id reports followed, already_following, not_found or self."""
+        return _bulk_action(request, bulk.follow_many)
+
+    @swagger_auto_schema(
+        request_body=BulkIdsSerializer,
+        responses={200: bulk_results_response, 400: 'Bad Request'}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-unfollow')
+    def bulk_unfollow(self, request):
+        """Unfollow several users; each id reports unfollowed or not_following."""
+        return _bulk_action(request, bulk.unfollow_many)
+
+preview_comments_parameter = openapi.Parameter(
+    'preview_comments', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+    description=f'Embed the first N comments of each post as `top_comments` (max {comments.PREVIEW_MAX}).',
+)
+fields_parameter = openapi.Parameter(
+    'fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+    description=f'Comma-separated post fields to return, out of {", ".join(PostSerializer.Meta.fields)}.',
+)
+mode_parameter = openapi.Parameter(
+    'mode', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(fieldsets.MODES),
+    description='`normalized` replaces embedded authors with ids and lists them once in `users`.',
+)
+
+
 class PostViewSet(viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = FeedPagination
+
+    def get_throttles(self):
+        # The feeds are the most expensive reads, with a budget of their own.
+        if self.action in ('list', 'trending_feed'):
+            self.throttle_scope = 'feed'
+        return super().get_throttles()
 
     def get_queryset(self):
-        if self.action == 'list':
-            # For listing posts, show posts from followed users
-            return Post.objects.filter(
-                user__in=self.request.user.following.values_list('following', flat=True)
-            ).order_by('-created_at')
-        # For other actions, show all posts
-        return Post.objects.all()
+        # The home feed's paginator picks the posts from the reader's timeline.
+        queryset = Post.objects.select_related('user')
+        if self.action in ('list', 'retrieve', 'trending_feed'):
+            ordering = self.paginator.ordering if self.action != 'retrieve' else ()
+            queryset = fieldsets.narrow(queryset, fieldsets.requested_fields(self.request), ordering)
+        return queryset
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        post = serializer.save(user=self.request.user)
+        # Queued on commit; the response does not wait for the fan-out.
+        timeline.fan_out_post.delay(post_id=post.pk)
+        realtime.post_created(post, serializer.data)
+
+    def comment_previews(self, post_ids, rows=False):
+        """The ?preview_comments=N previews of the posts, or None when not asked for."""
+        size = comments.preview_size(self.request)
+        if not size:
+            return None
+        return comments.previews(post_ids, size, rows)
+
+    def serialize_posts(self, posts, previews, fields=None):
+        data = self.get_serializer(posts, many=True, fields=fields).data
+        if previews is None:
+            return data
+        return comments.with_previews(posts, data, previews)
+
+    def page_response(self, queryset):
+        fields = fieldsets.requested_fields(self.request)
+        normalized = fieldsets.is_normalized(self.request)
+        rows = settings.FAST_READ_SERIALIZERS
+        if rows:
+            queryset = fastserializers.post_rows(queryset, fields, self.paginator.ordering)
+        page = self.paginate_queryset(queryset)
+        previews = self.comment_previews([post['id'] if rows else post.pk for post in page], rows)
+        etag = conditional.make_etag(
+            self.paginator.next_position,
+            conditional.post_validators(page, previews, authors=fieldsets.with_authors(fields)),
+        )
+
+        def render():
+            if rows:
+                data = fastserializers.render_posts(page, fields)
+                if previews is not None:
+                    data = comments.with_preview_rows(data, previews)
+            else:
+                data = self.serialize_posts(page, previews, fields)
+            if not normalized:
+                return self.get_paginated_response(data)
+            results, users = fieldsets.normalize(data)
+            response = self.get_paginated_response(results)
+            response.data['users'] = users
+            return response
+        return conditional.respond(self.request, etag, render)
+
+    @swagger_auto_schema(manual_parameters=[preview_comments_parameter, fields_parameter, mode_parameter])
+    def list(self, request, *args, **kwargs):
+        return self.page_response(self.get_queryset())
+
+    @swagger_auto_schema(manual_parameters=[preview_comments_parameter, fields_parameter])
+    def retrieve(self, request, *args, **kwargs):
+        fields = fieldsets.requested_fields(request)
+        post = self.get_object()
+        previews = self.comment_previews([post.pk])
+        etag = conditional.make_etag(
+            conditional.post_validators([post], previews, authors=fieldsets.with_authors(fields))
+        )
+        return conditional.respond(
+            request, etag, lambda: Response(self.serialize_posts([post], previews, fields)[0])
+        )
+
+    @swagger_auto_schema(
+        manual_parameters=[preview_comments_parameter, fields_parameter, mode_parameter],
+        responses={200: PostSerializer(many=True)},
+    )
+    @action(detail=False, methods=['get'], url_path='trending', pagination_class=TrendingPagination)
+    def trending_feed(self, request):
+        """All posts, ranked by time-decayed likes and comments."""
+        return self.page_response(self.get_queryset())
 
     @swagger_auto_schema(
         request_body=openapi.Schema(
@@ -205,7 +446,7 @@ class PostViewSet(viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            if instance.user != request.user:
+            if instance.user_id != request.user.id:
                 return Response(
                     {'message': 'You can only edit your own posts'},
                     status=status.HTTP_403_FORBIDDEN
@@ -226,7 +467,7 @@ class PostViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            if instance.user != request.user:
+            if instance.user_id != request.user.id:
                 return Response(
                     {'message': 'You can only delete your own posts'},
                     status=status.HTTP_403_FORBIDDEN
@@ -241,11 +482,18 @@ class PostViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         post = self.get_object()
-        like, created = Like.objects.get_or_create(
-            user=request.user,
-            post=post
-        )
-        
+        with transaction.atomic():
+            like, created = Like.objects.get_or_create(
+                user=request.user,
+                post=post
+            )
+            if created:
+                increment(
+                    Post.objects.filter(pk=post.pk), 'likes_count',
+                    **trending.record('like', like.created_at)
+                )
+                realtime.post_liked(post.user_id, post.pk, request.user.pk)
+
         if created:
             return Response(
                 {"message": "Post liked"},
@@ -259,26 +507,155 @@ class PostViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def unlike(self, request, pk=None):
         post = self.get_object()
-        like = Like.objects.filter(
-            user=request.user,
-            post=post
-        ).first()
-        
-        if like:
-            like.delete()
+        with transaction.atomic():
+            likes = Like.objects.filter(user=request.user, post=post)
+            liked_at = likes.values_list('created_at', flat=True).first()
+            deleted, _ = likes.delete()
+            if deleted:
+                increment(
+                    Post.objects.filter(pk=post.pk), 'likes_count', -1,
+                    **trending.record('like', liked_at, removed=True)
+                )
+
+        if deleted:
             return Response({"message": "Post unliked"})
         return Response(
             {"message": "You have not liked this post"},
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @swagger_auto_schema(
+        request_body=BulkIdsSerializer,
+        responses={200: bulk_results_response, 400: 'Bad Request'}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-like')
+    def bulk_like(self, request):
+        """Like several posts; each id reports liked, already_liked or not_found."""
+        return _bulk_action(request, bulk.like_many)
+
+    @swagger_auto_schema(
+        request_body=BulkIdsSerializer,
+        responses={200: bulk_results_response, 400: 'Bad Request'}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-unlike')
+    def bulk_unlike(self, request):
+        """Unlike several posts; each id reports unliked or not_liked."""
+        return _bulk_action(request, bulk.unlike_many)
+
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CommentPagination
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        post = get_object_or_404(Post, pk=self.kwargs['post_pk'])
+        comment = serializer.save(user=self.request.user, post=post)
+        increment(
+            Post.objects.filter(pk=post.pk), 'comments_count',
+            **trending.record('comment', comment.created_at)
+        )
+        realtime.comment_created(post.user_id, comment, serializer.data)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        increment(
+            Post.objects.filter(pk=instance.post_id), 'comments_count', -1,
+            **trending.record('comment', instance.created_at, removed=True)
+        )
 
     def get_queryset(self):
-        return Comment.objects.filter(post_id=self.kwargs['post_pk'])
+        return comments.thread_queryset(Comment.objects.filter(post_id=self.kwargs['post_pk']))
+
+    def list(self, request, *args, **kwargs):
+        rows = settings.FAST_READ_SERIALIZERS
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(fastserializers.comment_rows(queryset) if rows else queryset)
+        etag = conditional.make_etag(self.paginator.next_position, conditional.comment_validators(page))
+
+        def render():
+            data = fastserializers.render_comments(page) if rows else self.get_serializer(page, many=True).data
+            return self.get_paginated_response(data)
+        return conditional.respond(request, etag, render)
+
+    def retrieve(self, request, *args, **kwargs):
+        comment = self.get_object()
+        return conditional.respond(
+            request, conditional.make_etag(conditional.comment_validators([comment])),
+            lambda: Response(self.get_serializer(comment).data),
+            last_modified=max(comment.updated_at, comment.user.updated_at),
+        )
+
+class SearchViewSet(viewsets.ViewSet):
+    """Ranked full-text search; see api/search.py."""
+    permission_classes = [IsAuthenticated]
+    max_query_length = 200
+
+    query_parameters = [
+        openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+    ]
+
+    def _search(self, request, index, queryset, serializer_class):
+        query = request.query_params.get('q', '').strip()
+        if not query or len(query) > self.max_query_length:
+            return Response(
+                {'message': f'q must be 1 to {self.max_query_length} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        paginator = KeysetPagination()
+        paginator.request = request
+        page_size = paginator.get_page_size(request)
+        after = None
+        token = request.query_params.get(paginator.cursor_query_param)
+        if token:
+            after = decode_cursor(token)
+            if (
+                len(after) != 2
+                or not isinstance(after[0], (int, float))
+                or not isinstance(after[1], int)
+            ):
+                raise NotFound(paginator.invalid_cursor_message)
+
+        hits = search.search(index, query, after, page_size + 1)
+        page = hits[:page_size]
+        if len(hits) > page_size:
+            last_pk, last_rank, _ = page[-1]
+            paginator.next_position = [last_rank, last_pk]
+        else:
+            paginator.next_position = None
+
+        instances = queryset.in_bulk([pk for pk, _, _ in page])
+        # Rows deleted since they were matched are skipped.
+        found = [(instances[pk], highlight) for pk, _, highlight in page if pk in instances]
+        data = serializer_class([instance for instance, _ in found], many=True).data
+        results = [
+            {**item, 'highlight': highlight}
+            for item, (_, highlight) in zip(data, found)
+        ]
+        return paginator.get_paginated_response(results)
+
+    @swagger_auto_schema(manual_parameters=query_parameters, responses={400: 'Missing or too long q'})
+    @action(detail=False, methods=['get'])
+    def posts(self, request):
+        return self._search(
+            request, search.INDEXES['posts'], Post.objects.select_related('user'), PostSerializer
+        )
+
+    @swagger_auto_schema(manual_parameters=query_parameters, responses={400: 'Missing or too long q'})
+    @action(detail=False, methods=['get'])
+    def users(self, request):
+        return self._search(request, search.INDEXES['users'], User.objects.all(), UserSerializer)
+
+
+@swagger_auto_schema(method='get', auto_schema=None)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+@renderer_classes([PrometheusRenderer])
+def metrics(request):
+    """Per-endpoint request histograms in the Prometheus text format; see api/metrics.py."""
+    return Response(metrics_registry.export())
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '').split(',')
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +53,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.metrics.MetricsMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,11 +87,111 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DB_ENGINE picks the profile: 'sqlite' (the default) or 'postgresql'.
+# Connections are kept open for DB_CONN_MAX_AGE seconds and health-checked
+# before reuse.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'social_media'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            # Starts write transactions with BEGIN IMMEDIATE (see
+            # backend/sqlite3/base.py).
+            'ENGINE': 'backend.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'Unknown DB_ENGINE {DB_ENGINE!r}; use sqlite or postgresql.')
+
+# Read replicas (see api/replicas.py). DB_REPLICAS is a comma-separated list
+# of replica hosts (PostgreSQL) or database files (SQLite); each becomes a
+# `replica<N>` alias that otherwise copies the primary's settings. Safe-method
+# requests read from a random replica, except for REPLICA_PIN_SECONDS after
+# the same client or user wrote something.
+
+DB_REPLICAS = [replica for replica in os.getenv('DB_REPLICAS', '').split(',') if replica]
+for index, replica in enumerate(DB_REPLICAS, 1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST' if DB_ENGINE == 'postgresql' else 'NAME': replica,
+        'TEST': {'MIRROR': 'default'},
     }
+READ_REPLICAS = [f'replica{index}' for index in range(1, len(DB_REPLICAS) + 1)]
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+# Applied to every new SQLite connection (see api/signals.py). WAL lets readers
+# run alongside the single writer, and busy_timeout makes a writer wait for the
+# lock instead of failing with "database is locked". Set SQLITE_TUNING=False
+# to fall back to SQLite's defaults.
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', 'True').lower() in ('1', 'true', 'yes')
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'temp_store': 'memory',
+} if SQLITE_TUNING else {}
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+#
+# The `representations` cache holds rendered post and user dicts (see
+# api/cache.py). Locmem evicts least-recently-used entries once MAX_ENTRIES is
+# reached; point it at a file cache with REPRESENTATION_CACHE_BACKEND and
+# REPRESENTATION_CACHE_LOCATION to share it between worker processes. Bump
+# REPRESENTATION_CACHE_VERSION when serializer output changes.
+
+REPRESENTATION_CACHE_ALIAS = 'representations'
+
+# Token buckets of the read/write/feed/auth throttles (see api/buckets.py).
+# Per process by default; THROTTLE_CACHE_BACKEND=api.buckets.TokenBucketFileBasedCache
+# with a shared THROTTLE_CACHE_LOCATION directory makes budgets global to all
+# workers on the host.
+THROTTLE_CACHE_ALIAS = 'throttles'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    REPRESENTATION_CACHE_ALIAS: {
+        'BACKEND': os.getenv(
+            'REPRESENTATION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('REPRESENTATION_CACHE_LOCATION', 'representations'),
+        'TIMEOUT': int(os.getenv('REPRESENTATION_CACHE_TIMEOUT', 300)),
+        'VERSION': int(os.getenv('REPRESENTATION_CACHE_VERSION', 1)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('REPRESENTATION_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+    THROTTLE_CACHE_ALIAS: {
+        'BACKEND': os.getenv('THROTTLE_CACHE_BACKEND', 'api.buckets.TokenBucketLocMemCache'),
+        'LOCATION': os.getenv('THROTTLE_CACHE_LOCATION', 'throttles'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('THROTTLE_CACHE_MAX_ENTRIES', 100000)),
+        },
+    },
 }
 
 
@@ -110,6 +214,40 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/5.0/topics/auth/passwords/
+#
+# PASSWORD_HASHER_PROFILE picks the hasher new passwords are encoded with:
+# 'pbkdf2' (default, no extra dependency), 'argon2' (needs argon2-cffi) or
+# 'bcrypt' (needs bcrypt). The other hashers stay listed so existing hashes
+# keep verifying; they are upgraded on the user's next successful login.
+
+PASSWORD_HASHER_PROFILES = {
+    'pbkdf2': 'api.hashers.TunedPBKDF2PasswordHasher',
+    'argon2': 'api.hashers.TunedArgon2PasswordHasher',
+    'bcrypt': 'api.hashers.TunedBCryptSHA256PasswordHasher',
+}
+PASSWORD_HASHER_PROFILE = os.getenv('PASSWORD_HASHER_PROFILE', 'pbkdf2')
+PASSWORD_HASHERS = [PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]] + [
+    hasher for profile, hasher in PASSWORD_HASHER_PROFILES.items()
+    if profile != PASSWORD_HASHER_PROFILE
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', 720000))
+# Argon2id defaults follow the OWASP minimum (19 MiB, 2 passes, 1 lane).
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', 19456))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', 1))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 10))
+
+# Seconds a successful login's tokens are reused for a repeat login with the
+# same credentials, skipping the password hash. 0 disables the cache.
+LOGIN_TOKEN_CACHE_TTL = int(os.getenv('LOGIN_TOKEN_CACHE_TTL', 60))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -135,11 +273,33 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson when installed, DRF's stdlib JSON otherwise (see api/fastjson.py).
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Token buckets per user (per IP when signed out); see api/throttling.py.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.ScopedRateThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'read': os.getenv('READ_RATE', '600/min'),
+        'write': os.getenv('WRITE_RATE', '120/min'),
+        'feed': os.getenv('FEED_RATE', '120/min'),
+        'auth': os.getenv('AUTH_RATE', '60/min'),
+        'login_ip': os.getenv('LOGIN_RATE_PER_IP', '30/min'),
+        'login_username': os.getenv('LOGIN_RATE_PER_USERNAME', '10/min'),
+    },
 }
 
 from datetime import timedelta
@@ -149,10 +309,87 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.RevocationAwareTokenRefreshSerializer',
 }
 
+# Revoked tokens (see api/revocation.py). Each worker re-reads recent
+# revocations every REVOCATION_SYNC_INTERVAL seconds, so a token revoked on
+# another worker is rejected everywhere within that window.
+REVOCATION_SYNC_INTERVAL = float(os.getenv('REVOCATION_SYNC_INTERVAL', 5))
+REVOCATION_REBUILD_INTERVAL = float(os.getenv('REVOCATION_REBUILD_INTERVAL', 300))
+REVOCATION_BLOOM_CAPACITY = 10000
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+
+# How long each worker trusts its cached view of a user's active flag before
+# re-checking the database (see api/authentication.py).
+JWT_USER_STATE_TTL = int(os.getenv('JWT_USER_STATE_TTL', 30))
+
 AUTH_USER_MODEL = 'api.User'
 
+# Home timelines (see api/timeline.py)
+
+TIMELINE_BACKEND = os.getenv('TIMELINE_BACKEND', 'api.timeline.DatabaseTimelineBackend')
+# Authors with at least this many followers are merged into feeds at read
+# time instead of being pushed to every follower on write.
+TIMELINE_FANOUT_THRESHOLD = int(os.getenv('TIMELINE_FANOUT_THRESHOLD', 10000))
+TIMELINE_FANOUT_BATCH_SIZE = 1000
+# Recent posts copied into a timeline when its owner follows someone.
+TIMELINE_BACKFILL_SIZE = 100
+# Entries kept per timeline; older posts of authors fanned out on write drop
+# out of the feed.
+TIMELINE_SIZE = int(os.getenv('TIMELINE_SIZE', 800))
+
+# Trending feed (see api/trending.py): each like, comment and the post itself
+# adds its weight to the post's score, halving every TRENDING_HALF_LIFE_HOURS.
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 12))
+TRENDING_WEIGHTS = {
+    'post': 1.0,
+    'like': 1.0,
+    'comment': 2.0,
+}
+
+# Follow suggestions kept per user (see api/suggestions.py).
+SUGGESTIONS_TOP_K = int(os.getenv('SUGGESTIONS_TOP_K', 50))
+
+# Largest id list accepted by the bulk follow/like endpoints (see api/bulk.py).
+BULK_ACTION_MAX_IDS = int(os.getenv('BULK_ACTION_MAX_IDS', 100))
+
+# Per-endpoint query count and latency histograms (see api/metrics.py),
+# served to staff at /api/metrics/.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+# Fraction of requests measured.
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))
+
+# Build list responses straight from values() rows rather than through the
+# ModelSerializers and the representation cache (see api/fastserializers.py).
+FAST_READ_SERIALIZERS = os.getenv('FAST_READ_SERIALIZERS', 'True').lower() in ('1', 'true', 'yes')
+
+# Serve the feed, post, comment list and user reads with the async views in
+# api/async_views.py. Only worth it under backend/asgi.py: under WSGI each
+# request would start an event loop.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False').lower() in ('1', 'true', 'yes')
+
+# Live events over WebSockets (see api/realtime.py). The local broker only
+# reaches sockets served by the process that published the event.
+REALTIME_BROKER = os.getenv('REALTIME_BROKER', 'api.realtime.LocalBroker')
+# Messages buffered per connection before the oldest are dropped.
+REALTIME_BUFFER_SIZE = int(os.getenv('REALTIME_BUFFER_SIZE', 100))
+# Seconds between re-checks of an open socket's access token against revocations.
+REALTIME_REVOCATION_CHECK_INTERVAL = float(os.getenv('REALTIME_REVOCATION_CHECK_INTERVAL', 60))
+
+# Background tasks (see api/tasks.py)
+
+# Run tasks inline right after commit instead of queueing them for
+# `manage.py run_worker`. Disable in production.
+TASKS_EAGER = os.getenv('TASKS_EAGER', str(DEBUG)).lower() in ('1', 'true', 'yes')
+TASK_WORKER_CONCURRENCY = int(os.getenv('TASK_WORKER_CONCURRENCY', 4))
+TASK_MAX_ATTEMPTS = 5
+# Seconds before the first retry; doubled on every further attempt.
+TASK_RETRY_BACKOFF = 2
+TASK_RETRY_BACKOFF_MAX = 300
+# Running jobs older than this are assumed orphaned and requeued.
+TASK_LOCK_TIMEOUT = 300
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -0,0 +1,17 @@
+"""
+SQLite backend whose transactions take the write lock up front.
+
+Django 5.0 opens transactions with a plain (deferred) BEGIN. A transaction
+that reads and then writes, such as get_or_create() in an atomic block, then
+has to upgrade its lock mid-way; if another connection committed in between,
+SQLite fails the upgrade at once with "database is locked" instead of waiting
+out busy_timeout. BEGIN IMMEDIATE makes writers queue on busy_timeout.
+It is used unless SQLITE_TUNING is off.
+"""
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if settings.SQLITE_TUNING else 'BEGIN')
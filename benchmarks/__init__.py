@@ -0,0 +1,67 @@
+"""
+Performance benchmarks.
+
+Run them from the project root, e.g. ``python -m benchmarks.login``. Every
+script boots Django against a throwaway test database, so db.sqlite3 is never
+touched.
+"""
+import contextlib
+import math
+import os
+import time
+
+# Budgets no benchmark client can exhaust: pass to setup() to keep the
+# throttles out of the way of the measurement.
+UNTHROTTLED = {
+    name: '1000000/s'
+    for name in ('READ_RATE', 'WRITE_RATE', 'FEED_RATE', 'AUTH_RATE', 'LOGIN_RATE_PER_IP', 'LOGIN_RATE_PER_USERNAME')
+}
+
+
+def setup(**environ):
+    """Configure Django. Keyword arguments are set as environment variables first."""
+    for key, value in environ.items():
+        os.environ.setdefault(key, str(value))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def run_for(func, seconds, min_calls=3):
+    """Call `func` repeatedly for about `seconds`; return per-call latencies."""
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while len(samples) < min_calls or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def print_table(headers, rows):
+    rows = [[str(cell) for cell in row] for row in rows]
+    widths = [max(len(str(h)), *(len(r[i]) for r in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print('  '.join('-' * w for w in widths))
+    for row in rows:
+        print('  '.join(cell.ljust(w) for cell, w in zip(row, widths)))
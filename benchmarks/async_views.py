@@ -0,0 +1,194 @@
+"""
+Read endpoints through the sync viewsets under WSGI against the async views
+(ASYNC_READ_VIEWS) under ASGI, as concurrency grows, with simulated database
+latency.
+
+    python -m benchmarks.async_views [--latency-ms 50] [--threads 8]
+                                     [--concurrency 8 32 128] [--seconds 3]
+
+Every query sleeps --latency-ms before running, as a round trip to a database
+server would. The WSGI side is a worker with --threads threads, like
+``gunicorn --threads``, kept busy by as many clients; the ASGI side is
+backend/asgi.py's application on one event loop, driven by each
+--concurrency number of clients. Both run in-process, without sockets, over a
+graph from api.seeding; the scenarios are the feed, post detail, comment list
+and user detail reads.
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import UNTHROTTLED, percentile, print_table, setup, test_database
+
+setup(**UNTHROTTLED)
+
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from django.urls import include, path  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from api import seeding  # noqa: E402
+from api.models import User  # noqa: E402
+from api.urls import async_urlpatterns  # noqa: E402
+from backend.urls import urlpatterns as project_urlpatterns  # noqa: E402
+
+# URLconf for the ASGI runs: the async views ahead of everything else.
+urlpatterns = [path('api/', include(async_urlpatterns)), *project_urlpatterns]
+
+SCENARIOS = {
+    'feed': lambda graph, rng: '/api/posts/',
+    'post': lambda graph, rng: f'/api/posts/{rng.choice(graph.post_ids)}/',
+    'comments': lambda graph, rng: f'/api/posts/{rng.choice(graph.post_ids)}/comments/',
+    'user': lambda graph, rng: f'/api/users/{rng.choice(graph.user_ids)}/',
+}
+
+
+def add_latency(seconds):
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, delay)
+
+    connection_created.connect(install, weak=False)
+    install(None, connection)
+
+
+def run_wsgi(scenario, graph, tokens, threads, seconds):
+    application = WSGIHandler()
+    samples, errors = [], []
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            user_id = rng.choice(graph.user_ids)
+            path, _, query = scenario(graph, rng).partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+                'HTTP_AUTHORIZATION': f'Bearer {tokens[user_id]}',
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+            }
+            statuses = []
+            start = time.perf_counter()
+            response = application(environ, lambda status, headers: statuses.append(status))
+            b''.join(response)
+            response.close()
+            samples.append(time.perf_counter() - start)
+            if not statuses[0].startswith('200'):
+                errors.append(statuses[0])
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return samples, errors, time.perf_counter() - started
+
+
+async def run_asgi(scenario, graph, tokens, concurrency, seconds):
+    application = ASGIHandler()
+    samples, errors = [], []
+    deadline = time.perf_counter() + seconds
+
+    async def client(index):
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            user_id = rng.choice(graph.user_ids)
+            path, _, query = scenario(graph, rng).partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+                'query_string': query.encode(), 'root_path': '',
+                'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {tokens[user_id]}'.encode())],
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            body_sent = False
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # The client stays connected; Django stops listening once it
+                # has responded.
+                await asyncio.Event().wait()
+
+            statuses = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            samples.append(time.perf_counter() - start)
+            if statuses[0] != 200:
+                errors.append(statuses[0])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return samples, errors, time.perf_counter() - started
+
+
+def row(scenario, server, result):
+    samples, errors, elapsed = result
+    return [
+        scenario, server, f'{len(samples) / elapsed:.1f}',
+        f'{percentile(samples, 50) * 1000:.1f}', f'{percentile(samples, 95) * 1000:.1f}', len(errors),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Added to every query.')
+    parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128], help='ASGI clients.')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--seconds', type=float, default=3.0, help='Time spent per scenario and server.')
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            # A file rather than shared memory, so every thread sees the data.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        with test_database():
+            graph = seeding.seed(users=args.users, timelines=True)
+            tokens = {
+                user.pk: str(AccessToken.for_user(user))
+                for user in User.objects.filter(pk__in=list(graph.user_ids))
+            }
+            connection.close()
+            add_latency(args.latency_ms / 1000)
+            for name in args.scenarios:
+                scenario = SCENARIOS[name]
+                rows.append(row(name, f'wsgi x{args.threads} threads', run_wsgi(
+                    scenario, graph, tokens, args.threads, args.seconds
+                )))
+                with override_settings(ROOT_URLCONF=sys.modules[__name__]):
+                    for concurrency in args.concurrency:
+                        rows.append(row(name, f'asgi x{concurrency} clients', asyncio.run(run_asgi(
+                            scenario, graph, tokens, concurrency, args.seconds
+                        ))))
+
+    print(f'Read endpoints, {args.latency_ms:g} ms per query')
+    print_table(['scenario', 'server', 'req/s', 'p50 ms', 'p95 ms', 'errors'], rows)
+
+
+if __name__ == '__main__':
+    main()
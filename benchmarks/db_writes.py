@@ -0,0 +1,120 @@
+"""
+Concurrent write throughput (likes and comments) for each database profile.
+
+    python -m benchmarks.db_writes [--seconds 5] [--threads 8]
+
+With the default DB_ENGINE=sqlite this compares plain SQLite
+(SQLITE_TUNING=False: rollback journal, deferred transactions) against the
+tuned profile (WAL, synchronous=NORMAL, mmap, busy_timeout, BEGIN IMMEDIATE),
+each on a fresh database file. With DB_ENGINE=postgresql and the DB_* settings
+pointing at a server, it measures that server instead.
+
+Writers are threads in one process, each with its own connection, hitting the
+API through the test client. Failed requests (e.g. "database is locked") are
+counted as errors.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks import UNTHROTTLED, percentile, print_table, setup, test_database
+
+setup(**UNTHROTTLED)
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from api.models import Post, User  # noqa: E402
+
+SQLITE_PROFILES = {
+    'sqlite, defaults': {'SQLITE_TUNING': False, 'SQLITE_PRAGMAS': {}},
+    'sqlite, tuned': {'SQLITE_TUNING': True, 'SQLITE_PRAGMAS': settings.SQLITE_PRAGMAS},
+}
+
+
+def writer(user, post_ids, deadline, samples, errors):
+    client = APIClient(raise_request_exception=False)
+    client.force_authenticate(user)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            post_id = post_ids[i % len(post_ids)]
+            if i % 3 == 2:
+                request = (f'/api/posts/{post_id}/comments/', {'content': f'comment {i}'})
+            else:
+                # Alternate like/unlike so every request is a write.
+                request = (f'/api/posts/{post_id}/{"unlike" if i % 3 else "like"}/', None)
+            start = time.perf_counter()
+            response = client.post(*request)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+            else:
+                samples.append(time.perf_counter() - start)
+            i += 1
+    finally:
+        connection.close()
+
+
+def measure(name, threads, seconds):
+    with test_database():
+        author = User.objects.create_user(username='author', email='author@bench.local')
+        post_ids = [Post.objects.create(user=author, content=str(i)).pk for i in range(50)]
+        users = [
+            User.objects.create_user(username=f'writer{i}', email=f'writer{i}@bench.local')
+            for i in range(threads)
+        ]
+        connection.close()
+
+        samples, errors = [], []
+        deadline = time.perf_counter() + seconds
+        workers = [
+            threading.Thread(target=writer, args=(user, post_ids, deadline, samples, errors))
+            for user in users
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+    return [
+        name,
+        f'{len(samples) / seconds:.1f}',
+        len(errors),
+        f'{percentile(samples, 50) * 1000:.2f}' if samples else '-',
+        f'{percentile(samples, 99) * 1000:.2f}' if samples else '-',
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5.0, help='Time spent on each profile.')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent writers.')
+    args = parser.parse_args()
+
+    # Failed writes are counted, not logged.
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+    rows = []
+    if connection.vendor == 'sqlite':
+        with tempfile.TemporaryDirectory() as directory:
+            for name, overrides in SQLITE_PROFILES.items():
+                # A file, not the usual in-memory test database, so writers
+                # really contend for the lock.
+                path = os.path.join(directory, f'{len(rows)}.sqlite3')
+                connection.settings_dict['TEST']['NAME'] = path
+                with override_settings(**overrides):
+                    rows.append(measure(name, args.threads, args.seconds))
+    else:
+        rows.append(measure(connection.vendor, args.threads, args.seconds))
+
+    print(f'Concurrent writes, {args.threads} threads')
+    print_table(['profile', 'writes/s', 'errors', 'p50 ms', 'p99 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+Throughput, latency and query counts of the hot endpoints on a synthetic graph.
+
+    python -m benchmarks.endpoints [--users 1000] [--degree zipf] [--seconds 3]
+                                   [--threads 8] [--check | --record]
+
+Scenarios:
+
+* feed: GET /api/posts/ (PostViewSet.list) as a random user;
+* like: POST /api/posts/<id>/like/ followed by .../unlike/ for random
+  user/post pairs, so the graph does not drift;
+* comments: GET /api/posts/<id>/comments/ (CommentViewSet.list);
+* login: POST /api/auth/login/ (AuthViewSet.login) as a random user.
+
+Every scenario runs first through the Django test client on one thread,
+capturing the queries of each request, then (unless --threads 0) through a
+multi-threaded HTTP load generator against a local WSGI server, whose query
+counts come from the metrics middleware. The graph is loaded with
+api.seeding, like `manage.py seed --timelines` (see `--help` for its size and
+shape).
+
+--check compares each scenario's worst per-request query count on the test
+client with QUERY_BUDGETS (benchmarks/query_budgets.json) and exits with
+status 1 if any is over budget; --record rewrites the file from this run.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from benchmarks import UNTHROTTLED, percentile, print_table, setup, test_database
+
+setup(**UNTHROTTLED)
+
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from api import metrics, seeding  # noqa: E402
+from api.models import User  # noqa: E402
+
+QUERY_BUDGETS = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+PASSWORD = 'correct horse battery staple'
+
+
+def feed_requests(graph, rng):
+    while True:
+        yield 'GET', '/api/posts/', None, rng.choice(graph.user_ids)
+
+
+def like_requests(graph, rng):
+    while True:
+        user_id, post_id = rng.choice(graph.user_ids), rng.choice(graph.post_ids)
+        yield 'POST', f'/api/posts/{post_id}/like/', None, user_id
+        yield 'POST', f'/api/posts/{post_id}/unlike/', None, user_id
+
+
+def comment_requests(graph, rng):
+    while True:
+        yield 'GET', f'/api/posts/{rng.choice(graph.post_ids)}/comments/', None, rng.choice(graph.user_ids)
+
+
+def login_requests(graph, rng):
+    while True:
+        user_id = rng.choice(graph.user_ids)
+        yield 'POST', '/api/auth/login/', {'username': seeding.username(user_id), 'password': PASSWORD}, None
+
+
+SCENARIOS = {
+    'feed': feed_requests,
+    'like': like_requests,
+    'comments': comment_requests,
+    'login': login_requests,
+}
+
+
+class Tokens(dict):
+    """Access tokens by user id, minted on first use."""
+
+    def __missing__(self, user_id):
+        token = self[user_id] = str(AccessToken.for_user(User.objects.get(pk=user_id)))
+        return token
+
+    def headers(self, user_id):
+        return {} if user_id is None else {'Authorization': f'Bearer {self[user_id]}'}
+
+
+def run_test_client(requests, tokens, seconds):
+    client = Client()
+    samples, queries, errors = [], [], 0
+    deadline = time.perf_counter() + seconds
+    while len(samples) < 3 or time.perf_counter() < deadline:
+        method, path, data, user_id = next(requests)
+        headers = tokens.headers(user_id)
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as captured:
+            response = client.generic(
+                method, path, json.dumps(data) if data is not None else '',
+                content_type='application/json', headers=headers,
+            )
+        samples.append(time.perf_counter() - start)
+        queries.append(len(captured))
+        errors += response.status_code >= 500
+    return {
+        'throughput': len(samples) / sum(samples),
+        'samples': samples,
+        'errors': errors,
+        'queries': max(queries),
+    }
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def run_http(base_url, make_requests, graph, tokens, threads, seconds):
+    samples, errors = [], []
+    # Mint every token up front so the workers only measure requests.
+    for user_id in graph.user_ids:
+        tokens[user_id]
+    metrics.registry.reset()
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        requests = make_requests(graph, random.Random(index))
+        while time.perf_counter() < deadline:
+            method, path, data, user_id = next(requests)
+            request = Request(
+                base_url + path,
+                data=json.dumps(data or {}).encode() if method == 'POST' else None,
+                headers={'Content-Type': 'application/json', **tokens.headers(user_id)},
+                method=method,
+            )
+            start = time.perf_counter()
+            try:
+                with urlopen(request, timeout=30) as response:
+                    response.read()
+            except HTTPError as exc:
+                if exc.code >= 500:
+                    errors.append(exc.code)
+                    continue
+            except URLError as exc:
+                errors.append(exc)
+                continue
+            samples.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    counts = [h for (metric, _, _), h in metrics.registry.histograms.items() if metric == 'queries']
+    requests = sum(h.count for h in counts)
+    return {
+        'throughput': len(samples) / elapsed,
+        'samples': samples,
+        'errors': len(errors),
+        'queries': sum(h.total for h in counts) / requests if requests else None,
+    }
+
+
+def row(scenario, driver, result, budget=None):
+    samples = result['samples']
+
+    def ms(pct):
+        return f'{percentile(samples, pct) * 1000:.2f}' if samples else '-'
+
+    queries = result['queries']
+    return [
+        scenario, driver, f"{result['throughput']:.1f}", ms(50), ms(95), ms(99), result['errors'],
+        '-' if queries is None else (queries if isinstance(queries, int) else f'{queries:.1f}'),
+        '-' if budget is None else budget,
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts-per-user', type=int, default=5)
+    parser.add_argument('--follows-per-user', type=int, default=20, help='Average out-degree.')
+    parser.add_argument('--degree', choices=seeding.DEGREES, default='zipf', help='Follow-degree distribution.')
+    parser.add_argument('--likes-per-post', type=float, default=3, help='Average.')
+    parser.add_argument('--comments-per-post', type=float, default=5, help='Average.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the graph.')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--seconds', type=float, default=3.0, help='Time spent per scenario and driver.')
+    parser.add_argument('--threads', type=int, default=8, help='HTTP load generator threads (0 to skip).')
+    budget_options = parser.add_mutually_exclusive_group()
+    budget_options.add_argument('--check', action='store_true', help='Fail if a query budget is exceeded.')
+    budget_options.add_argument('--record', action='store_true', help='Save the query counts as budgets.')
+    args = parser.parse_args()
+
+    # Server errors are counted, not logged.
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    with open(QUERY_BUDGETS) as f:
+        budgets = json.load(f)
+
+    rows, measured = [], {}
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            # A file rather than shared memory, so the server threads can write
+            # concurrently.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        with test_database():
+            started = time.perf_counter()
+            graph = seeding.seed(
+                users=args.users, posts_per_user=args.posts_per_user,
+                follows_per_user=args.follows_per_user, degree=args.degree,
+                likes_per_post=args.likes_per_post, comments_per_post=args.comments_per_post,
+                seed=args.seed, password=PASSWORD, timelines=True,
+            )
+            print(
+                f'Seeded {len(graph.user_ids)} users and {len(graph.post_ids)} posts '
+                f'in {time.perf_counter() - started:.1f}s'
+            )
+            print()
+            tokens = Tokens()
+
+            for name in args.scenarios:
+                result = run_test_client(SCENARIOS[name](graph, random.Random(0)), tokens, args.seconds)
+                measured[name] = result['queries']
+                rows.append(row(name, 'test client', result, budgets.get(name)))
+
+            if args.threads:
+                server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+                server.set_app(get_wsgi_application())
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                base_url = f'http://127.0.0.1:{server.server_address[1]}'
+                connection.close()
+                try:
+                    with override_settings(METRICS_ENABLED=True, METRICS_SAMPLE_RATE=1.0):
+                        for name in args.scenarios:
+                            result = run_http(
+                                base_url, SCENARIOS[name], graph, tokens, args.threads, args.seconds
+                            )
+                            rows.append(row(name, f'http x{args.threads}', result))
+                finally:
+                    server.shutdown()
+                    server.server_close()
+
+    print(f'Endpoints, {args.degree} graph')
+    print_table(
+        ['scenario', 'driver', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors', 'queries', 'budget'],
+        rows,
+    )
+
+    if args.record:
+        budgets.update(measured)
+        with open(QUERY_BUDGETS, 'w') as f:
+            json.dump(budgets, f, indent=4, sort_keys=True)
+            f.write('\n')
+        print(f'\nRecorded query budgets in {QUERY_BUDGETS}.')
+    elif args.check:
+        over = [
+            f'{name}: {queries} queries per request, budget {budgets[name]}'
+            for name, queries in measured.items()
+            if name in budgets and queries > budgets[name]
+        ]
+        if over:
+            print('\nOver query budget:\n  ' + '\n  '.join(over))
+            sys.exit(1)
+        print('\nAll scenarios within their query budgets.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Login throughput per core, before and after the tunable hasher profiles and
+the repeat-login token cache.
+
+    python -m benchmarks.login [--seconds 3]
+
+Everything runs on one thread, so requests/s is the throughput of one core.
+Profiles whose optional dependency (argon2-cffi, bcrypt) is missing are
+skipped.
+"""
+import argparse
+
+from benchmarks import UNTHROTTLED, percentile, print_table, run_for, setup, test_database
+
+setup(**UNTHROTTLED)
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.utils.module_loading import import_string  # noqa: E402
+
+from api.models import User  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+
+def available_profiles():
+    for profile, path in settings.PASSWORD_HASHER_PROFILES.items():
+        hasher = import_string(path)()
+        if getattr(hasher, 'library', None):
+            try:
+                hasher._load_library()
+            except ValueError:
+                print(f'Skipping {profile}: {hasher.library} is not installed.')
+                continue
+        yield profile, path
+
+
+def hasher_settings(path):
+    return [path] + [p for p in settings.PASSWORD_HASHERS if p != path]
+
+
+def login_scenario(name, path, token_cache_ttl, seconds):
+    with override_settings(PASSWORD_HASHERS=hasher_settings(path), LOGIN_TOKEN_CACHE_TTL=token_cache_ttl):
+        cache.clear()
+        user = User.objects.create(
+            username=f'bench-{name}', email=f'{name}@bench.local', password=make_password(PASSWORD)
+        )
+        client = Client()
+        payload = {'username': user.username, 'password': PASSWORD}
+
+        def login():
+            response = client.post('/api/auth/login/', payload, content_type='application/json')
+            assert response.status_code == 200, response.content
+
+        login()  # warm up (and populate the token cache when enabled)
+        samples = run_for(login, seconds)
+    return [
+        name,
+        f'{len(samples) / sum(samples):.1f}',
+        f'{percentile(samples, 50) * 1000:.2f}',
+        f'{percentile(samples, 99) * 1000:.2f}',
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=3.0, help='Time spent on each scenario.')
+    args = parser.parse_args()
+
+    profiles = list(available_profiles())
+
+    print('Password verification (one core)')
+    rows = []
+    for profile, path in profiles:
+        hasher = import_string(path)()
+        encoded = hasher.encode(PASSWORD, hasher.salt())
+        samples = run_for(lambda: hasher.verify(PASSWORD, encoded), args.seconds)
+        rows.append([profile, f'{len(samples) / sum(samples):.1f}', f'{percentile(samples, 50) * 1000:.2f}'])
+    print_table(['profile', 'verifications/s', 'p50 ms'], rows)
+    print()
+
+    print('POST /api/auth/login/ (one core)')
+    with test_database():
+        default_path = settings.PASSWORD_HASHER_PROFILES['pbkdf2']
+        rows = [login_scenario('before: pbkdf2, no token cache', default_path, 0, args.seconds)]
+        for profile, path in profiles:
+            if profile != 'pbkdf2':
+                rows.append(login_scenario(f'{profile}, no token cache', path, 0, args.seconds))
+        rows.append(login_scenario('repeat login, token cache hit', default_path, 60, args.seconds))
+    print_table(['scenario', 'logins/s', 'p50 ms', 'p99 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Size and JSON encoding time of a feed page in each response shape.
+
+    python -m benchmarks.payloads [--users 300] [--page-size 100] [--seconds 2]
+
+Shapes are the default nested posts, ``?mode=normalized`` and a few
+``?fields=`` selections, each with and without ``?preview_comments=3``. For
+every shape the report gives the body size, the time to encode the page's
+data with the JSON renderer and the whole request through the test client,
+for random readers over a graph from api.seeding.
+"""
+import argparse
+import random
+
+from benchmarks import UNTHROTTLED, percentile, print_table, run_for, setup, test_database
+
+setup(**UNTHROTTLED)
+
+from django.test import Client  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from api import seeding  # noqa: E402
+from api.models import User  # noqa: E402
+
+SHAPES = {
+    'nested': '',
+    'normalized': 'mode=normalized',
+    'fields': 'fields=user,content,created_at,likes_count,comments_count&mode=normalized',
+    'fields, no user': 'fields=content,created_at,likes_count,comments_count',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=2.0, help='Time spent per shape.')
+    args = parser.parse_args()
+
+    rows = []
+    with test_database():
+        graph = seeding.seed(users=args.users, follows_per_user=50, timelines=True)
+        clients = [
+            Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            for user in User.objects.filter(pk__in=list(graph.user_ids))[:20]
+        ]
+        renderer = JSONRenderer()
+        for previews in (0, 3):
+            for name, query in SHAPES.items():
+                params = [f'page_size={args.page_size}', query]
+                if previews:
+                    params.append(f'preview_comments={previews}')
+                url = '/api/posts/?' + '&'.join(param for param in params if param)
+                rng = random.Random(0)
+                pages = [client.get(url) for client in clients]
+                encode = run_for(lambda: renderer.render(rng.choice(pages).data), args.seconds)
+                request = run_for(lambda: rng.choice(clients).get(url), args.seconds)
+                sizes = sorted(len(page.content) for page in pages)
+                rows.append([
+                    name, previews, f'{sizes[len(sizes) // 2] / 1024:.1f}',
+                    f'{percentile(encode, 50) * 1000:.2f}', f'{percentile(request, 50) * 1000:.1f}',
+                ])
+
+    print(f'Feed pages of up to {args.page_size} posts')
+    print_table(['shape', 'previews', 'KiB p50', 'encode p50 ms', 'request p50 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
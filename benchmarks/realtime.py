@@ -0,0 +1,136 @@
+"""
+Idle WebSocket connections held by one worker, and how long an event takes to
+reach all of them.
+
+    python -m benchmarks.realtime [--connections 10000] [--events 20]
+
+The connections are driven in-process through api.realtime's ASGI
+application, without a server, so the memory reported is the application's
+share per connection: an ASGI server adds its own socket and protocol state.
+Every connection belongs to a reader following the same author; an event
+published to that author is counted as delivered once every connection has
+handed it to ``send``.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+
+from benchmarks import percentile, print_table, setup, test_database
+
+setup()
+
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from api import realtime  # noqa: E402
+from api.models import Follow, User  # noqa: E402
+
+
+class Connection:
+    """The server side of a client that connects and then stays idle."""
+
+    def __init__(self, loop, counts):
+        self.connected = False
+        self.closed = loop.create_future()
+        self.counts = counts
+
+    async def receive(self):
+        if not self.connected:
+            self.connected = True
+            return {'type': 'websocket.connect'}
+        await self.closed
+        return {'type': 'websocket.disconnect', 'code': 1000}
+
+    async def send(self, message):
+        self.counts[message['type']] = self.counts.get(message['type'], 0) + 1
+        if self.counts[message['type']] == self.counts['target']:
+            self.counts['done'].set()
+
+
+async def wait_for(counts, kind, target):
+    counts['target'] = target
+    counts['done'] = asyncio.Event()
+    if counts.get(kind, 0) < target:
+        await counts['done'].wait()
+
+
+async def run(args, token, author_id):
+    loop = asyncio.get_running_loop()
+    counts = {}
+    scope = {
+        'type': 'websocket', 'path': realtime.PATH,
+        'query_string': f'token={token}'.encode(), 'headers': [],
+    }
+    connections, tasks = [], []
+
+    async def connect(count):
+        for _ in range(count):
+            connection = Connection(loop, counts)
+            connections.append(connection)
+            tasks.append(loop.create_task(
+                realtime.websocket_application(scope, connection.receive, connection.send)
+            ))
+        await wait_for(counts, 'websocket.accept', len(connections))
+        # Let every connection settle into its idle wait.
+        await asyncio.sleep(0.1)
+
+    # Memory is traced on a sample only: tracing slows everything down.
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    await connect(args.sample)
+    gc.collect()
+    per_connection = (tracemalloc.get_traced_memory()[0] - before) / args.sample
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    await connect(args.connections - args.sample)
+    connect_seconds = time.perf_counter() - started
+
+    broker = realtime.get_broker()
+    message = json.dumps({'type': 'post', 'post': {'id': 1, 'content': 'x' * 200}})
+    samples = []
+    for sent in range(1, args.events + 1):
+        started = time.perf_counter()
+        broker.publish(f'author:{author_id}', message)
+        await wait_for(counts, 'websocket.send', sent * len(connections))
+        samples.append(time.perf_counter() - started)
+
+    for connection in connections:
+        connection.closed.set_result(None)
+    await asyncio.gather(*tasks)
+    return connect_seconds, per_connection, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, default=10000)
+    parser.add_argument('--events', type=int, default=20, help='Events pushed to every connection.')
+    parser.add_argument('--sample', type=int, default=1000, help='Connections whose memory is traced.')
+    args = parser.parse_args()
+    args.sample = min(args.sample, args.connections - 1)
+
+    with test_database():
+        author = User.objects.create(username='author', email='author@example.com')
+        reader = User.objects.create(username='reader', email='reader@example.com')
+        Follow.objects.create(follower=reader, following=author)
+        token = str(AccessToken.for_user(reader))
+        connect_seconds, per_connection, samples = asyncio.run(run(args, token, author.pk))
+
+    print(f'{args.connections} idle connections, one worker')
+    print_table(
+        ['connects/s', 'KiB per connection', 'fan-out p50 ms', 'fan-out p95 ms', 'deliveries/s'],
+        [[
+            f'{(args.connections - args.sample) / connect_seconds:.0f}',
+            f'{per_connection / 1024:.1f}',
+            f'{percentile(samples, 50) * 1000:.1f}',
+            f'{percentile(samples, 95) * 1000:.1f}',
+            f'{args.connections * len(samples) / sum(samples):.0f}',
+        ]],
+    )
+
+
+if __name__ == '__main__':
+    main()
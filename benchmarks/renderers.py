@@ -0,0 +1,76 @@
+"""
+Render and parse throughput of DRF's JSON renderer and parser against
+api.fastjson's, on feed pages of 100 and 1000 posts.
+
+    python -m benchmarks.renderers [--sizes 100 1000] [--seconds 1]
+
+Payloads are real serializer output for posts from api.seeding: nested
+(the default response), normalized (``?mode=normalized``) and raw rows with
+datetime objects, as ``values()`` returns them, which DRF's encoder converts
+one by one in Python and orjson writes natively.
+"""
+import argparse
+import io
+
+from benchmarks import percentile, print_table, run_for, setup, test_database
+
+setup()
+
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api import fastjson, fieldsets, seeding  # noqa: E402
+from api.models import Post  # noqa: E402
+from api.serializers import PostSerializer  # noqa: E402
+
+NEXT = 'http://localhost/api/posts/?cursor=WyIyMDI2LTEwLTE4VDA3OjUzOjI2LjU4NTI3N1oiLDEyMzRd'
+
+
+def payloads(size):
+    posts = list(Post.objects.select_related('user').order_by('-created_at', '-id')[:size])
+    nested = PostSerializer(posts, many=True).data
+    results, users = fieldsets.normalize(nested)
+    rows = list(Post.objects.order_by('-created_at', '-id').values(
+        'id', 'user_id', 'content', 'created_at', 'updated_at', 'likes_count', 'comments_count'
+    )[:size])
+    return {
+        'nested': {'next': NEXT, 'results': nested},
+        'normalized': {'next': NEXT, 'results': results, 'users': users},
+        'values() rows': {'next': NEXT, 'results': rows},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000], help='Posts per payload.')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time spent per measurement.')
+    args = parser.parse_args()
+    if fastjson.orjson is None:
+        parser.error('orjson is not installed; api.fastjson would only measure DRF against itself.')
+
+    renderers = {'drf': JSONRenderer(), 'fastjson': fastjson.FastJSONRenderer()}
+    parsers = {'drf': JSONParser(), 'fastjson': fastjson.FastJSONParser()}
+    rows = []
+    with test_database():
+        seeding.seed(users=max(args.sizes) // 5 + 1, posts_per_user=5)
+        for size in args.sizes:
+            for shape, data in payloads(size).items():
+                body = JSONRenderer().render(data)
+                baseline = None
+                for name in renderers:
+                    render = run_for(lambda: renderers[name].render(data), args.seconds)
+                    parse = run_for(lambda: parsers[name].parse(io.BytesIO(body)), args.seconds)
+                    render_ms, parse_ms = percentile(render, 50) * 1000, percentile(parse, 50) * 1000
+                    baseline = baseline or render_ms
+                    rows.append([
+                        size, shape, name, f'{len(body) / 1024:.0f}', f'{render_ms:.2f}',
+                        f'{1000 / render_ms:.0f}', f'{baseline / render_ms:.1f}x', f'{parse_ms:.2f}',
+                    ])
+
+    print_table(
+        ['posts', 'payload', 'renderer', 'KiB', 'render p50 ms', 'renders/s', 'speed-up', 'parse p50 ms'], rows
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Per-object cost of the ModelSerializers against the row serializers of
+api/fastserializers.py.
+
+    python -m benchmarks.serializers [--objects 1000] [--seconds 1]
+
+For posts (with their nested author), comments and users, reports the time
+per object to serialize already loaded objects, and to load and serialize
+them (model instances from a select_related() query for the serializers,
+``values()`` rows for the row serializers). Posts are rendered through the
+representation cache both cold (cleared before each run) and warm.
+"""
+import argparse
+
+from benchmarks import percentile, print_table, run_for, setup, test_database
+
+setup()
+
+from api import fastserializers, seeding  # noqa: E402
+from api.cache import get_cache  # noqa: E402
+from api.models import Comment, Post, User  # noqa: E402
+from api.serializers import CommentSerializer, PostSerializer, UserSerializer  # noqa: E402
+
+
+def cases(count):
+    posts = Post.objects.select_related('user').order_by('-created_at', '-id')[:count]
+    comments = Comment.objects.select_related('user').order_by('created_at', 'id')[:count]
+    users = User.objects.order_by('id')[:count]
+
+    def cold(serialize):
+        def run(objects):
+            get_cache().clear()
+            return serialize(objects)
+        return run
+
+    post_serializer = lambda objects: PostSerializer(objects, many=True).data  # noqa: E731
+    return [
+        ('post', 'serializer, cold cache', posts, cold(post_serializer)),
+        ('post', 'serializer, warm cache', posts, post_serializer),
+        ('post', 'rows', fastserializers.post_rows(posts), fastserializers.render_posts),
+        ('comment', 'serializer', comments, lambda objects: CommentSerializer(objects, many=True).data),
+        ('comment', 'rows', fastserializers.comment_rows(comments), fastserializers.render_comments),
+        ('user', 'serializer, cold cache', users, cold(lambda objects: UserSerializer(objects, many=True).data)),
+        ('user', 'rows', fastserializers.user_rows(users), fastserializers.render_users),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--objects', type=int, default=1000, help='Objects serialized per run.')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time spent per measurement.')
+    args = parser.parse_args()
+
+    rows = []
+    with test_database():
+        seeding.seed(users=max(args.objects // 5, 1) + 1, posts_per_user=5, comments_per_post=2)
+        for kind, path, queryset, serialize in cases(args.objects):
+            loaded = list(queryset)
+            serialize(loaded)
+            count = len(loaded)
+            render = run_for(lambda: serialize(loaded), args.seconds)
+            total = run_for(lambda: serialize(list(queryset.all())), args.seconds)
+            rows.append([
+                kind, path, count,
+                f'{percentile(render, 50) / count * 1e6:.2f}', f'{percentile(total, 50) / count * 1e6:.2f}',
+            ])
+
+    print_table(['object', 'path', 'objects', 'serialize µs/object', 'load + serialize µs/object'], rows)
+
+
+if __name__ == '__main__':
+    main()
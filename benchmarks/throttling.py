@@ -0,0 +1,146 @@
+"""
+Overhead of the request throttles of api/throttling.py.
+
+    python -m benchmarks.throttling [--threads 8] [--seconds 1]
+
+Compares the token bucket (api/buckets.py, one cache operation per check) on
+the locmem and file caches with the sliding-window counter the login
+throttles use (two), reporting:
+
+* the median time per check, from one thread;
+* checks per second with `--threads` threads hitting the same key;
+* how many of those racing checks got through a budget of 1000, which more
+  than 1000 would mean two requests spent the same token;
+* the median time of ``GET /api/posts/<id>/`` with and without throttling.
+"""
+import argparse
+import contextlib
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from benchmarks import UNTHROTTLED, percentile, print_table, run_for, setup, test_database
+
+setup(**UNTHROTTLED)
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+from rest_framework.views import APIView  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from api import seeding  # noqa: E402
+from api.models import Post, User  # noqa: E402
+from api.throttling import ScopedRateThrottle, SlidingWindowRateThrottle  # noqa: E402
+
+BUDGET = 1000
+
+
+class SlidingWindowThrottle(SlidingWindowRateThrottle):
+    rate = UNTHROTTLED['READ_RATE']
+
+    def get_cache_key(self, request, view):
+        return 'benchmark'
+
+
+class View:
+    throttle_scope = 'read'
+
+
+def with_buckets(backend, location):
+    return {
+        **settings.CACHES,
+        settings.THROTTLE_CACHE_ALIAS: {'BACKEND': backend, 'LOCATION': location},
+    }
+
+
+def race(check, threads):
+    """Run `check` BUDGET * 2 times from `threads` threads; return (checks/s, admitted)."""
+    admitted = []
+
+    def worker():
+        admitted.extend(check() for _ in range(BUDGET * 2 // threads))
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return len(admitted) / (time.perf_counter() - start), sum(admitted)
+
+
+def cases(location):
+    """(throttle, cache, CACHES, check, patch lowering the rate to BUDGET a day)."""
+    request = Request(APIRequestFactory().get('/api/posts/'))
+    request.user = User(pk=1, username='benchmark')
+    view = View()
+    scoped = ScopedRateThrottle()
+    budget = f'{BUDGET}/day'
+    return [
+        (
+            'sliding window', 'locmem', settings.CACHES,
+            lambda: SlidingWindowThrottle().allow_request(request, view),
+            mock.patch.object(SlidingWindowThrottle, 'rate', budget),
+        ),
+        *(
+            (
+                'token bucket', name, with_buckets(backend, location),
+                lambda: scoped.allow_request(request, view),
+                mock.patch.dict(ScopedRateThrottle.THROTTLE_RATES, {'read': budget}),
+            )
+            for name, backend in (
+                ('locmem', 'api.buckets.TokenBucketLocMemCache'),
+                ('file', 'api.buckets.TokenBucketFileBasedCache'),
+            )
+        ),
+    ]
+
+
+def request_latency(seconds):
+    user = User.objects.first()
+    post = Post.objects.first()
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    url = f'/api/posts/{post.pk}/'
+    rows = []
+    for label, patch in (
+        ('throttled', contextlib.nullcontext()),
+        ('unthrottled', mock.patch.object(APIView, 'throttle_classes', [])),
+    ):
+        with patch:
+            client.get(url)
+            rows.append([label, f'{percentile(run_for(lambda: client.get(url), seconds), 50) * 1000:.3f}'])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8, help='Threads racing for one key.')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time spent per measurement.')
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as location:
+        for name, cache, configured, check, budget in cases(location):
+            with override_settings(CACHES=configured):
+                per_check = percentile(run_for(check, args.seconds), 50)
+                with budget:
+                    for alias in ('default', settings.THROTTLE_CACHE_ALIAS):
+                        caches[alias].clear()
+                    throughput, admitted = race(check, args.threads)
+                rows.append([
+                    name, cache, f'{per_check * 1e6:.1f}', f'{throughput:.0f}', f'{admitted}/{BUDGET}',
+                ])
+    print_table(['throttle', 'cache', 'µs/check', f'checks/s x{args.threads}', 'admitted'], rows)
+
+    print()
+    with test_database():
+        seeding.seed(users=10, posts_per_user=2)
+        print_table(['GET /api/posts/<id>/', 'p50 ms'], request_latency(args.seconds))
+
+
+if __name__ == '__main__':
+    main()